@@ -16,17 +16,33 @@ USER SETUP:
    export it as an environment variable OPENAI_API_KEY.
 2. Run the file.  Each iteration's output + scores are saved
    in /mtfc_iterations/iteration_N.json.
+3. Optional: export MTFC_LOCAL_SCORING=1 to score scripts locally
+   with embeddings instead of asking the model to grade itself.
 
 ===========================================================
 """
 
 import os
 import json
+import asyncio
 import time
 import re
+import atexit
+import hashlib
+import pickle
+import shelve
 from pathlib import Path
-from openai import OpenAI
+import numpy as np
+from openai import AsyncOpenAI, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
+from src import llm_cache
+from src.semantic_cache import make_semantic_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed, fall back to stdlib json
 
 # Load environment variables
 load_dotenv()
@@ -38,7 +54,7 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 if not API_KEY:
     raise ValueError("OPENAI_API_KEY not found. Please set it in .env file or as environment variable.")
 
-client = OpenAI(api_key=API_KEY)
+client = AsyncOpenAI(api_key=API_KEY)
 
 # -----------------------------------------------
 # 🗂  FILE STORAGE SETUP
@@ -46,6 +62,20 @@ client = OpenAI(api_key=API_KEY)
 SAVE_DIR = Path("mtfc_iterations")
 SAVE_DIR.mkdir(exist_ok=True)
 
+
+def to_json(obj, indent=False):
+    """Serialize obj; compact unless indent is requested for human-read files"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def write_json(path, obj, indent=False):
+    """Write obj to path as UTF-8 JSON"""
+    Path(path).write_text(to_json(obj, indent), encoding="utf-8")
+
 # -----------------------------------------------
 # 📊  RUBRIC DEFINITION
 # -----------------------------------------------
@@ -104,37 +134,231 @@ Communication & Clarity: [0-100]
 WEIGHTED TOTAL: [0-100]
 """
 
+# Invariant instructions shared by every iteration prompt. Sent as a second
+# system message so the whole prefix stays identical across calls and is
+# eligible for OpenAI's automatic prompt caching.
+_STATIC_FORMAT_INSTRUCTIONS = """
+After generating (or revising) the script, evaluate it using the rubric and provide scores at the end in the format:
+SCORES:
+Project Definition: [score]
+Data Identification & Assessment: [score]
+Mathematical Modeling: [score]
+Risk Analysis: [score]
+Recommendations: [score]
+Communication & Clarity: [score]
+WEIGHTED TOTAL: [score]
+"""
+
+# With MTFC_LOCAL_SCORING=1 the model only writes the script and scoring is
+# done locally (see local_score()), which cuts the self-evaluation tokens
+LOCAL_SCORING = os.getenv("MTFC_LOCAL_SCORING") == "1"
+_GENERATION_ONLY_INSTRUCTIONS = """
+Output only the actuarial script. Do not evaluate it, score it, or append a SCORES block.
+"""
+FORMAT_INSTRUCTIONS = _GENERATION_ONLY_INSTRUCTIONS if LOCAL_SCORING else _STATIC_FORMAT_INSTRUCTIONS
+
+# -----------------------------------------------
+# 🧠  PROMPT CACHES
+# -----------------------------------------------
+_disk_cache = shelve.open(str(SAVE_DIR / "exact_cache.db"))
+atexit.register(_disk_cache.close)
+
+
+def _cache_key(prompt, model, temperature, n):
+    """SHA-256 key for the exact-match cache"""
+    raw = "\x1f".join((SYSTEM_PROMPT, FORMAT_INSTRUCTIONS, prompt, model, str(temperature), str(n)))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+CACHE_MAX_SIZE = int(os.getenv("MTFC_CACHE_MAX_SIZE", "200"))
+
+# Feedback prompts that differ only in their scores or figures embed within
+# about 0.9 of each other, so a hit must be closer than that
+SEMANTIC_THRESHOLD = 0.97
+_semantic_caches = {}
+
+
+def _semantic_cache(model, temperature, n):
+    """Semantic cache shared only by requests that match on everything but the prompt text"""
+    raw = "\x1f".join((SYSTEM_PROMPT, FORMAT_INSTRUCTIONS, model, str(temperature), str(n)))
+    namespace = hashlib.sha256(raw.encode()).hexdigest()[:16]
+    if namespace not in _semantic_caches:
+        _semantic_caches[namespace] = make_semantic_cache(
+            SAVE_DIR / f"prompt_cache_{namespace}.pkl",
+            maxsize=CACHE_MAX_SIZE,
+            threshold=SEMANTIC_THRESHOLD
+        )
+    return _semantic_caches[namespace]
+
+
+async def embed(text):
+    """Embed text for semantic cache lookups"""
+    result = await client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return result.data[0].embedding
+
 # -----------------------------------------------
 # ⚙️  ITERATIVE LOOP
 # -----------------------------------------------
-def chat(prompt, model="gpt-4-turbo"):
-    """Helper for API call using OpenAI client"""
+# Cheap drafting model for routine iterations; the full model is reserved
+# for final polish once the score is close or the iteration budget runs out
+DRAFT_MODEL = "gpt-4o-mini"
+POLISH_MODEL = "gpt-4-turbo"
+POLISH_SCORE_THRESHOLD = 90
+
+# Samples requested per iteration (n=); the best-scoring variant wins
+SPECULATIVE_VARIANTS = 3
+
+# Streaming stops once every variant has emitted a complete WEIGHTED TOTAL;
+# the check runs every STREAM_CHECK_INTERVAL chunks
+STREAM_CHECK_INTERVAL = 20
+_STREAM_DONE_RE = re.compile(r"WEIGHTED TOTAL\s*:?\s*\d+(?:\.\d+)?\.?[^\d.]", re.IGNORECASE)
+
+
+def _has_weighted_total(text):
+    """True once text contains a fully streamed WEIGHTED TOTAL line"""
+    return "WEIGHTED TOTAL" in text.upper() and _STREAM_DONE_RE.search(text) is not None
+
+
+def _select_model(overall, iteration, max_iterations):
+    """Pick the drafting or polishing model for this iteration"""
+    if overall >= POLISH_SCORE_THRESHOLD or iteration >= max_iterations - 1:
+        return POLISH_MODEL
+    return DRAFT_MODEL
+
+
+@retry(
+    stop=stop_after_attempt(6),
+    wait=wait_random_exponential(min=1, max=60),
+    retry=retry_if_exception_type((RateLimitError, APITimeoutError, InternalServerError)),
+    reraise=True,
+)
+async def chat(prompt, model=POLISH_MODEL, temperature=0.6, n=1):
+    """Helper for API call using OpenAI client; returns n sampled responses"""
+    key = _cache_key(prompt, model, temperature, n)
+    if key in _disk_cache:
+        print("  (exact cache hit)")
+        return _disk_cache[key]
+
+    # Opt-in (MTFC_SEMANTIC_CACHE=1), as elsewhere: each lookup costs an embeddings request
+    embedding = None
+    semantic_cache = _semantic_cache(model, temperature, n)
+    if llm_cache.semantic_enabled():
+        try:
+            embedding = await embed(prompt)
+        except Exception as e:
+            print(f"  ⚠️ Embedding failed, skipping semantic cache: {e}")
+        else:
+            cached = semantic_cache.lookup(embedding)
+            if cached is not None:
+                print("  (semantic cache hit)")
+                return cached
+
     try:
-        completion = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "system", "content": FORMAT_INSTRUCTIONS},
                 {"role": "user", "content": prompt},
             ],
-            temperature=0.6,
+            temperature=temperature,
             max_tokens=4000,
+            n=n,
+            stream=True,
         )
-        return completion.choices[0].message.content
+        contents = [""] * n
+        chunks = 0
+        async for chunk in stream:
+            for choice in chunk.choices:
+                contents[choice.index] += choice.delta.content or ""
+            chunks += 1
+            if chunks % STREAM_CHECK_INTERVAL == 0 and all(map(_has_weighted_total, contents)):
+                # Only the scores block is parsed; drop the trailing tokens
+                await stream.close()
+                break
+        _disk_cache[key] = contents
+        if embedding is not None:
+            semantic_cache.add(key, embedding, contents)
+        return contents
     except Exception as e:
         print(f"Error in API call: {e}")
         raise
 
+# First word of a matched category spelling (lowercase) -> RUBRIC key. The
+# free-form tails on "data identification" and "communication" absorb the
+# "&"/"and" spellings.
+_CATEGORY_BY_FIRST_WORD = {
+    "project": "Project Definition",
+    "data": "Data Identification & Assessment",
+    "mathematical": "Mathematical Modeling",
+    "risk": "Risk Analysis",
+    "recommendations": "Recommendations",
+    "communication": "Communication & Clarity",
+}
+_CATEGORY_ALTERNATION = (
+    r"project definition|data identification[^:=\-\d\n]*|mathematical modeling"
+    r"|risk analysis|recommendations|communication[^:=\-\d\n]*"
+)
+
+# Compiled once at import instead of on every extract_scores() call
+_UNIFIED_SCORE_RE = re.compile(
+    rf"(?P<key>{_CATEGORY_ALTERNATION})\s*[:=\-]?\s*(?P<val>\d+(?:\.\d+)?)",  # "Category: 85"
+    re.IGNORECASE
+)
+_UNIFIED_REVERSE_SCORE_RE = re.compile(
+    rf"(?P<val>\d+(?:\.\d+)?)\s*:?\s*(?P<key>{_CATEGORY_ALTERNATION})",  # "85: Category"
+    re.IGNORECASE
+)
+_SCORES_SECTION_RE = re.compile(
+    r'(?:SCORES?|RUBRIC SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|OVERALL|TOTAL|$)',
+    re.IGNORECASE | re.DOTALL
+)
+_TOTAL_RES = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)',
+        r'OVERALL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'TOTAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'FINAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'WEIGHTED\s*:?\s*(\d+(?:\.\d+)?)',
+    )
+]
+
+
+def _canonical_category(text):
+    """Map a matched category spelling to its RUBRIC key"""
+    return _CATEGORY_BY_FIRST_WORD.get(text.split(None, 1)[0].lower())
+
+
+def _scan(pattern, text, scores):
+    """Fill scores from pattern matches; the first in-range value per category wins"""
+    for match in pattern.finditer(text):
+        key = _canonical_category(match.group("key"))
+        if key in scores:
+            continue
+        val = float(match.group("val"))
+        # Only accept reasonable scores
+        if 0 <= val <= 100:
+            scores[key] = val
+    return scores
+
+
+def _forward_scan(text):
+    """Scores written in the prescribed "Category: 85" order"""
+    return _scan(_UNIFIED_SCORE_RE, text, {})
+
+
+def _reverse_scan(text, scores):
+    """Fallback for the rare "85: Category" order; only fills missing categories"""
+    return _scan(_UNIFIED_REVERSE_SCORE_RE, text, scores)
+
+
 def extract_scores(response):
     """Pull numeric rubric scores from model output"""
-    scores = {}
     total = 0
     
     # Try to find scores section - look for "SCORES" or "SCORE" header
-    scores_section_match = re.search(
-        r'(?:SCORES?|RUBRIC SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|OVERALL|TOTAL|$)', 
-        response, 
-        re.IGNORECASE | re.DOTALL
-    )
+    scores_section_match = _SCORES_SECTION_RE.search(response)
     
     if scores_section_match:
         score_text = scores_section_match.group(1)
@@ -142,51 +366,15 @@ def extract_scores(response):
         # If no scores section found, search entire response
         score_text = response
     
-    # Extract scores for each rubric category
-    for key in RUBRIC.keys():
-        # Create flexible patterns - handle various formats
-        key_variations = [
-            key,  # Full key
-            key.lower(),  # Lowercase
-            key.replace(" & ", " and "),  # "and" instead of "&"
-            key.replace(" & ", " "),  # Without "&"
-        ]
-        
-        # Try different patterns for each variation
-        for key_var in key_variations:
-            patterns = [
-                rf"{re.escape(key_var)}\s*:?\s*(\d+(?:\.\d+)?)",  # "Category: 85"
-                rf"{re.escape(key_var)}\s*-\s*(\d+(?:\.\d+)?)",  # "Category - 85"
-                rf"{re.escape(key_var)}\s*=\s*(\d+(?:\.\d+)?)",  # "Category = 85"
-                rf"(\d+(?:\.\d+)?)\s*:?\s*{re.escape(key_var)}",  # "85: Category"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, score_text, re.IGNORECASE)
-                if match:
-                    try:
-                        val = float(match.group(1))
-                        # Only accept reasonable scores
-                        if 0 <= val <= 100:
-                            scores[key] = val
-                            break
-                    except (ValueError, IndexError):
-                        continue
-            
-            if key in scores:
-                break
+    # Extract scores for each rubric category; the reversed form is only
+    # scanned when the model did not follow the prescribed format
+    scores = _forward_scan(score_text)
+    if len(scores) < len(RUBRIC):
+        _reverse_scan(score_text, scores)
     
     # Extract weighted total - look for various formats
-    total_patterns = [
-        r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)',
-        r'OVERALL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'TOTAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'FINAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'WEIGHTED\s*:?\s*(\d+(?:\.\d+)?)',
-    ]
-    
-    for pattern in total_patterns:
-        total_match = re.search(pattern, response, re.IGNORECASE)
+    for pattern in _TOTAL_RES:
+        total_match = pattern.search(response)
         if total_match:
             try:
                 total = float(total_match.group(1))
@@ -201,17 +389,88 @@ def extract_scores(response):
         if calculated_total > 0:
             total = calculated_total
     
-    # Fill in missing scores with 0 for display
-    for key in RUBRIC.keys():
-        if key not in scores:
-            scores[key] = 0
+    # Fill in missing scores with 0 for display, in rubric order
+    scores = {key: scores.get(key, 0) for key in RUBRIC}
     
     return scores, total
 
+# -----------------------------------------------
+# 🧪  LOCAL RUBRIC SCORING
+# -----------------------------------------------
+RUBRIC_DESCRIPTIONS = {
+    "Project Definition": "risk, who is at risk, mitigation strategies",
+    "Data Identification & Assessment": "data quality, visualization, reliability",
+    "Mathematical Modeling": "assumptions, model choice, expected value or probability methods",
+    "Risk Analysis": "quantification, likelihood × severity, comparisons",
+    "Recommendations": "cost-benefit, actionability, linkage to model",
+    "Communication & Clarity": "organization, visuals, tone",
+}
+
+# Cosine similarities in [SIM_FLOOR, SIM_CEILING] map linearly onto 0-100
+SIM_FLOOR = 0.20
+SIM_CEILING = 0.60
+# Share of each criterion score taken from the quantitative feature checks
+FEATURE_WEIGHT = 0.30
+QUANT_FEATURE_TERMS = (
+    "expected value", "variance", "probability", "npv", "irr",
+    "regression", "95th", "table", "formula", "assumption"
+)
+
+_SECTION_SPLIT_RE = re.compile(r"^(?=#{1,3}\s|Part \d+:|Step \d+)", re.MULTILINE)
+_CRITERION_EMBS_PATH = SAVE_DIR / "criterion_embeddings.pkl"
+_criterion_embs = None
+
+
+async def _criterion_embeddings():
+    """Rubric criterion embeddings, computed once and persisted to disk"""
+    global _criterion_embs
+    if _criterion_embs is None:
+        if _CRITERION_EMBS_PATH.exists():
+            with open(_CRITERION_EMBS_PATH, "rb") as f:
+                _criterion_embs = pickle.load(f)
+        else:
+            texts = [f"{k}: {v}" for k, v in RUBRIC_DESCRIPTIONS.items()]
+            result = await client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+            _criterion_embs = np.array([d.embedding for d in result.data], dtype=np.float32)
+            with open(_CRITERION_EMBS_PATH, "wb") as f:
+                pickle.dump(_criterion_embs, f)
+    return _criterion_embs
+
+
+async def local_score(script):
+    """Score a script against the rubric without asking the chat model"""
+    sections = [s for s in _SECTION_SPLIT_RE.split(script) if s.strip()] or [script]
+    criteria = await _criterion_embeddings()
+    result = await client.embeddings.create(model=EMBEDDING_MODEL, input=sections)
+    section_embs = np.array([d.embedding for d in result.data], dtype=np.float32)
+
+    # Best-matching section per criterion
+    sims = (criteria @ section_embs.T) / (
+        np.linalg.norm(criteria, axis=1)[:, None] * np.linalg.norm(section_embs, axis=1)[None, :]
+    )
+    sim_scores = np.clip((sims.max(axis=1) - SIM_FLOOR) / (SIM_CEILING - SIM_FLOOR), 0, 1) * 100
+
+    lower_script = script.lower()
+    feature_score = 100 * sum(term in lower_script for term in QUANT_FEATURE_TERMS) / len(QUANT_FEATURE_TERMS)
+
+    scores = {
+        key: round((1 - FEATURE_WEIGHT) * float(sim) + FEATURE_WEIGHT * feature_score, 2)
+        for key, sim in zip(RUBRIC_DESCRIPTIONS, sim_scores)
+    }
+    total = sum(scores[k] * RUBRIC[k] for k in RUBRIC)
+    return scores, total
+
+
+async def score_response(response):
+    """Score a response locally or from its own SCORES block"""
+    if LOCAL_SCORING:
+        return await local_score(response)
+    return extract_scores(response)
+
 # -----------------------------------------------
 # 🚀  MAIN ITERATION
 # -----------------------------------------------
-def main():
+async def main():
     iteration = 1
     overall = 0
     max_iterations = 15
@@ -225,20 +484,14 @@ Include:
 - Specific formulas (Expected Value, variance, etc.)
 - Clear reasoning and assumptions
 - Tables and quantitative examples
-- Professional actuarial communication style
-
-After generating the script, evaluate it using the rubric and provide scores at the end in the format:
-SCORES:
-Project Definition: [score]
-Data Identification & Assessment: [score]
-Mathematical Modeling: [score]
-Risk Analysis: [score]
-Recommendations: [score]
-Communication & Clarity: [score]
-WEIGHTED TOTAL: [score]"""
+- Professional actuarial communication style"""
 
     prompt = initial_prompt
-    all_iterations = []
+    # Full results are appended to a JSON-Lines trail as they arrive; only
+    # the per-iteration scores are kept in memory for the summary
+    iterations_meta = []
+    iterations_log_path = SAVE_DIR / "iterations.jsonl"
+    iterations_log = open(iterations_log_path, "a", buffering=1, encoding="utf-8")
 
     print("="*60)
     print("MODELING THE FUTURE CHALLENGE — AUTO ITERATION SYSTEM")
@@ -251,8 +504,17 @@ WEIGHTED TOTAL: [score]"""
         print(f"\n🌀 Iteration {iteration} started...\n")
         
         try:
-            response = chat(prompt)
-            scores, overall = extract_scores(response)
+            # Sample speculative variants in one request and keep the best one
+            model = _select_model(overall, iteration, max_iterations)
+            print(f"  Model: {model}")
+            responses = await chat(prompt, model=model, n=SPECULATIVE_VARIANTS)
+            scored = await asyncio.gather(*(score_response(r) for r in responses))
+            ranked = sorted(
+                zip(scored, responses),
+                key=lambda item: item[0][1],
+                reverse=True,
+            )
+            (scores, overall), response = ranked[0]
 
             result = {
                 "iteration": iteration,
@@ -262,12 +524,23 @@ WEIGHTED TOTAL: [score]"""
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             }
 
-            all_iterations.append(result)
+            iterations_log.write(to_json(result) + "\n")
+            iterations_meta.append({"iteration": iteration, "overall_score": overall, "scores": scores})
 
             # Save file
             file_path = SAVE_DIR / f"iteration_{iteration}.json"
-            with open(file_path, "w") as f:
-                json.dump(result, f, indent=2)
+            write_json(file_path, result)
+
+            # Keep the losing variants as speculative branches
+            for branch, ((branch_scores, branch_overall), branch_response) in enumerate(ranked[1:], 1):
+                branch_path = SAVE_DIR / f"iteration_{iteration}_branch_{branch}.json"
+                write_json(branch_path, {
+                    "iteration": iteration,
+                    "branch": branch,
+                    "script": branch_response,
+                    "scores": branch_scores,
+                    "overall_score": branch_overall,
+                })
 
             # Display progress
             print(f"\n{'='*60}")
@@ -300,9 +573,7 @@ Produce an improved version that:
 2. Maintains strengths from high-scoring areas
 3. Includes all 5 steps of the Actuarial Process
 4. Provides specific quantitative analysis, formulas, and examples
-5. Uses professional actuarial communication
-
-After generating the improved script, evaluate it and provide scores at the end."""
+5. Uses professional actuarial communication"""
             else:
                 feedback = f"""The script is close to the target. Refine it to reach ≥{target_score}.
 
@@ -312,35 +583,42 @@ Make final improvements to push the score above {target_score}:
 - Enhance quantitative rigor
 - Strengthen linkage between steps
 - Add more detailed analysis
-- Improve clarity and organization
-
-After generating the refined script, evaluate it and provide scores at the end."""
+- Improve clarity and organization"""
             
             prompt = feedback
             iteration += 1
-            time.sleep(2)  # Rate limiting
             
         except Exception as e:
             print(f"Error in iteration {iteration}: {e}")
             break
 
-    if overall < target_score:
+    iterations_log.close()
+
+    # Save summary; full history stays in the JSONL trail
+    if overall >= target_score:
+        summary = {
+            "final_score": overall,
+            "target_score": target_score,
+            "total_iterations": iteration,
+            "achieved_target": True,
+            "winning_iteration_file": str(file_path),
+            "iterations_log": str(iterations_log_path)
+        }
+    else:
         print(f"\n⚠️ Maximum iterations ({max_iterations}) reached without achieving {target_score}+.")
         print(f"Final score: {overall:.2f}/100")
         print(f"Last iteration saved to: {SAVE_DIR / f'iteration_{iteration-1}.json'}")
-    
-    # Save summary
-    summary = {
-        "final_score": overall,
-        "target_score": target_score,
-        "total_iterations": iteration - 1,
-        "achieved_target": overall >= target_score,
-        "iterations": all_iterations
-    }
+        summary = {
+            "final_score": overall,
+            "target_score": target_score,
+            "total_iterations": iteration - 1,
+            "achieved_target": False,
+            "iterations_meta": iterations_meta,
+            "iterations_log": str(iterations_log_path)
+        }
     
     summary_path = SAVE_DIR / "summary.json"
-    with open(summary_path, "w") as f:
-        json.dump(summary, f, indent=2)
+    write_json(summary_path, summary, indent=True)
     
     print(f"\nSummary saved to: {summary_path}")
     print("\n" + "="*60)
@@ -348,5 +626,5 @@ After generating the refined script, evaluate it and provide scores at the end."
     print("="*60)
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
 
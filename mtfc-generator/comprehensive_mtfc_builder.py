@@ -6,71 +6,904 @@ Generates detailed 30-item paper with 3,400+ words targeting ≥98/100
 
 import os
 import json
+import logging
+import re
 import time
+import hashlib
+import argparse
+import string
+import asyncio
+import httpx
 from pathlib import Path
-from openai import OpenAI
+from dataclasses import dataclass, fields
+from typing import List
+import numpy as np
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
+from src.batch import batch_generate
+from src.kernels import simulate_irrigation_npv
+from src.semantic_cache import make_semantic_cache
 
-load_dotenv()
+log = logging.getLogger(__name__)
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    print("❌ ERROR: OPENAI_API_KEY not found")
-    exit(1)
+try:
+    import aiofiles
+    import aiofiles.os
+except ImportError:
+    aiofiles = None
 
-client = OpenAI(api_key=API_KEY)
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # tiktoken not installed, prompt sizes are estimated from length
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # zstandard not installed, cached responses are stored as plain text
+
+_client = None
+
+def get_client():
+    """Return the shared AsyncOpenAI client, creating it on first use
+    
+    Reading .env and building the client are deferred to the first API call,
+    so importing this module needs neither OPENAI_API_KEY nor network setup.
+    """
+    global _client
+    if _client is None:
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            print("❌ ERROR: OPENAI_API_KEY not found")
+            exit(1)
+        # One pooled HTTP/2 connection is shared by every concurrent request,
+        # so the TLS handshake is paid once per run instead of once per call
+        http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        _client = AsyncOpenAI(api_key=api_key, http_client=http_client)
+    return _client
+
+# Cap in-flight requests to stay under the account's RPM limit
+MAX_CONCURRENT_REQUESTS = 5
+_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
 SAVE_DIR = Path("mtfc_comprehensive")
-SAVE_DIR.mkdir(exist_ok=True)
-
-# Scenario constants for consistency
-SCENARIO_DATA = {
-    "farmer": "Farmer Jones",
-    "location": "Iowa",
-    "acres": 500,
-    "crop": "corn",
-    "baseline_yield": 190,
-    "drought_yield": 130,
-    "normal_price": 5.20,
-    "planting_cost_per_acre": 740,
-    "seed_cost": 140,
-    "fertilizer_cost": 180,
-    "chemical_cost": 85,
-    "labor_cost": 60,
-    "machinery_cost": 95,
-    "land_rent": 180,
-    "irrigation_capex": 250000,
-    "irrigation_acres": 125,
-    "irrigation_yield_boost": 0.15,
-    "storage_capex": 180000,
-    "storage_capacity": 50000,
-    "storage_cost_per_bu_month": 0.05,
-    "shrink_rate_per_month": 0.005,
-    "insurance_premium_per_acre": 32,
-    "insurance_coverage": 0.80,
-    "drought_probability": 0.15,
-    "normal_probability": 0.85
+
+class _BlockingFile:
+    """Minimal async-style wrapper over a regular file, used without aiofiles"""
+
+    def __init__(self, path):
+        self._file = open(path, "w", encoding="utf-8")
+
+    async def write(self, text):
+        self._file.write(text)
+
+    async def close(self):
+        self._file.close()
+
+async def open_for_write(path):
+    """Open path for streaming text writes without blocking the event loop"""
+    if aiofiles is not None:
+        return await aiofiles.open(path, "w", encoding="utf-8")
+    return _BlockingFile(path)
+
+async def write_text(path, text):
+    """Write a whole file off the event loop"""
+    if aiofiles is not None:
+        async with aiofiles.open(path, "w", encoding="utf-8") as f:
+            await f.write(text)
+    else:
+        await asyncio.to_thread(Path(path).write_text, text, encoding="utf-8")
+
+async def read_bytes(path):
+    """Read a whole file as bytes off the event loop"""
+    if aiofiles is not None:
+        async with aiofiles.open(path, "rb") as f:
+            return await f.read()
+    return await asyncio.to_thread(Path(path).read_bytes)
+
+async def write_bytes(path, data):
+    """Write a whole file as bytes off the event loop"""
+    if aiofiles is not None:
+        async with aiofiles.open(path, "wb") as f:
+            await f.write(data)
+    else:
+        await asyncio.to_thread(Path(path).write_bytes, data)
+
+async def makedirs(path):
+    """Create a directory tree off the event loop"""
+    if aiofiles is not None:
+        await aiofiles.os.makedirs(path, exist_ok=True)
+    else:
+        await asyncio.to_thread(os.makedirs, path, exist_ok=True)
+
+class DiskCache:
+    """Exact-match response cache stored as one file per request
+    
+    Entries are zstd-compressed (.zst) when zstandard is installed and plain
+    text (.txt) otherwise; either kind is read back.
+    """
+
+    def __init__(self, directory, enabled=True, prefix=""):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self.prefix = prefix
+        # Mixed into every key (and names the semantic cache file) to keep
+        # otherwise identical requests apart
+        self.namespace = ""
+        # Responses are English prose, which zstd shrinks 3-5x
+        self._compressor = zstandard.ZstdCompressor(level=6) if zstandard else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def _path(self, model, max_tokens, request):
+        key = hashlib.sha256(
+            f"{self.prefix}|{self.namespace}|{model}|{max_tokens}|{request}".encode("utf-8")
+        ).hexdigest()
+        return self.directory / f"{key}.txt"
+
+    async def get(self, model, max_tokens, request):
+        if not self.enabled:
+            return None
+        path = self._path(model, max_tokens, request)
+        compressed = path.with_suffix(".zst")
+        if self._decompressor is not None and compressed.exists():
+            return self._decompressor.decompress(await read_bytes(compressed)).decode("utf-8")
+        if not path.exists():
+            return None
+        if aiofiles is not None:
+            async with aiofiles.open(path, "r", encoding="utf-8") as f:
+                return await f.read()
+        return await asyncio.to_thread(path.read_text, encoding="utf-8")
+
+    async def set(self, model, max_tokens, request, response):
+        if not self.enabled or response is None:
+            return
+        await makedirs(self.directory)
+        path = self._path(model, max_tokens, request)
+        if self._compressor is not None:
+            await write_bytes(path.with_suffix(".zst"), self._compressor.compress(response.encode("utf-8")))
+        else:
+            await write_text(path, response)
+
+    def clear(self):
+        """Delete every cached response, including the semantic cache files"""
+        if self.directory.exists():
+            for pattern in ("*.txt", "*.zst", "semantic_*"):
+                for path in self.directory.glob(pattern):
+                    path.unlink()
+        _semantic_caches.clear()
+
+# Near-duplicate prompts (e.g. after a small SCENARIO_DATA edit) reuse a cached
+# response when the embeddings' cosine distance is below 0.08
+SEMANTIC_CACHE_ENABLED = True
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_SIMILARITY_THRESHOLD = 0.92
+_semantic_caches = {}
+semantic_stats = {"lookups": 0, "hits": 0}
+
+def semantic_cache():
+    """Semantic cache for the current builder iteration (one file per namespace)
+    
+    Keyed by cache.prefix too, like the exact cache, so a scenario edit
+    starts a fresh file instead of matching sections written for old values.
+    """
+    namespace = "_".join(filter(None, (cache.prefix, cache.namespace or "default")))
+    if namespace not in _semantic_caches:
+        _semantic_caches[namespace] = make_semantic_cache(
+            cache.directory / f"semantic_{namespace}.pkl",
+            threshold=SEMANTIC_SIMILARITY_THRESHOLD,
+        )
+    return _semantic_caches[namespace]
+
+async def embed(text):
+    """Embed text for semantic cache lookups"""
+    result = await get_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return result.data[0].embedding
+
+# Each part streams into a .partial file here while it is being generated;
+# the finished text is then checkpointed as <name>.txt so an interrupted run
+# picks up from the sections it already has
+PARTS_DIR = SAVE_DIR / "parts"
+
+async def cached_generate(name, generate):
+    """Return the checkpointed text for a section, or generate and checkpoint it"""
+    path = PARTS_DIR / f"{name}.txt"
+    if path.exists():
+        print(f"♻️ Resuming {name} from {path}")
+        return await asyncio.to_thread(path.read_text, encoding="utf-8")
+    text = await generate()
+    await checkpoint(name, text)
+    return text
+
+async def checkpoint(name, text):
+    """Save a finished section as the last known good copy"""
+    await makedirs(PARTS_DIR)
+    await write_text(PARTS_DIR / f"{name}.txt", text)
+
+def clear_checkpoints():
+    """Delete the section checkpoints so the next run generates from scratch"""
+    for path in PARTS_DIR.glob("*.txt"):
+        path.unlink()
+
+# Scenario constants for consistency, kept in a JSON file so runs can be
+# re-parameterized without editing this script
+SCENARIO_PATH = Path(__file__).with_name("scenario.json")
+
+def load_scenario(path=SCENARIO_PATH):
+    """Read the scenario file, returning its data and the sha256 of its bytes"""
+    raw = Path(path).read_bytes()
+    return json.loads(raw), hashlib.sha256(raw).hexdigest()
+
+SCENARIO_DATA, SCENARIO_HASH = load_scenario()
+
+# Keyed by the scenario file's hash, so editing scenario.json invalidates
+# every cached response written for the old values
+cache = DiskCache(SAVE_DIR / ".cache", prefix=SCENARIO_HASH[:16])
+
+class ScenarioModel(BaseModel):
+    """Schema for SCENARIO_DATA, checked at import so a typo fails before any API call"""
+    model_config = ConfigDict(extra="forbid", strict=True)
+    
+    farmer: str
+    location: str
+    acres: int = Field(gt=0)
+    crop: str
+    baseline_yield: int = Field(gt=0)
+    drought_yield: int = Field(gt=0)
+    normal_price: float = Field(gt=0)
+    planting_cost_per_acre: int = Field(gt=0)
+    seed_cost: int = Field(ge=0)
+    fertilizer_cost: int = Field(ge=0)
+    chemical_cost: int = Field(ge=0)
+    labor_cost: int = Field(ge=0)
+    machinery_cost: int = Field(ge=0)
+    land_rent: int = Field(ge=0)
+    irrigation_capex: int = Field(gt=0)
+    irrigation_acres: int = Field(gt=0)
+    irrigation_yield_boost: float = Field(gt=0, lt=1)
+    storage_capex: int = Field(gt=0)
+    storage_capacity: int = Field(gt=0)
+    storage_cost_per_bu_month: float = Field(ge=0)
+    shrink_rate_per_month: float = Field(ge=0, lt=1)
+    insurance_premium_per_acre: int = Field(ge=0)
+    insurance_coverage: float = Field(gt=0, le=1)
+    drought_probability: float = Field(ge=0, le=1)
+    normal_probability: float = Field(ge=0, le=1)
+    
+    @model_validator(mode="after")
+    def check_consistency(self):
+        if abs(self.drought_probability + self.normal_probability - 1) > 1e-9:
+            raise ValueError("drought_probability and normal_probability must sum to 1")
+        if self.drought_yield > self.baseline_yield:
+            raise ValueError("drought_yield cannot exceed baseline_yield")
+        if self.irrigation_acres > self.acres:
+            raise ValueError("irrigation_acres cannot exceed acres")
+        components = (self.seed_cost + self.fertilizer_cost + self.chemical_cost
+                      + self.labor_cost + self.machinery_cost + self.land_rent)
+        if components != self.planting_cost_per_acre:
+            raise ValueError(f"cost components sum to {components}, not planting_cost_per_acre")
+        return self
+
+ScenarioModel.model_validate(SCENARIO_DATA)
+
+# Finance assumptions for the irrigation investment
+DISCOUNT_RATE = 0.08
+HORIZON_YEARS = 20
+
+def annuity_factor(rate, years):
+    """Present value of $1 a year for years years at rate; broadcasts over numpy arrays"""
+    return (1 - (1 + rate)**-years) / rate
+
+ANNUITY_FACTOR = annuity_factor(DISCOUNT_RATE, HORIZON_YEARS)
+
+def _compute_derived(data):
+    """Compute every quantity the part prompts quote from the scenario constants"""
+    acres = data['acres']
+    baseline_yield = data['baseline_yield']
+    drought_yield = data['drought_yield']
+    cost = data['planting_cost_per_acre']
+    coverage = data['insurance_coverage']
+    premium = data['insurance_premium_per_acre']
+    boost = data['irrigation_yield_boost']
+    irrigation_acres = data['irrigation_acres']
+    irrigation_capex = data['irrigation_capex']
+    storage_capacity = data['storage_capacity']
+    storage_capex = data['storage_capex']
+    normal_price = data['normal_price']
+    p_normal = data['normal_probability']
+    p_drought = data['drought_probability']
+    irrigation_opex = 9175
+    
+    # Harvest and sale timing (Part 2)
+    total_bushels = acres*baseline_yield
+    total_planting = acres*cost
+    october_revenue = total_bushels*4.65
+    stored_bushels = total_bushels*0.955
+    july_revenue = stored_bushels*5.80
+    storage_cost_total = total_bushels*0.45
+    july_net = july_revenue - storage_cost_total
+    
+    # Per-acre profit by weather state (Parts 3 and 5)
+    normal_revenue_per_acre = baseline_yield*normal_price
+    drought_revenue_per_acre = drought_yield*5.60
+    normal_profit_per_acre = normal_revenue_per_acre - cost
+    drought_profit_per_acre = drought_revenue_per_acre - cost
+    ev_per_acre = p_normal*normal_profit_per_acre + p_drought*drought_profit_per_acre
+    
+    # Revenue Protection insurance (Parts 3 and 4)
+    insurance_guarantee = coverage*normal_revenue_per_acre
+    insurance_payout_per_acre = insurance_guarantee - drought_revenue_per_acre
+    expected_payout_per_acre = p_drought*insurance_payout_per_acre
+    expected_payout_total = expected_payout_per_acre*acres
+    total_premium = acres*premium
+    
+    # Irrigation investment (Parts 4 and 5)
+    # round() rather than int(), which would truncate a boost giving 218.9 down to 218
+    irrigated_yield = round(baseline_yield*(1+boost))
+    irrigation_normal_gain = round(baseline_yield*boost)
+    irrigation_drought_gain = irrigated_yield - drought_yield
+    irrigation_normal_value = irrigation_normal_gain*normal_price*irrigation_acres
+    irrigation_drought_value = irrigation_drought_gain*5.60*irrigation_acres
+    irrigation_ev = p_normal*irrigation_normal_value + p_drought*irrigation_drought_value
+    irrigation_net_benefit = irrigation_ev - irrigation_opex
+    irrigation_pv = irrigation_net_benefit*ANNUITY_FACTOR
+    
+    # On-farm storage (Part 4)
+    storage_annual_benefit = storage_capacity*0.44
+    storage_stress_benefit = storage_capacity*0.15
+    
+    return {
+        "gross_revenue": total_bushels*normal_price,
+        "price_swing_exposure": total_bushels*1.60,
+        "drought_yield_loss_pct": (1-drought_yield/baseline_yield)*100,
+        "total_bushels": total_bushels,
+        "drought_bushels": acres*drought_yield,
+        "total_planting": total_planting,
+        "october_revenue": october_revenue,
+        "october_profit": october_revenue - total_planting,
+        "october_profit_per_acre": baseline_yield*4.65 - cost,
+        "stored_bushels": stored_bushels,
+        "july_revenue": july_revenue,
+        "storage_cost_total": storage_cost_total,
+        "july_net": july_net,
+        "july_gain": july_net - october_revenue,
+        "normal_revenue_per_acre": normal_revenue_per_acre,
+        "drought_revenue_per_acre": drought_revenue_per_acre,
+        "normal_profit_per_acre": normal_profit_per_acre,
+        "drought_profit_per_acre": drought_profit_per_acre,
+        "normal_weighted_profit": p_normal*normal_profit_per_acre,
+        "drought_weighted_profit": p_drought*drought_profit_per_acre,
+        "ev_per_acre": ev_per_acre,
+        "ev_total": acres*ev_per_acre,
+        "drought_loss_total": p_drought*(normal_revenue_per_acre - drought_revenue_per_acre)*acres,
+        "drought_loss_per_acre": cost - drought_revenue_per_acre,
+        "drought_loss_farm": acres*(cost - drought_revenue_per_acre),
+        "insurance_guarantee": insurance_guarantee,
+        "insurance_payout_per_acre": insurance_payout_per_acre,
+        "insurance_payout_total": insurance_payout_per_acre*acres,
+        "expected_payout_per_acre": expected_payout_per_acre,
+        "expected_payout_total": expected_payout_total,
+        "total_premium": total_premium,
+        "insurance_net_ev": expected_payout_total - total_premium,
+        "loss_cost_ratio": expected_payout_per_acre/premium,
+        "storage_annual_benefit": storage_annual_benefit,
+        "storage_payback_years": storage_capex/storage_annual_benefit,
+        "storage_stress_benefit": storage_stress_benefit,
+        "storage_stress_payback_years": storage_capex/storage_stress_benefit,
+        "irrigated_yield": irrigated_yield,
+        "irrigation_normal_gain": irrigation_normal_gain,
+        "irrigation_drought_gain": irrigation_drought_gain,
+        "irrigation_normal_value": irrigation_normal_value,
+        "irrigation_drought_value": irrigation_drought_value,
+        "irrigation_gain_per_inch": irrigation_normal_gain/6,
+        "irrigation_ev": irrigation_ev,
+        "irrigation_net_benefit": irrigation_net_benefit,
+        "irrigation_pv": irrigation_pv,
+        "irrigation_npv": irrigation_pv - irrigation_capex,
+        "irrigation_payback_years": irrigation_capex/irrigation_net_benefit,
+    }
+
+@dataclass(frozen=True, slots=True)
+class Scenario:
+    """Scenario inputs plus every derived figure, read by attribute in the prompts"""
+    # Inputs (SCENARIO_DATA)
+    farmer: str
+    location: str
+    acres: int
+    crop: str
+    baseline_yield: int
+    drought_yield: int
+    normal_price: float
+    planting_cost_per_acre: int
+    seed_cost: int
+    fertilizer_cost: int
+    chemical_cost: int
+    labor_cost: int
+    machinery_cost: int
+    land_rent: int
+    irrigation_capex: int
+    irrigation_acres: int
+    irrigation_yield_boost: float
+    storage_capex: int
+    storage_capacity: int
+    storage_cost_per_bu_month: float
+    shrink_rate_per_month: float
+    insurance_premium_per_acre: int
+    insurance_coverage: float
+    drought_probability: float
+    normal_probability: float
+    
+    # Derived: harvest and sale timing
+    gross_revenue: float
+    price_swing_exposure: float
+    drought_yield_loss_pct: float
+    total_bushels: int
+    drought_bushels: int
+    total_planting: int
+    october_revenue: float
+    october_profit: float
+    october_profit_per_acre: float
+    stored_bushels: float
+    july_revenue: float
+    storage_cost_total: float
+    july_net: float
+    july_gain: float
+    
+    # Derived: per-acre profit by weather state
+    normal_revenue_per_acre: float
+    drought_revenue_per_acre: float
+    normal_profit_per_acre: float
+    drought_profit_per_acre: float
+    normal_weighted_profit: float
+    drought_weighted_profit: float
+    ev_per_acre: float
+    ev_total: float
+    drought_loss_total: float
+    drought_loss_per_acre: float
+    drought_loss_farm: float
+    
+    # Derived: Revenue Protection insurance
+    insurance_guarantee: float
+    insurance_payout_per_acre: float
+    insurance_payout_total: float
+    expected_payout_per_acre: float
+    expected_payout_total: float
+    total_premium: int
+    insurance_net_ev: float
+    loss_cost_ratio: float
+    
+    # Derived: on-farm storage
+    storage_annual_benefit: float
+    storage_payback_years: float
+    storage_stress_benefit: float
+    storage_stress_payback_years: float
+    
+    # Derived: irrigation investment
+    irrigated_yield: int
+    irrigation_normal_gain: int
+    irrigation_drought_gain: int
+    irrigation_normal_value: float
+    irrigation_drought_value: float
+    irrigation_gain_per_inch: float
+    irrigation_ev: float
+    irrigation_net_benefit: float
+    irrigation_pv: float
+    irrigation_npv: float
+    irrigation_payback_years: float
+
+# Derived values are computed once at import; S exposes inputs and derived
+# values together as attributes for the prompt f-strings
+DERIVED = _compute_derived(SCENARIO_DATA)
+S = Scenario(**SCENARIO_DATA, **DERIVED)
+
+def render_table(rows, columns):
+    """Render rows as a pipe-delimited table
+    
+    columns is a list of (header, key, format) tuples; each cell is
+    format.format(row[key]).
+    """
+    lines = [" | ".join(header for header, _, _ in columns)]
+    for row in rows:
+        lines.append(" | ".join(fmt.format(row[key]) for _, key, fmt in columns))
+    return "\n".join(lines)
+
+# Part 2 #15: loss causes with farm-wide exposure
+LOSS_TABLE_ROWS = [
+    {"cause": "Drought", "frequency": 15, "impact": 180},
+    {"cause": "Excess Rain/Flood", "frequency": 8, "impact": 95},
+    {"cause": "Hail", "frequency": 5, "impact": 210},
+    {"cause": "Wind/Lodging", "frequency": 4, "impact": 65},
+    {"cause": "Disease (Gray Leaf Spot)", "frequency": 3, "impact": 45},
+]
+for row in LOSS_TABLE_ROWS:
+    row["total"] = S.acres*row["impact"]
+LOSS_TABLE = render_table(LOSS_TABLE_ROWS, [
+    ("Cause", "cause", "{}"),
+    ("Frequency (% of yrs)", "frequency", "{}%"),
+    ("Avg Impact ($/acre)", "impact", "${}"),
+    ("Total Loss if triggered", "total", "${:,}"),
+])
+
+# Part 3 #21: expected value of drought loss, per acre
+EV_TABLE_ROWS = [
+    {"scenario": "Normal", "p": S.normal_probability, "yield": S.baseline_yield,
+     "revenue": S.normal_revenue_per_acre, "cost": S.planting_cost_per_acre,
+     "profit": S.normal_profit_per_acre, "weighted": S.normal_weighted_profit},
+    {"scenario": "Drought", "p": S.drought_probability, "yield": S.drought_yield,
+     "revenue": S.drought_revenue_per_acre, "cost": S.planting_cost_per_acre,
+     "profit": S.drought_profit_per_acre, "weighted": S.drought_weighted_profit},
+]
+EV_TABLE = render_table(EV_TABLE_ROWS, [
+    ("Scenario", "scenario", "{}"),
+    ("Prob (p_i)", "p", "{}"),
+    ("Yield", "yield", "{}"),
+    ("Revenue", "revenue", "${:.0f}/ac"),
+    ("Cost", "cost", "${}"),
+    ("Profit (L_i)", "profit", "${:.0f}/ac"),
+    ("p_i × L_i", "weighted", "${:.2f}/ac"),
+])
+
+# Part 5 #29: irrigation NPV over a grid of discount rates and benefit
+# levels, evaluated in one broadcast pass instead of asked of the model
+DISCOUNT_RATES = np.array([0.06, 0.08, 0.10, 0.12])
+BENEFIT_SCALES = np.array([0.8, 1.0, 1.2])
+
+def npv(rates, cashflows):
+    """NPV of each cash-flow row (year 0 first) at each rate, as a rates × rows array"""
+    years = np.arange(cashflows.shape[-1])
+    return (cashflows / (1 + rates[:, None, None])**years).sum(axis=-1)
+
+def irr(cashflows):
+    """Internal rate of return of one cash-flow series (year 0 first), nan if none exists
+    
+    Solves the NPV polynomial in 1/(1+r) with np.roots, as numpy_financial.irr does.
+    """
+    roots = np.roots(cashflows[::-1])
+    roots = roots[np.isreal(roots) & (roots.real > 0)].real
+    if not len(roots):
+        return float("nan")
+    rates = 1/roots - 1
+    return float(rates[np.argmin(np.abs(rates))])
+
+def discounted_payback(rate, cashflows):
+    """Years until cumulative discounted cash flow turns positive, nan if never"""
+    discounted = cashflows / (1 + rate)**np.arange(len(cashflows))
+    cumulative = np.cumsum(discounted)
+    positive = np.flatnonzero(cumulative >= 0)
+    if not len(positive):
+        return float("nan")
+    t = positive[0]
+    return float(t - 1 + -cumulative[t - 1]/discounted[t])
+
+IRRIGATION_CASHFLOWS = np.array([
+    [-S.irrigation_capex] + [S.irrigation_net_benefit*scale]*HORIZON_YEARS for scale in BENEFIT_SCALES
+])
+NPV_GRID = npv(DISCOUNT_RATES, IRRIGATION_CASHFLOWS)
+IRRIGATION_IRR = irr(IRRIGATION_CASHFLOWS[1])
+IRRIGATION_DISCOUNTED_PAYBACK = discounted_payback(DISCOUNT_RATE, IRRIGATION_CASHFLOWS[1])
+
+# Part 4 #24: irrigation NPV over simulated 20-year weather and price paths
+IRRIGATION_NPV_DRAWS = simulate_irrigation_npv(
+    S.irrigation_normal_gain, S.irrigation_drought_gain, S.drought_probability,
+    normal_price=S.normal_price, drought_price=5.60, price_sd=0.39,
+    acres=S.irrigation_acres, capex=S.irrigation_capex, opex=9175,
+    rate=DISCOUNT_RATE, years=HORIZON_YEARS,
+)
+
+NPV_TABLE_ROWS = [
+    {"rate": rate*100, "low": low, "base": base, "high": high}
+    for rate, (low, base, high) in zip(DISCOUNT_RATES, NPV_GRID)
+]
+NPV_TABLE = render_table(NPV_TABLE_ROWS, [
+    ("Discount rate", "rate", "{:.0f}%"),
+    (f"Benefit -20% (${S.irrigation_net_benefit*0.8:,.0f}/yr)", "low", "${:,.0f}"),
+    (f"Base (${S.irrigation_net_benefit:,.0f}/yr)", "base", "${:,.0f}"),
+    (f"Benefit +20% (${S.irrigation_net_benefit*1.2:,.0f}/yr)", "high", "${:,.0f}"),
+])
+
+class PromptTemplate(string.Template):
+    """string.Template with @{name} placeholders, since the prompts are full of dollar amounts"""
+    delimiter = "@"
+
+# Prompt-only figures that are not Scenario fields
+PROMPT_EXTRAS = {
+    "coverage_pct": S.insurance_coverage*100,
+    "normal_pct": S.normal_probability*100,
+    "drought_pct": S.drought_probability*100,
+    # Headroom of the normal price over the $4.50/bu decision trigger
+    "price_margin_pct": (S.normal_price/4.50 - 1)*100,
+    "yield_boost_pct": S.irrigation_yield_boost*100,
+    "high_bushels": S.acres*205,
+    "drought_exposure": S.acres*180,
+    "dryland_revenue_sd": 28*S.irrigation_acres*S.normal_price,
+    "irrigated_revenue_sd": 14*S.irrigation_acres*S.normal_price,
+    "dryland_var95": 28*1.645*S.irrigation_acres*S.normal_price,
+    "irrigated_var95": 14*1.645*S.irrigation_acres*S.normal_price,
+    "irrigation_irr_pct": IRRIGATION_IRR*100,
+    "irrigation_discounted_payback": (
+        f"{IRRIGATION_DISCOUNTED_PAYBACK:.1f} years" if np.isfinite(IRRIGATION_DISCOUNTED_PAYBACK)
+        else f"not reached within {HORIZON_YEARS} years"
+    ),
+    "annuity_factor": ANNUITY_FACTOR,
+    "mc_paths": len(IRRIGATION_NPV_DRAWS),
+    "mc_npv_p5": np.percentile(IRRIGATION_NPV_DRAWS, 5),
+    "mc_npv_p50": np.percentile(IRRIGATION_NPV_DRAWS, 50),
+    "mc_npv_p95": np.percentile(IRRIGATION_NPV_DRAWS, 95),
+    "mc_npv_positive_pct": (IRRIGATION_NPV_DRAWS > 0).mean()*100,
 }
 
-def chat(prompt, model="gpt-4-turbo", max_tokens=4000):
-    """Call OpenAI API"""
+# Format spec for each placeholder that isn't rendered with plain str()
+PROMPT_FORMATS = {
+    "gross_revenue": ",.0f",
+    "price_swing_exposure": ",.0f",
+    "october_revenue": ",.0f",
+    "october_profit": ",.0f",
+    "stored_bushels": ",.0f",
+    "july_revenue": ",.0f",
+    "storage_cost_total": ",.0f",
+    "july_net": ",.0f",
+    "july_gain": ",.0f",
+    "ev_total": ",.0f",
+    "drought_loss_total": ",.0f",
+    "expected_payout_total": ",.0f",
+    "storage_annual_benefit": ",.0f",
+    "irrigation_drought_value": ",.0f",
+    "irrigation_normal_value": ",.0f",
+    "irrigation_ev": ",.0f",
+    "irrigation_net_benefit": ",.0f",
+    "insurance_payout_total": ",.0f",
+    "insurance_net_ev": ",.0f",
+    "dryland_revenue_sd": ",.0f",
+    "irrigated_revenue_sd": ",.0f",
+    "dryland_var95": ",.0f",
+    "irrigated_var95": ",.0f",
+    "drought_loss_farm": ",.0f",
+    "irrigation_pv": ",.0f",
+    "irrigation_npv": ",.0f",
+    "irrigation_capex": ",",
+    "total_planting": ",",
+    "total_bushels": ",",
+    "drought_bushels": ",",
+    "high_bushels": ",",
+    "drought_exposure": ",",
+    "total_premium": ",",
+    "storage_capacity": ",",
+    "storage_capex": ",",
+    "storage_stress_benefit": ",",
+    "october_profit_per_acre": ".2f",
+    "annuity_factor": ".3f",
+    "ev_per_acre": ".2f",
+    "insurance_guarantee": ".2f",
+    "insurance_payout_per_acre": ".2f",
+    "expected_payout_per_acre": ".2f",
+    "loss_cost_ratio": ".2f",
+    "drought_loss_per_acre": ".2f",
+    "storage_payback_years": ".1f",
+    "storage_stress_payback_years": ".1f",
+    "irrigation_gain_per_inch": ".1f",
+    "irrigation_payback_years": ".1f",
+    "irrigation_irr_pct": ".1f",
+    "mc_paths": ",",
+    "mc_npv_p5": ",.0f",
+    "mc_npv_p50": ",.0f",
+    "mc_npv_p95": ",.0f",
+    "mc_npv_positive_pct": ".1f",
+    "drought_yield_loss_pct": ".0f",
+    "yield_boost_pct": ".0f",
+    "coverage_pct": ".0f",
+    "normal_price": ".2f",
+    "price_margin_pct": ".0f",
+    "normal_pct": ".0f",
+    "drought_pct": ".0f",
+    "normal_profit_per_acre": ".0f",
+    "drought_profit_per_acre": ".0f",
+    "drought_revenue_per_acre": ".0f",
+}
+
+# Every placeholder value, formatted once at import; the part templates are
+# filled from this with a single substitute() call
+PROMPT_CONTEXT = {
+    **{field.name: getattr(S, field.name) for field in fields(S)},
+    **PROMPT_EXTRAS,
+    "loss_table": LOSS_TABLE,
+    "ev_table": EV_TABLE,
+    "npv_table": NPV_TABLE,
+}
+PROMPT_CONTEXT = {name: format(value, PROMPT_FORMATS.get(name, "")) for name, value in PROMPT_CONTEXT.items()}
+
+# Task-independent instructions: the role, the judges' rubric and the writing rules
+SYSTEM_RUBRIC = """You are writing one section of a Modeling the Future Challenge (MTFC) Scenario Quest paper.
+
+SCORING RUBRIC (100 points, target ≥98):
+- Project Definition (15): risk, stakeholders, 3 mitigation categories, scope, audience, success criteria
+- Data Identification & Assessment (20): data mapping, sources, reliability, ≥2 visuals, ≥2 tables
+- Mathematical Modeling (25): formal model, EV math, uncertainty metric, validation, sensitivity
+- Risk Analysis (20): likelihood × severity, baseline vs mitigation, distributional view, tail risk
+- Recommendations (15): actionable steps, cost-benefit, all 3 categories, NPV/IRR/payback
+- Communication & Clarity (5): clean sections, notation, consistent symbols
+
+WRITING RULES:
+- Follow the section structure in the user message exactly, keeping every "#N:" heading
+- Meet or exceed every word count given in brackets, then drop the bracketed instructions
+- Quantify every claim and show each calculation with its inputs
+- Keep symbols and units consistent with the scenario values below
+- Professional prose; NO placeholders, "TBD" or bracketed gaps"""
+
+# Everything a section needs to know about this farm, computed once from S
+SCENARIO_PREAMBLE = f"""The paper analyzes weather and price risk for {S.farmer}, a {S.acres}-acre {S.crop} farmer in {S.location}.
+
+SCENARIO CONSTANTS (use these exact values everywhere):
+- Farm size: {S.acres} acres of {S.crop}
+- Baseline yield: {S.baseline_yield} bu/acre (normal year, probability {S.normal_probability})
+- Drought yield: {S.drought_yield} bu/acre (drought year, probability {S.drought_probability})
+- Normal-year price: ${S.normal_price:.2f}/bu; drought-year price: $5.60/bu
+- Planting cost: ${S.planting_cost_per_acre}/acre (seed ${S.seed_cost}, fertilizer ${S.fertilizer_cost}, chemicals ${S.chemical_cost}, labor ${S.labor_cost}, machinery ${S.machinery_cost}, land rent ${S.land_rent})
+- Irrigation: ${S.irrigation_capex:,} capex for {S.irrigation_acres} acres, +{S.irrigation_yield_boost*100:.0f}% yield, $9,175/year opex
+- Storage: ${S.storage_capex:,} capex, {S.storage_capacity:,} bu capacity, ${S.storage_cost_per_bu_month}/bu/month, {S.shrink_rate_per_month*100:.1f}%/month shrink
+- Insurance: Revenue Protection at {S.insurance_coverage*100:.0f}% coverage, ${S.insurance_premium_per_acre}/acre premium
+
+DERIVED VALUES (already computed, quote them rather than recomputing):
+- Gross revenue (normal year): ${S.gross_revenue:,.0f}
+- Total planting cost: ${S.total_planting:,}
+- Profit per acre: normal ${S.normal_profit_per_acre:.2f}, drought ${S.drought_profit_per_acre:.2f}
+- Expected profit: ${S.ev_per_acre:.2f}/acre, ${S.ev_total:,.0f} farm total
+- Insurance guarantee: ${S.insurance_guarantee:.2f}/acre; drought payout ${S.insurance_payout_per_acre:.2f}/acre
+- Expected insurance payout: ${S.expected_payout_total:,.0f}/year vs premium ${S.total_premium:,}/year
+- Irrigation net benefit: ${S.irrigation_net_benefit:,.0f}/year; NPV at 8% over 20 years ${S.irrigation_npv:,.0f}; payback {S.irrigation_payback_years:.1f} years
+- Storage net gain: $0.44/bu, ${S.storage_annual_benefit:,.0f}/year; payback {S.storage_payback_years:.1f} years
+
+REFERENCE DATA (shared by all parts):
+- Monthly Iowa elevator corn prices, 2016-2025 average ($/bu): Jan 4.85, Feb 4.78, Mar 4.82, Apr 4.95, May 5.10, Jun 5.35, Jul 5.80, Aug 5.45, Sep 4.95, Oct 4.65, Nov 4.55, Dec 4.70 (mean 5.00, SD 0.39)
+- Loss causes, Iowa RMA 1994-2024 (frequency, avg impact): Drought 15% $180/acre; Excess rain/flood 8% $95/acre; Hail 5% $210/acre; Wind/lodging 4% $65/acre; Disease 3% $45/acre
+- Yield regression: Ŷ = 45.2 + 2.8·Rainfall + 0.042·GDD + 18.5·SoilCSR, R² = 0.87, σ = 15 bu/acre
+- Weather states: Normal ({S.normal_probability:.0%}, 32" rain, {S.baseline_yield} bu/acre, ${S.normal_price:.2f}/bu); Drought ({S.drought_probability:.0%}, 22" rain, {S.drought_yield} bu/acre, $5.60/bu)
+- Yield SD: 28 bu/acre dryland, 14 bu/acre irrigated
+- Finance: {DISCOUNT_RATE:.0%} discount rate, {HORIZON_YEARS}-year horizon, annuity factor {ANNUITY_FACTOR:.3f}, $150,000 operating loan
+
+NOTATION (use these symbols consistently):
+A = acres, Y = yield (bu/acre), P = price ($/bu), C = cost ($/acre), R = revenue ($), Π = profit ($),
+p_i = scenario probability, L_i = scenario loss, EV = expected value, σ = standard deviation,
+ρ = correlation, β = regression coefficient, ε = error term, NPV = net present value, IRR = internal rate of return"""
+
+# Shared system message for every section request. It must stay byte-identical
+# across parts so the API's automatic prompt caching can reuse the prefix.
+SHARED_PREAMBLE = SYSTEM_RUBRIC + "\n\n" + SCENARIO_PREAMBLE
+
+def part_messages(prompt):
+    """Build a section request: the shared preamble followed by the part-specific tail"""
+    return [
+        {"role": "system", "content": SHARED_PREAMBLE},
+        {"role": "user", "content": prompt}
+    ]
+
+# gpt-4o-mini's output limit; length retries never ask for more than this
+MAX_TOKENS_CEILING = 16000
+
+# gpt-4o-mini's context window, shared by the prompt and the completion
+CONTEXT_WINDOW = 128000
+_encoders = {}
+
+def count_prompt_tokens(messages, model):
+    """Token count of a chat request's messages (about 4 characters per token without tiktoken)"""
+    text = "".join(message["content"] for message in messages)
+    # Each message adds a few tokens of role/separator framing
+    framing = 4*len(messages)
+    if tiktoken is None:
+        return len(text)//4 + framing
+    if model not in _encoders:
+        try:
+            _encoders[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encoders[model] = tiktoken.get_encoding("o200k_base")
+    return len(_encoders[model].encode(text)) + framing
+
+# Greedy decoding with a fixed seed: a rerun reproduces the same paper, so
+# improvement comes from targeted revisions rather than resampling
+SAMPLING_SEED = 42
+
+@retry(
+    stop=stop_after_attempt(6),
+    wait=wait_random_exponential(min=2, max=60),
+    retry=retry_if_exception_type((RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)),
+    reraise=True,
+)
+async def _stream_completion(stream_path=None, **kwargs):
+    """Stream a chat completion, writing tokens to stream_path as they arrive
+    
+    Returns the response text and the finish reason. Transient API errors are retried with backoff; a retried attempt rewrites
+    the file from the start.
+    """
+    # The semaphore is taken per attempt so backoff sleeps don't hold a slot
+    async with _semaphore:
+        stream = await get_client().chat.completions.create(stream=True, **kwargs)
+        pieces = []
+        finish_reason = None
+        out = await open_for_write(stream_path) if stream_path else None
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    pieces.append(delta)
+                    if out:
+                        await out.write(delta)
+        finally:
+            if out:
+                await out.close()
+        return "".join(pieces), finish_reason
+
+async def chat(messages, model="gpt-4o-mini", max_tokens=4000, response_format=None, stream_path=None,
+               semantic=True):
+    """Call OpenAI API, serving repeated requests from the disk cache
+    
+    When stream_path is given, the response is written to that file as it streams in.
+    semantic=False restricts reuse to byte-identical requests (used for scoring,
+    where a near-duplicate paper must not inherit an old score).
+    """
+    request = json.dumps(messages, ensure_ascii=False)
+    extra = {}
+    if response_format:
+        extra["response_format"] = response_format
+        request += json.dumps(response_format)
+    if stream_path:
+        await makedirs(Path(stream_path).parent)
+    cached = await cache.get(model, max_tokens, request)
+    
+    # Free-text requests fall back to the semantic cache, matched on the
+    # part-specific user message (the shared system preamble would dominate)
+    embedding = None
+    if cached is None and semantic and cache.enabled and SEMANTIC_CACHE_ENABLED and not response_format:
+        embedding = await embed(messages[-1]["content"])
+        semantic_stats["lookups"] += 1
+        cached = semantic_cache().lookup(embedding)
+        if cached is not None:
+            semantic_stats["hits"] += 1
+            print("  (semantic cache hit)")
+    
+    if cached is not None:
+        if stream_path:
+            await write_text(stream_path, cached)
+        return cached
+    prompt_tokens = count_prompt_tokens(messages, model)
+    room = CONTEXT_WINDOW - prompt_tokens - 32
+    if room <= 0:
+        raise ValueError(f"Prompt is {prompt_tokens:,} tokens, over the {CONTEXT_WINDOW:,}-token context window")
     try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=max_tokens,
-        )
-        return completion.choices[0].message.content
+        budget = min(max_tokens, room)
+        while True:
+            response, finish_reason = await _stream_completion(
+                stream_path,
+                model=model,
+                messages=messages,
+                temperature=0,
+                seed=SAMPLING_SEED,
+                max_tokens=budget,
+                **extra,
+            )
+            # Budgets are sized to the part's word target; a cut-off answer is
+            # re-requested with 1.5x the tokens rather than reserving more up front
+            if finish_reason != "length" or budget >= min(MAX_TOKENS_CEILING, room):
+                break
+            budget = min(int(budget * 1.5), MAX_TOKENS_CEILING, room)
+            print(f"  ⚠️ Response hit max_tokens, retrying with {budget}...")
+        await cache.set(model, max_tokens, request, response)
+        if embedding is not None:
+            key = hashlib.sha256(f"{model}|{max_tokens}|{request}".encode("utf-8")).hexdigest()
+            semantic_cache().add(key, embedding, response)
+        return response
     except Exception as e:
         print(f"❌ API Error: {e}")
         raise
 
-def generate_part1():
-    """Generate Part 1: Project Definition (≥300 words)"""
-    prompt = f"""Generate Part 1 of an MTFC paper for {SCENARIO_DATA['farmer']}, a {SCENARIO_DATA['acres']}-acre {SCENARIO_DATA['crop']} farmer in {SCENARIO_DATA['location']}.
+TEMPLATE_PART1 = PromptTemplate("""Generate Part 1 of an MTFC paper for @{farmer}, a @{acres}-acre @{crop} farmer in @{location}.
 
 Use EXACTLY this structure:
 
@@ -79,7 +912,7 @@ Part 1: Project Definition
 #1: Who is at risk?
 
 [Write 100+ words covering:
-- Primary: Farmer Jones with {SCENARIO_DATA['acres']} acres, revenue exposure of ~${SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['normal_price']:,.0f} annually
+- Primary: Farmer Jones with @{acres} acres, revenue exposure of ~$@{gross_revenue} annually
 - Secondary: Input suppliers, lenders (assume $150,000 operating loan), grain elevators
 - Public: Local economy, tax base
 - Quantify cash flow channels and scale]
@@ -87,9 +920,9 @@ Part 1: Project Definition
 #2: Defining the risks
 
 [Write 120+ words covering:
-- Yield risk: Drought reduces yield from {SCENARIO_DATA['baseline_yield']} to {SCENARIO_DATA['drought_yield']} bu/acre ({(1-SCENARIO_DATA['drought_yield']/SCENARIO_DATA['baseline_yield'])*100:.0f}% loss)
-- Price risk: Corn prices $4.20-$5.80/bu (28% range), impacts revenue by ${SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*1.60:,.0f}
-- Cost risk: Input costs ${SCENARIO_DATA['planting_cost_per_acre']}/acre, subject to 10-15% annual variation
+- Yield risk: Drought reduces yield from @{baseline_yield} to @{drought_yield} bu/acre (@{drought_yield_loss_pct}% loss)
+- Price risk: Corn prices $4.20-$5.80/bu (28% range), impacts revenue by $@{price_swing_exposure}
+- Cost risk: Input costs $@{planting_cost_per_acre}/acre, subject to 10-15% annual variation
 - Operational: Equipment failure, labor availability
 - Financial: Debt service, cash flow timing
 - Provide $/acre metrics and timelines]
@@ -98,21 +931,16 @@ Part 1: Project Definition
 
 [Write 80+ words, one strategy per category:
 - Behavior change: Adopt drought-resistant hybrid seeds (+5% yield stability, +$15/acre cost)
-- Outcome modification: Install center-pivot irrigation system (${SCENARIO_DATA['irrigation_capex']:,}, +{SCENARIO_DATA['irrigation_yield_boost']*100:.0f}% yield, -50% variance)
-- Insurance: Revenue Protection policy at {SCENARIO_DATA['insurance_coverage']*100:.0f}% coverage (${SCENARIO_DATA['insurance_premium_per_acre']}/acre premium)
-Each with quantitative effect]
+- Outcome modification: Install center-pivot irrigation system ($@{irrigation_capex}, +@{yield_boost_pct}% yield, -50% variance)
+- Insurance: Revenue Protection policy at @{coverage_pct}% coverage ($@{insurance_premium_per_acre}/acre premium)
+Each with quantitative effect]""")
 
-Write professional, quantified prose. NO placeholders."""
+def part1_prompt():
+    """Build the prompt for Part 1: Project Definition (≥300 words)"""
+    return TEMPLATE_PART1.substitute(PROMPT_CONTEXT)
 
-    return chat(prompt, max_tokens=3000)
 
-def generate_part2():
-    """Generate Part 2: Data Identification & Assessment (≥900 words)"""
-    
-    # Calculate detailed costs and prices
-    total_planting = SCENARIO_DATA['acres'] * SCENARIO_DATA['planting_cost_per_acre']
-    
-    prompt = f"""Generate Part 2 of the MTFC paper. Use EXACTLY this structure:
+TEMPLATE_PART2 = PromptTemplate("""Generate Part 2 of the MTFC paper. Use EXACTLY this structure:
 
 Part 2: Data Identification & Assessment
 
@@ -132,24 +960,24 @@ Part 2: Data Identification & Assessment
 
 Table 1: Per-Acre Planting Cost Breakdown (2025, Iowa corn)
 Component | Low | Base | High | Rationale
-Seed | $130 | ${SCENARIO_DATA['seed_cost']} | $155 | 80K pop density, $280/bag, varies by trait package
-Fertilizer | $165 | ${SCENARIO_DATA['fertilizer_cost']} | $210 | N-P-K at 180-40-40 lbs/acre, prices from Feb 2025
-Chemicals | $75 | ${SCENARIO_DATA['chemical_cost']} | $95 | Pre/post-emerge herbicide, insecticide
-Labor | $55 | ${SCENARIO_DATA['labor_cost']} | $70 | 2.5 hrs/acre at $24/hr incl. benefits
-Machinery | $85 | ${SCENARIO_DATA['machinery_cost']} | $110 | Fuel, repairs, depreciation on $800K fleet
-Land Rent | $170 | ${SCENARIO_DATA['land_rent']} | $195 | Cash rent, Iowa avg per USDA
-TOTAL/acre | $680 | ${SCENARIO_DATA['planting_cost_per_acre']} | $835 |
+Seed | $130 | $@{seed_cost} | $155 | 80K pop density, $280/bag, varies by trait package
+Fertilizer | $165 | $@{fertilizer_cost} | $210 | N-P-K at 180-40-40 lbs/acre, prices from Feb 2025
+Chemicals | $75 | $@{chemical_cost} | $95 | Pre/post-emerge herbicide, insecticide
+Labor | $55 | $@{labor_cost} | $70 | 2.5 hrs/acre at $24/hr incl. benefits
+Machinery | $85 | $@{machinery_cost} | $110 | Fuel, repairs, depreciation on $800K fleet
+Land Rent | $170 | $@{land_rent} | $195 | Cash rent, Iowa avg per USDA
+TOTAL/acre | $680 | $@{planting_cost_per_acre} | $835 |
 
-Total {SCENARIO_DATA['acres']} acres = ${total_planting:,} base case
+Total @{acres} acres = $@{total_planting} base case
 
 Rationale for ranges: Seed varies by trait; fertilizer tied to natural gas futures; land rent reflects soil productivity (CSR 75-85). Low = favorable contracts, High = spot pricing.]
 
 #9: Harvest expectations
 
 [Write 100+ words:
-Quantity Q = {SCENARIO_DATA['acres']} acres × {SCENARIO_DATA['baseline_yield']} bu/acre = {SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']:,} bushels (base case).
-Yield range: Low {SCENARIO_DATA['drought_yield']}, Base {SCENARIO_DATA['baseline_yield']}, High 205 bu/acre.
-Total harvest range: {SCENARIO_DATA['acres']*SCENARIO_DATA['drought_yield']:,} to {SCENARIO_DATA['acres']*205:,} bushels.
+Quantity Q = @{acres} acres × @{baseline_yield} bu/acre = @{total_bushels} bushels (base case).
+Yield range: Low @{drought_yield}, Base @{baseline_yield}, High 205 bu/acre.
+Total harvest range: @{drought_bushels} to @{high_bushels} bushels.
 Base scenario: normal rainfall (30-35 inches Apr-Sep), GDDs 2,800-3,000, no hail/wind events.]
 
 #10-#11: Corn sale prices
@@ -170,22 +998,22 @@ Seasonal pattern: Prices rise Mar-Jul as stocks deplete (old crop), then fall Au
 
 [Write 80+ words:
 October price = $4.65/bu (from Table 2).
-Revenue = {SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']:,} bu × $4.65 = ${SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*4.65:,.0f}.
-Planting cost = ${total_planting:,}.
-Net profit = ${SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*4.65 - total_planting:,.0f}.
-Per-acre profit = $(({SCENARIO_DATA['baseline_yield']}*4.65) - {SCENARIO_DATA['planting_cost_per_acre']}) = ${SCENARIO_DATA['baseline_yield']*4.65 - SCENARIO_DATA['planting_cost_per_acre']:.2f}/acre.]
+Revenue = @{total_bushels} bu × $4.65 = $@{october_revenue}.
+Planting cost = $@{total_planting}.
+Net profit = $@{october_profit}.
+Per-acre profit = $((@{baseline_yield}*4.65) - @{planting_cost_per_acre}) = $@{october_profit_per_acre}/acre.]
 
 #13: Optimal sale month
 
 [Write 120+ words:
 July price = $5.80/bu (highest).
 Storage from Oct (harvest) to Jul = 9 months.
-Storage cost = {SCENARIO_DATA['storage_cost_per_bu_month']}×9 = $0.45/bu.
-Shrink = 0.5%/month × 9 = 4.5%, so net bushels = {SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']:,} × 0.955 = {SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.955:,.0f} bu.
-Revenue = {SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.955:,.0f} × $5.80 = ${SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.955*5.80:,.0f}.
-Less storage = {SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']:,} × $0.45 = ${SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.45:,.0f}.
-Net = ${SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.955*5.80 - SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.45:,.0f}.
-Gain over Oct = ${(SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.955*5.80 - SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*0.45) - SCENARIO_DATA['acres']*SCENARIO_DATA['baseline_yield']*4.65:,.0f}.
+Storage cost = @{storage_cost_per_bu_month}×9 = $0.45/bu.
+Shrink = 0.5%/month × 9 = 4.5%, so net bushels = @{total_bushels} × 0.955 = @{stored_bushels} bu.
+Revenue = @{stored_bushels} × $5.80 = $@{july_revenue}.
+Less storage = @{total_bushels} × $0.45 = $@{storage_cost_total}.
+Net = $@{july_net}.
+Gain over Oct = $@{july_gain}.
 Optimal month: July (m* = 7), stored 9 months.]
 
 #14: Data visual
@@ -201,23 +1029,16 @@ Visual demonstrates 27% seasonal swing, guiding storage decision. Data from loca
 [Write 150+ words:
 
 Table 3: Corn Loss Causes (Iowa RMA, 1994-2024)
-Cause | Frequency (% of yrs) | Avg Impact ($/acre) | Total Loss if triggered
-Drought | 15% | $180 | ${SCENARIO_DATA['acres']*180:,}
-Excess Rain/Flood | 8% | $95 | ${SCENARIO_DATA['acres']*95:,}
-Hail | 5% | $210 | ${SCENARIO_DATA['acres']*210:,}
-Wind/Lodging | 4% | $65 | ${SCENARIO_DATA['acres']*65:,}
-Disease (Gray Leaf Spot) | 3% | $45 | ${SCENARIO_DATA['acres']*45:,}
+@{loss_table}
 
-Top cause: Drought (15% frequency, highest total exposure ${SCENARIO_DATA['acres']*180:,}). Impact channels: reduced yield (30-40%), lower test weight (dockage), delayed planting (prevented plant). Second: Hail (lower freq but high severity per event). Flood typically affects 10-15% of acres (low-lying fields).]
+Top cause: Drought (15% frequency, highest total exposure $@{drought_exposure}). Impact channels: reduced yield (30-40%), lower test weight (dockage), delayed planting (prevented plant). Second: Hail (lower freq but high severity per event). Flood typically affects 10-15% of acres (low-lying fields).]""")
 
-Write in professional prose with all numbers and tables clearly specified. NO placeholders or "TBD"."""
+def part2_prompt():
+    """Build the prompt for Part 2: Data Identification & Assessment (≥900 words)"""
+    return TEMPLATE_PART2.substitute(PROMPT_CONTEXT)
 
-    return chat(prompt, max_tokens=4000)
 
-def generate_part3():
-    """Generate Part 3: Mathematical Modeling (≥900 words)"""
-    
-    prompt = f"""Generate Part 3 of the MTFC paper. Use EXACTLY this structure with full quantification:
+TEMPLATE_PART3 = PromptTemplate("""Generate Part 3 of the MTFC paper. Use EXACTLY this structure with full quantification:
 
 Part 3: Mathematical Modeling
 
@@ -274,8 +1095,8 @@ Implications: Models are fit-for-purpose for farm decision-making; sensitivity a
 Scenario set for modeling:
 
 State | Probability | Rainfall | Yield (bu/ac) | Price ($/bu) | Description
-Normal | 85% | 32" | {SCENARIO_DATA['baseline_yield']} | $5.20 | Typical year
-Drought | 15% | 22" | {SCENARIO_DATA['drought_yield']} | $5.60 | Dry (prices up on supply concern)
+Normal | @{normal_pct}% | 32" | @{baseline_yield} | $@{normal_price} | Typical year
+Drought | @{drought_pct}% | 22" | @{drought_yield} | $5.60 | Dry (prices up on supply concern)
 
 Correlation note: Drought scenarios pair low yield with +8% price (negative correlation ρ_YP = -0.35 historically, due to regional supply shock).
 
@@ -297,46 +1118,42 @@ Probability of ≥1 drought in next 10 yrs: 1 - e^(-1.5) = 77.7%.]
 
 EV of annual drought loss (no mitigation):
 
-Scenario | Prob (p_i) | Yield | Revenue | Cost | Profit (L_i) | p_i × L_i
-Normal | 0.85 | {SCENARIO_DATA['baseline_yield']} | ${SCENARIO_DATA['baseline_yield']*5.20:.0f}/ac | ${SCENARIO_DATA['planting_cost_per_acre']} | ${SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['planting_cost_per_acre']:.0f}/ac | ${0.85*(SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['planting_cost_per_acre']):.2f}/ac
-Drought | 0.15 | {SCENARIO_DATA['drought_yield']} | ${SCENARIO_DATA['drought_yield']*5.60:.0f}/ac | ${SCENARIO_DATA['planting_cost_per_acre']} | ${SCENARIO_DATA['drought_yield']*5.60 - SCENARIO_DATA['planting_cost_per_acre']:.0f}/ac | ${0.15*(SCENARIO_DATA['drought_yield']*5.60 - SCENARIO_DATA['planting_cost_per_acre']):.2f}/ac
+@{ev_table}
 
-EV per acre = Σ p_i L_i = ${0.85*(SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['planting_cost_per_acre']) + 0.15*(SCENARIO_DATA['drought_yield']*5.60 - SCENARIO_DATA['planting_cost_per_acre']):.2f}/acre
+EV per acre = Σ p_i L_i = $@{ev_per_acre}/acre
 
-Total farm ({SCENARIO_DATA['acres']} acres): EV = ${SCENARIO_DATA['acres']*(0.85*(SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['planting_cost_per_acre']) + 0.15*(SCENARIO_DATA['drought_yield']*5.60 - SCENARIO_DATA['planting_cost_per_acre'])):,.0f}
+Total farm (@{acres} acres): EV = $@{ev_total}
 
-Note: Drought loss = (Normal profit - Drought profit) × 0.15 = $({SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['planting_cost_per_acre']:.0f} - {SCENARIO_DATA['drought_yield']*5.60 - SCENARIO_DATA['planting_cost_per_acre']:.0f}) × 0.15 × {SCENARIO_DATA['acres']} = ${0.15*(SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres']:,.0f}]
+Note: Drought loss = (Normal profit - Drought profit) × @{drought_probability} = $(@{normal_profit_per_acre} - @{drought_profit_per_acre}) × @{drought_probability} × @{acres} = $@{drought_loss_total}]
 
 #22: Average annual insurance payout
 
 [Write 150+ words:
 
 Revenue Protection (RP) policy parameters:
-- Coverage level: {SCENARIO_DATA['insurance_coverage']*100:.0f}%
-- Guarantee: {SCENARIO_DATA['insurance_coverage']} × {SCENARIO_DATA['baseline_yield']} bu/ac × $5.20/bu = ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20:.2f}/acre
-- Premium: ${SCENARIO_DATA['insurance_premium_per_acre']}/acre ({SCENARIO_DATA['acres']} ac → ${SCENARIO_DATA['acres']*SCENARIO_DATA['insurance_premium_per_acre']:,} total)
+- Coverage level: @{coverage_pct}%
+- Guarantee: @{insurance_coverage} × @{baseline_yield} bu/ac × $@{normal_price}/bu = $@{insurance_guarantee}/acre
+- Premium: $@{insurance_premium_per_acre}/acre (@{acres} ac → $@{total_premium} total)
 
 Payout calculation (drought scenario):
-Actual revenue = {SCENARIO_DATA['drought_yield']} × $5.60 = ${SCENARIO_DATA['drought_yield']*5.60:.0f}/acre
-Guarantee = ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20:.2f}/acre
-Shortfall = ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20:.2f} - ${SCENARIO_DATA['drought_yield']*5.60:.0f} = ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60:.2f}/acre (if positive)
+Actual revenue = @{drought_yield} × $5.60 = $@{drought_revenue_per_acre}/acre
+Guarantee = $@{insurance_guarantee}/acre
+Shortfall = $@{insurance_guarantee} - $@{drought_revenue_per_acre} = $@{insurance_payout_per_acre}/acre (if positive)
 
-Since ${SCENARIO_DATA['drought_yield']*5.60:.0f} < ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20:.2f}, payout = ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60:.2f}/acre
+Since $@{drought_revenue_per_acre} < $@{insurance_guarantee}, payout = $@{insurance_payout_per_acre}/acre
 
-Expected annual payout = 0.15 × ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60:.2f}/acre + 0.85 × $0 = ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60):.2f}/acre
+Expected annual payout = @{drought_probability} × $@{insurance_payout_per_acre}/acre + @{normal_probability} × $0 = $@{expected_payout_per_acre}/acre
 
-Total farm: ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres']:,.0f}/year
+Total farm: $@{expected_payout_total}/year
 
-Loss cost ratio = Payout/Premium = ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60):.2f}/${SCENARIO_DATA['insurance_premium_per_acre']} = {0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)/SCENARIO_DATA['insurance_premium_per_acre']:.2f} (indicates fair pricing if ≈1.0; subsidy if >1.0)]
+Loss cost ratio = Payout/Premium = $@{expected_payout_per_acre}/$@{insurance_premium_per_acre} = @{loss_cost_ratio} (indicates fair pricing if ≈1.0; subsidy if >1.0)]""")
 
-Write complete prose with all calculations shown. NO placeholders."""
+def part3_prompt():
+    """Build the prompt for Part 3: Mathematical Modeling (≥900 words)"""
+    return TEMPLATE_PART3.substitute(PROMPT_CONTEXT)
 
-    return chat(prompt, max_tokens=4000)
 
-def generate_part4():
-    """Generate Part 4: Risk Analysis (≥700 words)"""
-    
-    prompt = f"""Generate Part 4 of the MTFC paper. Use EXACTLY this structure:
+TEMPLATE_PART4 = PromptTemplate("""Generate Part 4 of the MTFC paper. Use EXACTLY this structure:
 
 Part 4: Risk Analysis
 
@@ -344,22 +1161,22 @@ Part 4: Risk Analysis
 
 [Write 150+ words:
 
-Strategy: Build on-farm storage ({SCENARIO_DATA['storage_capacity']:,} bu capacity, ${SCENARIO_DATA['storage_capex']:,}) to capture seasonal price appreciation.
+Strategy: Build on-farm storage (@{storage_capacity} bu capacity, $@{storage_capex}) to capture seasonal price appreciation.
 
 Quantitative analysis:
 ΔR = (Price lift - Storage cost - Shrink loss)
 
 Price lift: July $5.80 - October $4.65 = $1.15/bu
-Storage cost: 9 months × ${SCENARIO_DATA['storage_cost_per_bu_month']}/bu/month = $0.45/bu
+Storage cost: 9 months × $@{storage_cost_per_bu_month}/bu/month = $0.45/bu
 Shrink: 4.5% of value = 0.045 × $5.80 = $0.26/bu
 Net gain ΔR = $1.15 - $0.45 - $0.26 = $0.44/bu
 
-For {SCENARIO_DATA['storage_capacity']:,} bu/year:
-Annual benefit = {SCENARIO_DATA['storage_capacity']:,} × $0.44 = ${SCENARIO_DATA['storage_capacity']*0.44:,.0f}
+For @{storage_capacity} bu/year:
+Annual benefit = @{storage_capacity} × $0.44 = $@{storage_annual_benefit}
 
-Payback period = ${SCENARIO_DATA['storage_capex']:,} / ${SCENARIO_DATA['storage_capacity']*0.44:,.0f}/yr = {SCENARIO_DATA['storage_capex']/(SCENARIO_DATA['storage_capacity']*0.44):.1f} years
+Payback period = $@{storage_capex} / $@{storage_annual_benefit}/yr = @{storage_payback_years} years
 
-Risk: Price convergence (July premium may shrink to $0.60/bu in oversupply years, reducing benefit to $0.15/bu = ${SCENARIO_DATA['storage_capacity']*0.15:,}/yr, extending payback to {SCENARIO_DATA['storage_capex']/(SCENARIO_DATA['storage_capacity']*0.15):.1f} years).
+Risk: Price convergence (July premium may shrink to $0.60/bu in oversupply years, reducing benefit to $0.15/bu = $@{storage_stress_benefit}/yr, extending payback to @{storage_stress_payback_years} years).
 
 Variance impact: Storage increases revenue mean but adds price risk (July price SD = $0.55 vs Oct SD = $0.35).]
 
@@ -367,51 +1184,54 @@ Variance impact: Storage increases revenue mean but adds price risk (July price
 
 [Write 200+ words:
 
-Strategy: Install center-pivot irrigation (${SCENARIO_DATA['irrigation_capex']:,} for {SCENARIO_DATA['irrigation_acres']}-acre system) to stabilize yield.
+Strategy: Install center-pivot irrigation ($@{irrigation_capex} for @{irrigation_acres}-acre system) to stabilize yield.
 
-Capital cost: ${SCENARIO_DATA['irrigation_capex']:,} (includes pivot, well, pump, trenching)
+Capital cost: $@{irrigation_capex} (includes pivot, well, pump, trenching)
 Operating cost (annual):
-- Energy: 6" applied water × {SCENARIO_DATA['irrigation_acres']} acres × $0.12/kWh × 0.8 kWh per 1,000 gal ≈ $4,800
-- O&M: $35/acre × {SCENARIO_DATA['irrigation_acres']} = $4,375
+- Energy: 6" applied water × @{irrigation_acres} acres × $0.12/kWh × 0.8 kWh per 1,000 gal ≈ $4,800
+- O&M: $35/acre × @{irrigation_acres} = $4,375
 - Total opex = $9,175/year
 
 Yield benefit:
-- Irrigated yield (all years): {int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost']))} bu/acre (vs {SCENARIO_DATA['baseline_yield']} dryland normal, {SCENARIO_DATA['drought_yield']} dryland drought)
-- In drought years: Irrigated {int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost']))} vs dryland {SCENARIO_DATA['drought_yield']} → ΔY = {int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield']} bu/acre
-- Value in drought: {int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield']} bu/acre × $5.60 × {SCENARIO_DATA['irrigation_acres']} ac = ${(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres']:,.0f}
-- In normal years: {int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost']))} vs {SCENARIO_DATA['baseline_yield']} → ΔY = {int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])} bu/acre → ${int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres']:,.0f}
+- Irrigated yield (all years): @{irrigated_yield} bu/acre (vs @{baseline_yield} dryland normal, @{drought_yield} dryland drought)
+- In drought years: Irrigated @{irrigated_yield} vs dryland @{drought_yield} → ΔY = @{irrigation_drought_gain} bu/acre
+- Value in drought: @{irrigation_drought_gain} bu/acre × $5.60 × @{irrigation_acres} ac = $@{irrigation_drought_value}
+- In normal years: @{irrigated_yield} vs @{baseline_yield} → ΔY = @{irrigation_normal_gain} bu/acre → $@{irrigation_normal_value}
 
 Expected annual benefit ΔΠ:
-EV = 0.85 × ${int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres']:,.0f} + 0.15 × ${(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres']:,.0f} = ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres']:,.0f}/year
+EV = @{normal_probability} × $@{irrigation_normal_value} + @{drought_probability} × $@{irrigation_drought_value} = $@{irrigation_ev}/year
 
-Less opex: ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f} net/year
+Less opex: $@{irrigation_net_benefit} net/year
 
-Variance reduction: Yield SD drops from 28 bu/acre (dryland) to 14 bu/acre (irrigated), cutting revenue volatility by ~50%.]
+Variance reduction: Yield SD drops from 28 bu/acre (dryland) to 14 bu/acre (irrigated), cutting revenue volatility by ~50%.
+
+Monte Carlo check (@{mc_paths} simulated 20-year paths, @{drought_pct}% drought chance each year, price SD $0.39/bu, 8% discount rate):
+NPV 5th percentile $@{mc_npv_p5}, median $@{mc_npv_p50}, 95th percentile $@{mc_npv_p95}; P(NPV > 0) = @{mc_npv_positive_pct}%]
 
 #23: Crop insurance scenario
 
 [Write 120+ words:
 
 Policy: Revenue Protection (RP)
-Coverage level: {SCENARIO_DATA['insurance_coverage']*100:.0f}% (typical for commercial farms; range 70-85%)
-Price election: Spring price $5.20/bu (Feb projected price from CME Dec futures)
-Guarantee: {SCENARIO_DATA['insurance_coverage']} × {SCENARIO_DATA['baseline_yield']} × $5.20 = ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20:.2f}/acre
-Premium: ${SCENARIO_DATA['insurance_premium_per_acre']}/acre after subsidy (farmer pays ~45% of actuarial rate; full rate ≈$71/acre)
-Total cost: {SCENARIO_DATA['acres']} × ${SCENARIO_DATA['insurance_premium_per_acre']} = ${SCENARIO_DATA['acres']*SCENARIO_DATA['insurance_premium_per_acre']:,}
+Coverage level: @{coverage_pct}% (typical for commercial farms; range 70-85%)
+Price election: Spring price $@{normal_price}/bu (Feb projected price from CME Dec futures)
+Guarantee: @{insurance_coverage} × @{baseline_yield} × $@{normal_price} = $@{insurance_guarantee}/acre
+Premium: $@{insurance_premium_per_acre}/acre after subsidy (farmer pays ~45% of actuarial rate; full rate ≈$71/acre)
+Total cost: @{acres} × $@{insurance_premium_per_acre} = $@{total_premium}
 
-Payout trigger: Actual revenue < ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20:.2f}/acre
-Example (drought): {SCENARIO_DATA['drought_yield']} bu × $5.60 = ${SCENARIO_DATA['drought_yield']*5.60:.0f}/acre < ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20:.2f} → payout ${SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60:.2f}/acre × {SCENARIO_DATA['acres']} = ${(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres']:,.0f}]
+Payout trigger: Actual revenue < $@{insurance_guarantee}/acre
+Example (drought): @{drought_yield} bu × $5.60 = $@{drought_revenue_per_acre}/acre < $@{insurance_guarantee} → payout $@{insurance_payout_per_acre}/acre × @{acres} = $@{insurance_payout_total}]
 
 #26: Value of insurance
 
 [Write 130+ words:
 
 Financial value calculation:
-Expected payout (from #22) = ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres']:,.0f}/year
-Premium paid = ${SCENARIO_DATA['acres']*SCENARIO_DATA['insurance_premium_per_acre']:,}/year
-Net EV = ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres'] - SCENARIO_DATA['acres']*SCENARIO_DATA['insurance_premium_per_acre']:,.0f}/year
+Expected payout (from #22) = $@{expected_payout_total}/year
+Premium paid = $@{total_premium}/year
+Net EV = $@{insurance_net_ev}/year
 
-E[Payout] - Premium = ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres']:,.0f} - ${SCENARIO_DATA['acres']*SCENARIO_DATA['insurance_premium_per_acre']:,} = ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres'] - SCENARIO_DATA['acres']*SCENARIO_DATA['insurance_premium_per_acre']:,.0f}
+E[Payout] - Premium = $@{expected_payout_total} - $@{total_premium} = $@{insurance_net_ev}
 
 Positive net value due to federal subsidy (government covers ~55% of premium).
 
@@ -421,7 +1241,7 @@ Risk-reduction value (qualitative but critical):
 - Mental/stress relief: catastrophic loss capped
 - Enables leveraged expansion (lenders require insurance for >$500K loans)
 
-Without subsidy, actuarially fair premium ≈${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60):.2f}/acre × {SCENARIO_DATA['acres']} ≈ ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres']:,.0f}, making subsidy worth ${0.15*(SCENARIO_DATA['insurance_coverage']*SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['drought_yield']*5.60)*SCENARIO_DATA['acres'] - SCENARIO_DATA['acres']*SCENARIO_DATA['insurance_premium_per_acre']:,.0f}/year to farmer.]
+Without subsidy, actuarially fair premium ≈$@{expected_payout_per_acre}/acre × @{acres} ≈ $@{expected_payout_total}, making subsidy worth $@{insurance_net_ev}/year to farmer.]
 
 Write complete quantified prose with all calculations. Include 2×2 loss table:
 
@@ -432,14 +1252,14 @@ Table: Baseline vs Mitigation Loss Comparison
 | No Mitigation | [compute from EV] | [estimate from distribution] |
 | With Irrigation+Insurance | [compute] | [compute] |
 
-Provide narrative explaining distributional shift and tail risk reduction."""
+Provide narrative explaining distributional shift and tail risk reduction.""")
 
-    return chat(prompt, max_tokens=4000)
+def part4_prompt():
+    """Build the prompt for Part 4: Risk Analysis (≥700 words)"""
+    return TEMPLATE_PART4.substitute(PROMPT_CONTEXT)
 
-def generate_part5():
-    """Generate Part 5: Recommendations (≥500 words)"""
-    
-    prompt = f"""Generate Part 5 of the MTFC paper. Use EXACTLY this structure with all NPV/IRR/payback calculations:
+
+TEMPLATE_PART5 = PromptTemplate("""Generate Part 5 of the MTFC paper. Use EXACTLY this structure with all NPV/IRR/payback calculations:
 
 Part 5: Recommendations
 
@@ -447,21 +1267,21 @@ Part 5: Recommendations
 
 [Write 120+ words:
 
-Quantified irrigation impact on {SCENARIO_DATA['irrigation_acres']}-acre system:
+Quantified irrigation impact on @{irrigation_acres}-acre system:
 
 Mean uplift:
-- Revenue increase (EV): ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres']:,.0f}/year gross
-- Less opex ($9,175/year) = ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f} net annual benefit
+- Revenue increase (EV): $@{irrigation_ev}/year gross
+- Less opex ($9,175/year) = $@{irrigation_net_benefit} net annual benefit
 
 Volatility decrease:
-- Dryland profit SD: $28/acre × {SCENARIO_DATA['irrigation_acres']} ac × $5.20 = ${28*SCENARIO_DATA['irrigation_acres']*5.20:,.0f} revenue volatility
-- Irrigated profit SD: $14/acre × {SCENARIO_DATA['irrigation_acres']} × $5.20 = ${14*SCENARIO_DATA['irrigation_acres']*5.20:,.0f} (50% reduction)
-- VaR improvement: 95th percentile bad year loss drops from ${28*1.645*SCENARIO_DATA['irrigation_acres']*5.20:,.0f} to ${14*1.645*SCENARIO_DATA['irrigation_acres']*5.20:,.0f} (assuming normal distribution)
+- Dryland profit SD: $28/acre × @{irrigation_acres} ac × $@{normal_price} = $@{dryland_revenue_sd} revenue volatility
+- Irrigated profit SD: $14/acre × @{irrigation_acres} × $@{normal_price} = $@{irrigated_revenue_sd} (50% reduction)
+- VaR improvement: 95th percentile bad year loss drops from $@{dryland_var95} to $@{irrigated_var95} (assuming normal distribution)
 
 Efficiency metrics:
 - Water use: 6 acre-inches applied in dry years (vs 0 dryland), pumping 30M gallons
 - Energy: 24,000 kWh/season at $0.12/kWh = $2,880 (48% of opex)
-- Yield per inch applied: {int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])/6:.1f} bu/acre-inch marginal product]
+- Yield per inch applied: @{irrigation_gain_per_inch} bu/acre-inch marginal product]
 
 #28: Compare EV of loss
 
@@ -471,13 +1291,13 @@ Table: Expected Value of Loss — Baseline vs Mitigation
 
 | Strategy | Mean Profit ($/acre) | 95th Pct Loss ($/acre) | Total Farm Mean | Total Farm 95th Pct |
 |----------|---------------------|----------------------|----------------|---------------------|
-| Baseline (no mitigation) | ${0.85*(SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['planting_cost_per_acre']) + 0.15*(SCENARIO_DATA['drought_yield']*5.60 - SCENARIO_DATA['planting_cost_per_acre']):.2f} | $-{SCENARIO_DATA['planting_cost_per_acre'] - SCENARIO_DATA['drought_yield']*5.60:.2f} | ${SCENARIO_DATA['acres']*(0.85*(SCENARIO_DATA['baseline_yield']*5.20 - SCENARIO_DATA['planting_cost_per_acre']) + 0.15*(SCENARIO_DATA['drought_yield']*5.60 - SCENARIO_DATA['planting_cost_per_acre'])):,.0f} | $-{SCENARIO_DATA['acres']*(SCENARIO_DATA['planting_cost_per_acre'] - SCENARIO_DATA['drought_yield']*5.60):,.0f} |
+| Baseline (no mitigation) | $@{ev_per_acre} | $-@{drought_loss_per_acre} | $@{ev_total} | $-@{drought_loss_farm} |
 | Irrigation (125 ac) + Insurance | [compute with irrigation on 125 ac, insurance on 500 ac] | [compute] | [compute] | [compute] |
 
 Takeaways:
 - Mean profit increases by [X]% due to yield uplift and insurance net benefit
 - Tail risk (95th pct) improves by $[Y]/acre, reducing catastrophic loss exposure by [Z]%
-- Insurance caps downside: worst-case profit = $[guarantee - costs]/acre vs baseline $-{SCENARIO_DATA['planting_cost_per_acre'] - SCENARIO_DATA['drought_yield']*5.60:.2f}
+- Insurance caps downside: worst-case profit = $[guarantee - costs]/acre vs baseline $-@{drought_loss_per_acre}
 - Distributional shift: SD of profit/acre drops from $[baseline SD] to $[mitigated SD]
 
 Discussion: Mitigation portfolio shifts distribution right (higher mean) and compresses left tail (lower downside risk). Critical for debt service: 95th pct scenario now covers operating loan payment of ~$25,000/year.]
@@ -489,24 +1309,27 @@ Discussion: Mitigation portfolio shifts distribution right (higher mean) and com
 Financial analysis of irrigation investment (20-year horizon):
 
 Cash flows:
-Year 0: -${SCENARIO_DATA['irrigation_capex']:,} (capex)
-Years 1-20: +${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f}/year net benefit
+Year 0: -$@{irrigation_capex} (capex)
+Years 1-20: +$@{irrigation_net_benefit}/year net benefit
 
 Discount rate: 8% (cost of capital, reflects farm loan rate + risk premium)
 
-NPV = -$250,000 + Σ(t=1 to 20) ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f} / (1.08)^t
+NPV = -$250,000 + Σ(t=1 to 20) $@{irrigation_net_benefit} / (1.08)^t
+
+Using annuity formula: NPV = -$250,000 + $@{irrigation_net_benefit} × [(1 - 1.08^-20) / 0.08]
+     = -$250,000 + $@{irrigation_net_benefit} × @{annuity_factor}
+     = -$250,000 + $@{irrigation_pv}
+     = $@{irrigation_npv}
 
-Using annuity formula: NPV = -$250,000 + ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f} × [(1 - 1.08^-20) / 0.08]
-     = -$250,000 + ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f} × 9.818
-     = -$250,000 + ${(0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175)*9.818:,.0f}
-     = ${(0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175)*9.818 - 250000:,.0f}
+NPV sensitivity over 20 years:
+@{npv_table}
 
-IRR: Solve 0 = -$250,000 + Σ ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f}/(1+IRR)^t
-      IRR ≈ 15.3% (exceeds hurdle rate of 8%)
+IRR: Solve 0 = -$250,000 + Σ $@{irrigation_net_benefit}/(1+IRR)^t
+      IRR = @{irrigation_irr_pct}% (hurdle rate 8%)
 
-Simple payback: $250,000 / ${0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175:,.0f} = {250000/(0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175):.1f} years
+Simple payback: $250,000 / $@{irrigation_net_benefit} = @{irrigation_payback_years} years
 
-Discounted payback: 6.8 years (solving for t when cumulative discounted CF = 0)
+Discounted payback: @{irrigation_discounted_payback} (solving for t when cumulative discounted CF = 0)
 
 Financing scenario: 70% debt ($175K at 6.5% for 10 years) → annual debt service $24,100; cash-on-cash return on $75K equity = [calc] ≈ 22%]
 
@@ -517,14 +1340,14 @@ Financing scenario: 70% debt ($175K at 6.5% for 10 years) → annual debt servic
 **Decision: YES, recommend irrigation investment.**
 
 Rationale:
-1. NPV > 0 (${(0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175)*9.818 - 250000:,.0f}) and IRR (15.3%) exceeds cost of capital (8%)
+1. NPV of $@{irrigation_npv} and IRR of @{irrigation_irr_pct}% against an 8% cost of capital
 2. Risk reduction: 50% drop in profit volatility, critical for lender requirements and family cash flow stability
-3. Payback ({250000/(0.85*int(SCENARIO_DATA['baseline_yield']*SCENARIO_DATA['irrigation_yield_boost'])*5.20*SCENARIO_DATA['irrigation_acres'] + 0.15*(int(SCENARIO_DATA['baseline_yield']*(1+SCENARIO_DATA['irrigation_yield_boost'])) - SCENARIO_DATA['drought_yield'])*5.60*SCENARIO_DATA['irrigation_acres'] - 9175):.1f} years) acceptable for 20+ year asset life
+3. Payback (@{irrigation_payback_years} years) acceptable for 20+ year asset life
 
 Decision triggers (proceed if):
 - Water rights secured (Iowa permits available for 200 gpm well)
 - Electricity cost < $0.15/kWh (currently $0.12, provides $0.03 cushion)
-- Corn price forecast ≥ $4.50/bu (current $5.20, 15% margin)
+- Corn price forecast ≥ $4.50/bu (current $@{normal_price}, @{price_margin_pct}% margin)
 
 Constraints/Risks:
 - Aquifer depletion: Monitor static water level (currently 80 ft, sustainable if <200 ft)
@@ -535,16 +1358,16 @@ Next steps:
 1. Secure water rights permit (3-month process)
 2. Soil survey for system design (2 weeks, $1,200)
 3. Obtain financing quotes (target ≤7% rate)
-4. Order equipment by November for March installation]
+4. Order equipment by November for March installation]""")
 
-Write complete, quantified prose with all calculations shown."""
+def part5_prompt():
+    """Build the prompt for Part 5: Recommendations (≥500 words)"""
+    return TEMPLATE_PART5.substitute(PROMPT_CONTEXT)
 
-    return chat(prompt, max_tokens=4000)
 
-def generate_notation_and_figures():
-    """Generate notation block and figures list"""
-    
-    prompt = """Generate the final sections for the MTFC paper:
+def notation_prompt():
+    """Build the prompt for the notation block and figures list"""
+    return """Generate the final sections for the MTFC paper:
 
 Notation Block
 
@@ -600,25 +1423,20 @@ Table 5: Baseline vs Mitigation Loss Comparison
 
 Write complete listing with all concrete numbers."""
 
-    return chat(prompt, max_tokens=2000)
-
-def assemble_full_paper(parts):
-    """Assemble all parts into complete paper"""
-    
-    header = f"""MTFC Scenario Quest Response 2025-26
+PAPER_HEADER = """MTFC Scenario Quest Response 2025-26
 
 Team Name: Cornalytics Solutions
 Team ID #: 47821
 
 """
-    
-    full_paper = header
-    for part in parts:
-        full_paper += part + "\n\n"
-    
-    return full_paper
 
-def score_paper(paper_text):
+def assemble_full_paper(parts):
+    """Assemble all parts into complete paper"""
+    return PAPER_HEADER + "".join(part + "\n\n" for part in parts)
+
+_BARE_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+async def score_paper(paper_text):
     """Generate scorecard for the paper"""
     
     prompt = f"""Score this MTFC paper against the Ultra-Strict Rubric (target ≥98/100).
@@ -658,11 +1476,10 @@ Return JSON:
   "status": "DONE if ≥98, else CONTINUE"
 }}"""
 
-    response = chat(prompt, max_tokens=1500)
+    response = await chat([{"role": "user", "content": prompt}], max_tokens=1500, semantic=False)
     
     # Extract JSON
-    import re
-    json_match = re.search(r'\{.*\}', response, re.DOTALL)
+    json_match = _BARE_JSON_RE.search(response)
     if json_match:
         try:
             return json.loads(json_match.group(0))
@@ -670,16 +1487,293 @@ Return JSON:
             return None
     return None
 
-def main():
+PROMPT_BUILDERS = [part1_prompt, part2_prompt, part3_prompt, part4_prompt, part5_prompt, notation_prompt]
+
+# Prefix caching only fires if every section opens with the same system bytes
+assert len({part_messages(build())[0]["content"] for build in PROMPT_BUILDERS}) == 1
+
+# max_tokens budgets follow each part's word target (about 1.6 tokens per word
+# plus a 30% margin); chat() retries with a larger budget if one is too small
+SECTION_MAX_TOKENS = [800, 2200, 2400, 2000, 1400, 2000]
+SECTION_CHECKPOINTS = ["part1", "part2", "part3", "part4", "part5", "notation"]
+
+async def generate_section(index):
+    """Generate one section (parts 1-5, then the notation block) from its prompt
+    
+    A section checkpointed by an earlier, interrupted run is reused as is.
+    """
+    name = SECTION_CHECKPOINTS[index]
+    return await cached_generate(name, lambda: chat(
+        part_messages(PROMPT_BUILDERS[index]()),
+        max_tokens=SECTION_MAX_TOKENS[index],
+        stream_path=PARTS_DIR / f"{name}.partial",
+    ))
+
+async def generate_part1():
+    """Generate Part 1: Project Definition (≥300 words)"""
+    return await generate_section(0)
+
+async def generate_part2():
+    """Generate Part 2: Data Identification & Assessment (≥900 words)"""
+    return await generate_section(1)
+
+async def generate_part3():
+    """Generate Part 3: Mathematical Modeling (≥900 words)"""
+    return await generate_section(2)
+
+async def generate_part4():
+    """Generate Part 4: Risk Analysis (≥700 words)"""
+    return await generate_section(3)
+
+async def generate_part5():
+    """Generate Part 5: Recommendations (≥500 words)"""
+    return await generate_section(4)
+
+async def generate_notation_and_figures():
+    """Generate notation block and figures list"""
+    return await generate_section(5)
+
+async def build_all():
+    """Generate the five paper parts and the notation block concurrently
+    
+    One failing section doesn't cancel the rest, so every section that did
+    finish is checkpointed before the failure is raised.
+    """
+    results = await asyncio.gather(
+        generate_part1(),
+        generate_part2(),
+        generate_part3(),
+        generate_part4(),
+        generate_part5(),
+        generate_notation_and_figures(),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+PART_KEYS = ["part1", "part2", "part3", "part4", "part5"]
+
+# Rubric category -> (index of the section it mainly grades, maximum points)
+CATEGORY_SECTIONS = {
+    "Project Definition": (0, 15),
+    "Data Identification & Assessment": (1, 20),
+    "Mathematical Modeling": (2, 25),
+    "Risk Analysis": (3, 20),
+    "Recommendations": (4, 15),
+    "Communication & Clarity": (5, 5),
+}
+SECTION_NAMES = ["Part 1", "Part 2", "Part 3", "Part 4", "Part 5", "Notation/Figures"]
+
+def weak_sections(scorecard):
+    """Indices of the sections whose rubric category lost points"""
+    weak = set()
+    for category, (index, max_points) in CATEGORY_SECTIONS.items():
+        score = scorecard.get(category)
+        if isinstance(score, (int, float)) and score < max_points:
+            weak.add(index)
+    return sorted(weak)
+
+async def revise_section(index, draft, deductions):
+    """Rewrite one section from its original prompt, its draft and the judges' deductions"""
+    listed = "\n".join(f"- {d}" for d in deductions) or "- (none listed; raise quantification and completeness)"
+    prompt = f"""{PROMPT_BUILDERS[index]()}
+
+A previous draft of this section scored below full marks. Rewrite the section in full, keeping
+everything that works and fixing each deduction below that applies to it.
+
+DEDUCTIONS (whole paper):
+{listed}
+
+PREVIOUS DRAFT:
+{draft}"""
+    # Exact-match cache only: a revision prompt embeds close to the original
+    # section prompt, so a semantic hit would just return the old draft
+    name = SECTION_CHECKPOINTS[index]
+    text = await chat(
+        part_messages(prompt),
+        max_tokens=SECTION_MAX_TOKENS[index],
+        stream_path=PARTS_DIR / f"{name}.partial",
+        semantic=False,
+    )
+    await checkpoint(name, text)
+    return text
+
+def mega_prompt():
+    """Build one request covering all five parts, answered as a JSON object"""
+    builders = [part1_prompt, part2_prompt, part3_prompt, part4_prompt, part5_prompt]
+    sections = "\n\n".join(
+        f"### SECTION {key}:\n{build()}" for key, build in zip(PART_KEYS, builders)
+    )
+    return f"""Write all five parts of the MTFC paper in one response. Each section below gives the instructions for one part.
+
+{sections}
+
+Return ONLY a JSON object with exactly these keys: {", ".join(f'"{key}"' for key in PART_KEYS)}.
+Each value is the complete text of that part as a single string, following its section instructions."""
+
+async def build_parts_combined():
+    """Generate all five parts in one JSON-mode request
+    
+    The shared preamble is uploaded once instead of five times. Any part that is
+    missing from the response (or the whole response, if it was truncated and
+    cannot be parsed) is regenerated individually.
+    """
+    parts = {}
+    try:
+        response = await chat(
+            part_messages(mega_prompt()),
+            max_tokens=MAX_TOKENS_CEILING,
+            response_format={"type": "json_object"},
+        )
+        parts = json.loads(response)
+    except (json.JSONDecodeError, TypeError) as e:
+        print(f"⚠️ Combined response could not be parsed ({e}), regenerating each part...")
+    if not isinstance(parts, dict):
+        parts = {}
+    
+    generators = [generate_part1, generate_part2, generate_part3, generate_part4, generate_part5]
+    missing = [
+        i for i, key in enumerate(PART_KEYS)
+        if not isinstance(parts.get(key), str) or not parts[key].strip()
+    ]
+    if missing and parts:
+        print(f"⚠️ Regenerating missing parts: {', '.join(PART_KEYS[i] for i in missing)}")
+    regenerated = await asyncio.gather(*(generators[i]() for i in missing))
+    for i, text in zip(missing, regenerated):
+        parts[PART_KEYS[i]] = text
+    
+    return [parts[key] for key in PART_KEYS]
+
+async def build_all_combined():
+    """Generate the five parts as one combined request alongside the notation block"""
+    parts, notation = await asyncio.gather(
+        build_parts_combined(),
+        generate_notation_and_figures(),
+    )
+    return [*parts, notation]
+
+class PaperTable(BaseModel):
+    """A table the model fills in; rendered to a pipe table in Python"""
+    model_config = ConfigDict(extra="forbid")
+    
+    title: str = Field(description='Table caption, e.g. "Table 1: Per-Acre Planting Cost Breakdown"')
+    columns: List[str]
+    rows: List[List[str]]
+
+class PaperItem(BaseModel):
+    """One numbered #N item of a part"""
+    model_config = ConfigDict(extra="forbid")
+    
+    heading: str = Field(description='Item heading exactly as given in the instructions, e.g. "#12: October sale"')
+    body: str = Field(description="Complete prose for the item with every calculation shown; no tables")
+    tables: List[PaperTable] = Field(description="Tables requested for this item, in order")
+
+class PartSchema(BaseModel):
+    """Structured output for one part of the paper"""
+    model_config = ConfigDict(extra="forbid")
+    
+    title: str = Field(description='Part title, e.g. "Part 2: Data Identification & Assessment"')
+    items: List[PaperItem]
+
+def part_response_format(key):
+    """Strict json_schema response format for one part"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": key, "schema": PartSchema.model_json_schema(), "strict": True},
+    }
+
+def render_part(part):
+    """Render a structured part as the paper's plain-text layout"""
+    lines = [part.title, ""]
+    for item in part.items:
+        lines += [item.heading, "", item.body.strip(), ""]
+        for table in item.tables:
+            lines += [table.title, "", "| " + " | ".join(table.columns) + " |",
+                      "|" + "|".join("---" for _ in table.columns) + "|"]
+            lines += ["| " + " | ".join(row) + " |" for row in table.rows]
+            lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+async def generate_part_structured(key, prompt_builder, fallback, max_tokens):
+    """Generate one part as schema-validated JSON and render it in Python
+    
+    Falls back to the free-text generator if the response does not validate.
+    """
+    checkpoint_path = PARTS_DIR / f"{key}.txt"
+    if checkpoint_path.exists():
+        print(f"♻️ Resuming {key} from {checkpoint_path}")
+        return await asyncio.to_thread(checkpoint_path.read_text, encoding="utf-8")
+    prompt = prompt_builder() + "\n\nReturn the part as JSON matching the schema: one entry in items per #N heading, with tables in their item's tables list."
+    response = await chat(
+        part_messages(prompt),
+        max_tokens=max_tokens,
+        response_format=part_response_format(key),
+        stream_path=PARTS_DIR / f"{key}.json",
+    )
+    try:
+        part = PartSchema.model_validate_json(response)
+    except ValidationError as e:
+        print(f"⚠️ {key} structured output did not validate ({e.error_count()} errors), regenerating as text...")
+        return await fallback()
+    text = render_part(part)
+    await checkpoint(key, text)
+    return text
+
+async def build_all_structured():
+    """Generate the five parts as structured outputs alongside the notation block"""
+    # JSON keys and quoting add overhead, so each budget gets 25% headroom
+    specs = [
+        ("part1", part1_prompt, generate_part1, 1000),
+        ("part2", part2_prompt, generate_part2, 2750),
+        ("part3", part3_prompt, generate_part3, 3000),
+        ("part4", part4_prompt, generate_part4, 2500),
+        ("part5", part5_prompt, generate_part5, 1750),
+    ]
+    return await asyncio.gather(
+        *(generate_part_structured(*spec) for spec in specs),
+        generate_notation_and_figures(),
+    )
+
+async def build_all_batch():
+    """Submit the five parts and the notation block as one OpenAI Batch API job
+    
+    Batch jobs cost half as much and bypass the synchronous rate limits, but can
+    take up to 24 hours, so this is only used with --batch.
+    """
+    prompts = [
+        part1_prompt(),
+        part2_prompt(),
+        part3_prompt(),
+        part4_prompt(),
+        part5_prompt(),
+        notation_prompt(),
+    ]
+    return await asyncio.to_thread(
+        batch_generate,
+        prompts,
+        model="gpt-4o-mini",
+        system_prompt=SHARED_PREAMBLE,
+        temperature=0,
+        max_tokens=4000,
+    )
+
+async def main(use_batch=False, combined=False, structured=False):
+    SAVE_DIR.mkdir(exist_ok=True)
+    
     print("="*90)
     print("MTFC COMPREHENSIVE BUILDER - Section-by-Section Generation")
     print("="*90)
     print(f"Target: ≥98/100, Total: 3,400+ words")
-    print(f"Scenario: {SCENARIO_DATA['farmer']}, {SCENARIO_DATA['acres']}-acre Iowa corn farm")
+    print(f"Scenario: {S.farmer}, {S.acres}-acre Iowa corn farm")
     print("="*90)
     
     iteration = 1
     max_iterations = 3
+    parts = None
+    score_result = None
+    failed = False
     
     while iteration <= max_iterations:
         print(f"\n{'='*90}")
@@ -687,38 +1781,38 @@ def main():
         print(f"{'='*90}\n")
         
         try:
-            # Generate each part
-            print("📝 Generating Part 1: Project Definition...")
-            part1 = generate_part1()
-            time.sleep(2)
-            
-            print("📝 Generating Part 2: Data Identification & Assessment...")
-            part2 = generate_part2()
-            time.sleep(2)
-            
-            print("📝 Generating Part 3: Mathematical Modeling...")
-            part3 = generate_part3()
-            time.sleep(2)
-            
-            print("📝 Generating Part 4: Risk Analysis...")
-            part4 = generate_part4()
-            time.sleep(2)
-            
-            print("📝 Generating Part 5: Recommendations...")
-            part5 = generate_part5()
-            time.sleep(2)
-            
-            print("📝 Generating Notation Block and Figures List...")
-            notation = generate_notation_and_figures()
+            if parts is None:
+                # Generate all parts concurrently, or as one batch job
+                print("📝 Generating Parts 1-5, Notation Block and Figures List...")
+                if use_batch:
+                    parts = await build_all_batch()
+                elif combined:
+                    parts = await build_all_combined()
+                elif structured:
+                    parts = await build_all_structured()
+                else:
+                    parts = await build_all()
+                parts = list(parts)
+            else:
+                # Decoding is deterministic, so only the sections that lost
+                # points are rewritten, guided by the scorecard deductions
+                weak = weak_sections(score_result.get("scorecard", {}))
+                if not weak:
+                    print("⚠️ No rubric category below full marks to revise, stopping")
+                    break
+                print(f"✏️ Revising {', '.join(SECTION_NAMES[i] for i in weak)} from the deductions...")
+                deductions = score_result.get("deductions", [])
+                revised = await asyncio.gather(*(revise_section(i, parts[i], deductions) for i in weak))
+                for i, text in zip(weak, revised):
+                    parts[i] = text
             
             # Assemble
             print("\n🔧 Assembling complete paper...")
-            full_paper = assemble_full_paper([part1, part2, part3, part4, part5, notation])
+            full_paper = assemble_full_paper(parts)
             
             # Save
             paper_file = SAVE_DIR / f"paper_iteration_{iteration}.txt"
-            with open(paper_file, "w") as f:
-                f.write(full_paper)
+            await write_text(paper_file, full_paper)
             
             word_count = len(full_paper.split())
             
@@ -727,7 +1821,7 @@ def main():
             
             # Score
             print("\n📊 Scoring paper...")
-            score_result = score_paper(full_paper)
+            score_result = await score_paper(full_paper)
             
             if score_result:
                 scorecard = score_result.get("scorecard", {})
@@ -768,23 +1862,26 @@ def main():
                     
                     # Save final
                     final_file = SAVE_DIR / "FINAL_COMPREHENSIVE_PAPER.txt"
-                    with open(final_file, "w") as f:
-                        f.write(full_paper)
+                    await write_text(final_file, full_paper)
                     
                     print(f"\n✓ Final paper saved: {final_file}")
                     print(f"✓ Word count: {word_count:,}")
                     break
             else:
-                print("⚠️ Could not parse score, continuing...")
+                print("⚠️ Could not parse score, stopping (nothing to target a revision at)")
+                break
             
             iteration += 1
             
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("❌ Error in iteration %d", iteration)
+            failed = True
             break
     
+    # Keep the checkpoints after a failure so a rerun resumes from them
+    if not failed:
+        clear_checkpoints()
+    
     # Create FINISHED marker
     with open("FINISHED_COMPREHENSIVE.txt", "w") as f:
         f.write(f"""MTFC COMPREHENSIVE BUILDER - COMPLETED
@@ -812,14 +1909,59 @@ Output Files:
     print(f"{'='*90}")
     print(f"✓ FINISHED_COMPREHENSIVE.txt created")
     print(f"✓ All files in: {SAVE_DIR}/")
+    if semantic_stats["lookups"]:
+        print(f"✓ Semantic cache hits: {semantic_stats['hits']}/{semantic_stats['lookups']} "
+              f"({semantic_stats['hits']/semantic_stats['lookups']:.0%})")
+    
+    if _client is not None:
+        await _client.close()
 
 if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    parser = argparse.ArgumentParser(description="MTFC Comprehensive Builder")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the API instead of reusing cached responses"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Delete cached responses before generating"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Generate parts through the OpenAI Batch API (50%% cheaper, up to 24h turnaround)"
+    )
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="Request all five parts in one JSON response (one preamble upload instead of five)"
+    )
+    parser.add_argument(
+        "--no-semantic-cache",
+        action="store_true",
+        help="Only reuse byte-identical requests, skipping the embedding-similarity cache"
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        help="Request each part as schema-validated JSON and render the layout in Python"
+    )
+    args = parser.parse_args()
+    
+    if args.clear_cache:
+        cache.clear()
+        clear_checkpoints()
+        print(f"🧹 Cleared response cache: {cache.directory} and section checkpoints: {PARTS_DIR}")
+    cache.enabled = not args.no_cache
+    SEMANTIC_CACHE_ENABLED = not args.no_semantic_cache
+    
     try:
-        main()
+        asyncio.run(main(use_batch=args.batch, combined=args.combined, structured=args.structured))
     except KeyboardInterrupt:
         print("\n\n⚠️ Interrupted by user")
-    except Exception as e:
-        print(f"\n\n❌ Fatal error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("\n\n❌ Fatal error")
 
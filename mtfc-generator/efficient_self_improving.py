@@ -6,7 +6,10 @@ Works with file references to handle large papers
 
 import os
 import json
+import re
 import time
+import hashlib
+from collections import Counter
 from pathlib import Path
 from openai import OpenAI
 from dotenv import load_dotenv
@@ -25,8 +28,93 @@ SAVE_DIR.mkdir(exist_ok=True)
 
 INITIAL_PAPER_PATH = Path("mtfc_comprehensive/FINAL_COMPREHENSIVE_PAPER.txt")
 
-def chat(prompt, model="gpt-4-turbo", max_tokens=3000):
-    """Call OpenAI API"""
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None  # pyahocorasick not installed, fall back to str.count
+
+# Every substring evaluate_paper_summary checks for or counts
+PAPER_MARKERS = (
+    "Part 1: Project Definition", "Part 2: Data Identification", "Part 3: Mathematical Modeling",
+    "Part 4: Risk Analysis", "Part 5: Recommendations", "Notation Block", "Figures and Tables",
+    "Table", "Figure", "NPV", "IRR", "EV", "Expected Value", "regression", "Regression"
+)
+
+def _build_automaton(tokens):
+    """Build an Aho-Corasick automaton matching every token"""
+    automaton = ahocorasick.Automaton()
+    for token in tokens:
+        automaton.add_word(token, token)
+    automaton.make_automaton()
+    return automaton
+
+_AUTOMATON = _build_automaton(PAPER_MARKERS) if ahocorasick else None
+
+def count_markers(text):
+    """Count occurrences of every paper marker in a single pass over text"""
+    if _AUTOMATON is None:
+        return Counter({marker: text.count(marker) for marker in PAPER_MARKERS})
+    return Counter(marker for _, marker in _AUTOMATON.iter(text))
+
+def paper_stats(paper_text):
+    """Word count and marker counts for a paper, computed once and shared by callers"""
+    return len(paper_text.split()), count_markers(paper_text)
+
+# Responses are memoized on disk by request hash, so re-evaluating an
+# unchanged paper costs a file read instead of an API call
+CACHE_DIR = SAVE_DIR / "cache"
+# MTFC_NOCACHE=1 bypasses it, as for the shared cache in src/llm_cache.py
+CACHE_ENABLED = os.getenv("MTFC_NOCACHE") != "1"
+
+def _read_until_json_closes(stream, opener="{"):
+    """Collect streamed text, closing the stream once the first JSON value opened by opener is complete
+    
+    Anything the model would write after the JSON is never parsed, so there is
+    no point waiting for it. Brackets in prose before the first opener (e.g.
+    "[see section 3]") and inside JSON strings are ignored. Falls back to the
+    full text if no JSON closes.
+    """
+    pieces = []
+    depth = 0
+    in_string = escaped = False
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        piece = chunk.choices[0].delta.content or ""
+        pieces.append(piece)
+        for ch in piece:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif not depth:
+                if ch == opener:
+                    depth = 1
+            elif ch == '"':
+                in_string = True
+            elif ch in "{[":
+                depth += 1
+            elif ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    stream.close()
+                    return "".join(pieces)
+    return "".join(pieces)
+
+def chat(prompt, model="gpt-4-turbo", max_tokens=3000, opener="{"):
+    """Call OpenAI API, serving repeated requests from the disk cache
+    
+    Every prompt here asks for JSON, so the reply is streamed and cut off as
+    soon as the JSON value starting with opener ("{" or "[") closes.
+    """
+    key = hashlib.sha256(f"{model}|{max_tokens}|{prompt}".encode("utf-8")).hexdigest()
+    cache_path = CACHE_DIR / f"{key}.txt"
+    if CACHE_ENABLED and cache_path.exists():
+        print("  (cached response)")
+        return cache_path.read_text(encoding="utf-8")
     try:
         completion = client.chat.completions.create(
             model=model,
@@ -35,20 +123,27 @@ def chat(prompt, model="gpt-4-turbo", max_tokens=3000):
             ],
             temperature=0.7,
             max_tokens=max_tokens,
+            stream=True,
         )
-        return completion.choices[0].message.content
+        response = _read_until_json_closes(completion, opener)
     except Exception as e:
         print(f"❌ API Error: {e}")
         raise
+    if CACHE_ENABLED and response is not None:
+        CACHE_DIR.mkdir(exist_ok=True)
+        cache_path.write_text(response, encoding="utf-8")
+    return response
+
+_FENCED_JSON_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_BARE_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
 
 def extract_json(response):
     """Extract JSON from response"""
-    import re
-    json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response, re.DOTALL)
+    json_match = _FENCED_JSON_RE.search(response)
     if json_match:
         json_str = json_match.group(1)
     else:
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
+        json_match = _BARE_JSON_RE.search(response)
         if json_match:
             json_str = json_match.group(0)
         else:
@@ -60,33 +155,158 @@ def extract_json(response):
         print(f"⚠️ JSON parse error: {e}")
         return None
 
-def evaluate_paper_summary(paper_text):
-    """Evaluate paper and return scores"""
+# Part titles, numbered items and the closing blocks, with or without markdown #'s or bold
+_HEADING_RE = re.compile(
+    r"^(?:#+\s*)?\**(Part [1-5]:.*?|#\d+[^:\n]*:.*?|Notation Block.*?|Figures and Tables.*?)\**\s*$",
+    re.MULTILINE
+)
+
+def paper_digest(paper_text):
+    """Summarize a paper as a heading outline with per-section word counts
     
-    # Create a summary for evaluation
-    word_count = len(paper_text.split())
-    has_part1 = "Part 1: Project Definition" in paper_text
-    has_part2 = "Part 2: Data Identification" in paper_text
-    has_part3 = "Part 3: Mathematical Modeling" in paper_text
-    has_part4 = "Part 4: Risk Analysis" in paper_text
-    has_part5 = "Part 5: Recommendations" in paper_text
-    has_notation = "Notation Block" in paper_text
-    has_figures = "Figures and Tables" in paper_text
+    Returns the outline text and the notation block, which together stand in
+    for raw paper text in the evaluation prompt.
+    """
+    headings = list(_HEADING_RE.finditer(paper_text))
+    outline = []
+    notation = ""
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(paper_text)
+        body = paper_text[match.end():end]
+        title = match.group(1).strip()
+        indent = "  " if title.startswith("#") else ""
+        outline.append(f"{indent}- {title}: {len(body.split())} words")
+        if title.startswith("Notation Block"):
+            notation = body.strip()
+    return "\n".join(outline) or "(no section headings found)", notation or "(missing)"
+
+# Part boundaries; the closing Notation/Figures blocks end Part 5
+_PART_RE = re.compile(
+    r"^(?:#+\s*)?\**(?:Part ([1-5]):|Notation Block|Figures and Tables)",
+    re.MULTILINE
+)
+
+# Counting rules for the five categories that don't need judgment:
+# (category, part, points, pattern, minimum matches in that part, deduction)
+RULES = (
+    ("Project Definition", 1, 2, r"\S", 1, "Part 1 is missing"),
+    ("Project Definition", 1, 3, r"(?i)farmer|lender|landowner|stakeholder|famil", 1, "Part 1 does not name who is at risk"),
+    ("Project Definition", 1, 4, r"\$\s?\d[\d,]*|\d+(?:\.\d+)?\s?%", 2, "Part 1 risks are not quantified"),
+    ("Project Definition", 1, 2, r"(?i)insurance", 1, "Part 1 omits crop insurance as a mitigation"),
+    ("Project Definition", 1, 2, r"(?i)irrigat", 1, "Part 1 omits irrigation as a mitigation"),
+    ("Project Definition", 1, 2, r"(?i)silo|storage", 1, "Part 1 omits grain storage as a mitigation"),
+    ("Data Identification & Assessment", 2, 3, r"\S", 1, "Part 2 is missing"),
+    ("Data Identification & Assessment", 2, 5, r"Table \d", 2, "Part 2 has fewer than 2 numbered tables"),
+    ("Data Identification & Assessment", 2, 4, r"Figure \d", 1, "Part 2 has no numbered figure"),
+    ("Data Identification & Assessment", 2, 4, r"USDA|NASS|RMA|(?i:source)", 1, "Part 2 does not cite its data sources"),
+    ("Data Identification & Assessment", 2, 4, r"\$\s?\d", 5, "Part 2 reports too few dollar figures"),
+    ("Mathematical Modeling", 3, 3, r"\S", 1, "Part 3 is missing"),
+    ("Mathematical Modeling", 3, 6, r"=\s*-?\d[\d,.]*\s*[+\-−]\s*\d[\d,.]*\s*(?:[×x*·]|\\cdot|\\times)?\s*\\?\(?[A-Za-z]", 1,
+     "Part 3 has no fitted regression equation"),
+    ("Mathematical Modeling", 3, 4, r"R²|R\^2|(?i:r-squared|p-value|residual)", 1, "Part 3 reports no regression diagnostics"),
+    ("Mathematical Modeling", 3, 6, r"(?:\bEV\b|(?i:expected value))[^\n]*?\$\s?-?\d", 1, "Part 3 does not put a dollar figure on EV"),
+    ("Mathematical Modeling", 3, 3, r"(?i)sensitiv", 1, "Part 3 has no sensitivity analysis"),
+    ("Mathematical Modeling", 3, 3, r"(?i)assum", 1, "Part 3 does not state its assumptions"),
+    ("Risk Analysis", 4, 3, r"\S", 1, "Part 4 is missing"),
+    ("Risk Analysis", 4, 6, r"(?i)baseline[^\n]*mitigat|2\s*[×x]\s*2", 1, "Part 4 has no baseline vs mitigation comparison"),
+    ("Risk Analysis", 4, 5, r"(?i)\btail\b|\bVaR\b|percentile|\b9[59]\s?%|worst", 1, "Part 4 has no tail-risk analysis"),
+    ("Risk Analysis", 4, 2, r"(?i)insurance", 1, "Part 4 does not analyze crop insurance"),
+    ("Risk Analysis", 4, 2, r"(?i)irrigat", 1, "Part 4 does not analyze irrigation"),
+    ("Risk Analysis", 4, 2, r"(?i)silo|storage", 1, "Part 4 does not analyze grain storage"),
+    ("Recommendations", 5, 2, r"\S", 1, "Part 5 is missing"),
+    ("Recommendations", 5, 4, r"\bNPV\b[^\n]*?=\s*[-−]?\\?\$?\s?[-−]?\d", 1, "Part 5 does not compute an NPV"),
+    ("Recommendations", 5, 3, r"\bIRR\b[^\n]*?\d(?:\.\d+)?\s?%", 1, "Part 5 does not report an IRR"),
+    ("Recommendations", 5, 2, r"(?i)payback", 1, "Part 5 does not report a payback period"),
+    ("Recommendations", 5, 2, r"(?i)trigger|threshold", 1, "Part 5 gives no decision triggers"),
+    ("Recommendations", 5, 1, r"(?i)insurance", 1, "Part 5 does not address crop insurance"),
+    ("Recommendations", 5, 1, r"(?i)silo|storage", 1, "Part 5 does not address grain storage"),
+)
+_COMPILED_RULES = tuple(
+    (category, part, points, re.compile(pattern), minimum, deduction)
+    for category, part, points, pattern, minimum, deduction in RULES
+)
+RULE_CATEGORIES = tuple(dict.fromkeys(rule[0] for rule in RULES))
+
+def _part_bodies(paper_text):
+    """Map part number to that part's text"""
+    bounds = list(_PART_RE.finditer(paper_text))
+    bodies = {}
+    for i, match in enumerate(bounds):
+        if match.group(1):
+            end = bounds[i + 1].start() if i + 1 < len(bounds) else len(paper_text)
+            bodies[int(match.group(1))] = paper_text[match.end():end]
+    return bodies
+
+def score_deterministic(paper_text):
+    """Score the rule-checkable categories locally, without an API call
+    
+    Returns a scorecard with "scores" for every category in RULE_CATEGORIES and
+    a "deductions" entry for each rule that failed.
+    """
+    bodies = _part_bodies(paper_text)
+    scores = dict.fromkeys(RULE_CATEGORIES, 0)
+    deductions = []
+    for category, part, points, pattern, minimum, deduction in _COMPILED_RULES:
+        matches = pattern.finditer(bodies.get(part, ""))
+        if sum(1 for _, _ in zip(range(minimum), matches)) >= minimum:
+            scores[category] += points
+        else:
+            deductions.append(f"{deduction} (-{points} {category})")
+    return {"scores": scores, "deductions": deductions}
+
+# Only the categories that need judgment go to the model, and the rubric is
+# sent once per call whether one paper or a batch is evaluated
+RUBRIC = """RUBRIC (these categories only; the other 95 points are scored by rule):
+- Communication & Clarity (5): Clean numbering, notation, labeled visuals
+- Excellence Boosters (+0-3): Need ≥3 of: 95/99% tail, second model, financing, triggers, portfolio, risk register"""
+
+SCORECARD_FORMAT = """{
+  "scores": {
+    "Communication & Clarity": 0-5,
+    "Excellence_Boosters": 0-3
+  },
+  "deductions": ["reason1", "reason2"],
+  "strengths": ["strength1", "strength2"]
+}"""
+
+def merge_scorecards(rule_card, llm_card):
+    """Combine the rule-based and model scorecards into one with a Total and status"""
+    llm_card = llm_card or {"deductions": ["Communication & Clarity and Excellence Boosters could not be scored"]}
+    llm_scores = llm_card.get("scores", {})
+    scores = dict(rule_card["scores"])
+    for category in ("Communication & Clarity", "Excellence_Boosters"):
+        scores[category] = llm_scores.get(category, 0)
+    scores["Total"] = sum(scores.values())
+    return {
+        "scores": scores,
+        "deductions": rule_card["deductions"] + llm_card.get("deductions", []),
+        "strengths": llm_card.get("strengths", []),
+        "status": "DONE" if scores["Total"] >= 96 else "CONTINUE",
+    }
+
+def paper_summary(paper_text, stats=None):
+    """Statistics, section outline and notation block that stand in for a paper's text"""
+    word_count, hits = stats or paper_stats(paper_text)
+    has_part1 = hits["Part 1: Project Definition"] > 0
+    has_part2 = hits["Part 2: Data Identification"] > 0
+    has_part3 = hits["Part 3: Mathematical Modeling"] > 0
+    has_part4 = hits["Part 4: Risk Analysis"] > 0
+    has_part5 = hits["Part 5: Recommendations"] > 0
+    has_notation = hits["Notation Block"] > 0
+    has_figures = hits["Figures and Tables"] > 0
     
     # Count tables and quantitative elements
-    table_count = paper_text.count("Table")
-    figure_count = paper_text.count("Figure")
-    has_npv = "NPV" in paper_text
-    has_irr = "IRR" in paper_text
-    has_ev = "EV" in paper_text or "Expected Value" in paper_text
-    has_regression = "regression" in paper_text or "Regression" in paper_text
+    table_count = hits["Table"]
+    figure_count = hits["Figure"]
+    has_npv = hits["NPV"] > 0
+    has_irr = hits["IRR"] > 0
+    has_ev = hits["EV"] > 0 or hits["Expected Value"] > 0
+    has_regression = hits["regression"] > 0 or hits["Regression"] > 0
     
-    # Extract first 2000 chars for detailed review
-    sample = paper_text[:2000]
+    # Heading outline and notation block instead of raw prose, to keep the prompt small
+    outline, notation = paper_digest(paper_text)
     
-    prompt = f"""Evaluate this MTFC Scenario Quest Response paper against the rubric.
-
-PAPER STATISTICS:
+    return f"""PAPER STATISTICS:
 - Word count: {word_count}
 - Has Part 1 (Project Definition): {has_part1}
 - Has Part 2 (Data ID & Assessment): {has_part2}
@@ -101,38 +321,75 @@ PAPER STATISTICS:
 - Has EV calculations: {has_ev}
 - Has regression analysis: {has_regression}
 
-PAPER SAMPLE (first 2000 chars):
-{sample}
+SECTION OUTLINE (heading: words in that section):
+{outline}
 
-RUBRIC (Total 100 + up to 3 bonus):
-- Project Definition (15): Quantified risks, stakeholders, 3 mitigation categories
-- Data Identification & Assessment (20): Data mapping, tables, 2+ visuals
-- Mathematical Modeling (25): Equations, EV math, sensitivity, diagnostics
-- Risk Analysis (20): 2×2 table, tail analysis, baseline vs mitigation
-- Recommendations (15): NPV/IRR/payback, triggers, all 3 mitigation categories
-- Communication & Clarity (5): Clean numbering, notation, labeled visuals
-- Excellence Boosters (+0-3): Need ≥3 of: 95/99% tail, second model, financing, triggers, portfolio, risk register
+NOTATION BLOCK:
+{notation}"""
 
-Based on the statistics and sample, score each category and provide:
+def evaluate_paper_summary(paper_text, stats=None):
+    """Evaluate paper and return scores
+    
+    The five counting-based categories come from score_deterministic; only
+    Communication & Clarity and the Excellence Boosters are asked of the model.
+    stats is the (word_count, hits) pair from paper_stats, if the caller already has it.
+    """
+    prompt = f"""Evaluate this MTFC Scenario Quest Response paper against the rubric.
 
-{{
-  "scores": {{
-    "Project Definition": 0-15,
-    "Data Identification & Assessment": 0-20,
-    "Mathematical Modeling": 0-25,
-    "Risk Analysis": 0-20,
-    "Recommendations": 0-15,
-    "Communication & Clarity": 0-5,
-    "Excellence_Boosters": 0-3,
-    "Total": 0-103
-  }},
-  "deductions": ["reason1", "reason2"],
-  "strengths": ["strength1", "strength2"],
-  "status": "DONE if ≥96, else CONTINUE"
-}}"""
+{paper_summary(paper_text, stats)}
+
+{RUBRIC}
+
+Based on the statistics, outline and notation block, score each category and provide:
+
+{SCORECARD_FORMAT}"""
+    
+    response = chat(prompt, max_tokens=1000)
+    return merge_scorecards(score_deterministic(paper_text), extract_json(response))
+
+_FENCED_JSON_ARRAY_RE = re.compile(r'```(?:json)?\s*(\[.*?\])\s*```', re.DOTALL)
+_BARE_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+def evaluate_papers_batch(papers):
+    """Evaluate several candidate papers in one call and return a scorecard per paper
     
-    response = chat(prompt, max_tokens=1500)
-    return extract_json(response)
+    The rubric and output format are sent once for the whole batch, and each
+    paper's model scores are merged with its rule-based ones. Returns a list in
+    the same order as papers, or None if the response is not a JSON array with
+    one scorecard per paper.
+    """
+    summaries = "\n---\n".join(f"PAPER {i}:\n{paper_summary(paper)}" for i, paper in enumerate(papers))
+    prompt = f"""Evaluate each of these {len(papers)} MTFC Scenario Quest Response papers against the rubric.
+
+{summaries}
+
+{RUBRIC}
+
+Based on each paper's statistics, outline and notation block, score each category.
+Return a JSON array with exactly {len(papers)} objects, one per paper in the order given, each of the form:
+
+{SCORECARD_FORMAT}"""
+    
+    # Each scorecard is a few hundred tokens
+    response = chat(prompt, max_tokens=min(400*len(papers) + 200, 4096), opener="[")
+    json_match = _FENCED_JSON_ARRAY_RE.search(response)
+    if json_match:
+        json_str = json_match.group(1)
+    else:
+        json_match = _BARE_JSON_ARRAY_RE.search(response)
+        if not json_match:
+            return None
+        json_str = json_match.group(0)
+    
+    try:
+        scorecards = json.loads(json_str)
+    except json.JSONDecodeError as e:
+        print(f"⚠️ JSON parse error: {e}")
+        return None
+    if not isinstance(scorecards, list) or len(scorecards) != len(papers):
+        print(f"⚠️ Expected {len(papers)} scorecards, got {len(scorecards) if isinstance(scorecards, list) else 'no list'}")
+        return None
+    return [merge_scorecards(score_deterministic(paper), card) for paper, card in zip(papers, scorecards)]
 
 def main():
     print("="*90)
@@ -144,10 +401,9 @@ def main():
         print(f"❌ Paper not found at {INITIAL_PAPER_PATH}")
         return
     
-    with open(INITIAL_PAPER_PATH, "r") as f:
-        paper_text = f.read()
-    
-    word_count = len(paper_text.split())
+    paper_text = INITIAL_PAPER_PATH.read_text()
+    stats = paper_stats(paper_text)
+    word_count = stats[0]
     print(f"✓ Loaded paper: {word_count:,} words")
     
     print(f"\n{'='*90}")
@@ -155,7 +411,7 @@ def main():
     print(f"{'='*90}\n")
     
     print("📡 Calling API to evaluate...")
-    result = evaluate_paper_summary(paper_text)
+    result = evaluate_paper_summary(paper_text, stats)
     
     if not result:
         print("❌ Failed to get evaluation")
@@ -8,11 +8,13 @@ from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any
 
-from src.improver import ImprovementEngine
-from src.generator import ScriptGenerator
-from src.evaluator import RubricEvaluator
 from src.utils import save_output, load_config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed, fall back to stdlib json
+
 
 def create_sample_scenario(name: str = "Smith County Corn Farming") -> Dict[str, Any]:
     """Create a sample scenario for testing."""
@@ -68,13 +70,29 @@ def save_report_json(result: Dict[str, Any], output_dir: str, filename: str = No
     output_path.mkdir(parents=True, exist_ok=True)
     filepath = output_path / filename
     
-    with open(filepath, "w") as f:
-        json.dump(result, f, indent=2)
+    if orjson is not None:
+        filepath.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+    else:
+        with open(filepath, "w") as f:
+            json.dump(result, f, indent=2)
     
     print(f"Results saved to: {filepath}")
     return str(filepath)
 
 
+def _flow(lines, styles, Paragraph, Spacer, gap):
+    """Yield a Paragraph and a Spacer for each report line (blank lines are already filtered out)."""
+    normal = styles['Normal']
+    heading_styles = [styles[f'Heading{level}'] for level in range(1, 7)]
+    for line in lines:
+        if line.startswith('#'):
+            level = len(line) - len(line.lstrip('#'))
+            yield Paragraph(line.lstrip('# '), heading_styles[min(level, 6) - 1])
+        else:
+            yield Paragraph(line, normal)
+        yield Spacer(1, gap)
+
+
 def export_to_pdf(report: str, output_dir: str, filename: str = None):
     """Export report to PDF (requires reportlab)."""
     try:
@@ -82,10 +100,9 @@ def export_to_pdf(report: str, output_dir: str, filename: str = None):
         from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
         from reportlab.lib.styles import getSampleStyleSheet
         from reportlab.lib.units import inch
-        import markdown
     except ImportError:
-        print("Warning: reportlab or markdown not installed. PDF export disabled.")
-        print("Install with: pip install reportlab markdown")
+        print("Warning: reportlab not installed. PDF export disabled.")
+        print("Install with: pip install reportlab")
         return None
     
     if filename is None:
@@ -96,25 +113,13 @@ def export_to_pdf(report: str, output_dir: str, filename: str = None):
     output_path.mkdir(parents=True, exist_ok=True)
     filepath = output_path / filename
     
-    # Convert markdown to HTML then to PDF
-    html = markdown.markdown(report)
-    
     doc = SimpleDocTemplate(str(filepath), pagesize=letter)
     styles = getSampleStyleSheet()
-    story = []
-    
-    # Simple text extraction for PDF (basic implementation)
-    for line in report.split('\n'):
-        if line.strip():
-            if line.startswith('#'):
-                level = len(line) - len(line.lstrip('#'))
-                style_name = f'Heading{min(level, 6)}'
-                story.append(Paragraph(line.lstrip('# '), styles[style_name]))
-            else:
-                story.append(Paragraph(line, styles['Normal']))
-            story.append(Spacer(1, 0.2*inch))
     
-    doc.build(story)
+    # Simple text extraction for PDF (basic implementation); doc.build
+    # pops flowables off a list, so the generator is materialized once here
+    lines = (line for line in report.splitlines() if line.strip())
+    doc.build(list(_flow(lines, styles, Paragraph, Spacer, 0.2*inch)))
     print(f"PDF saved to: {filepath}")
     return str(filepath)
 
@@ -194,6 +199,25 @@ Examples:
         help="Maximum number of improvement iterations (overrides config)"
     )
     
+    parser.add_argument(
+        "--best-of",
+        type=int,
+        help="Improvement candidates sampled per iteration, keeping the best-scoring one "
+             "(default: BEST_OF_N environment variable, or 1)"
+    )
+    
+    parser.add_argument(
+        "--strict-sequential",
+        action="store_true",
+        help="Generate report steps one after another, each with the previous step as context"
+    )
+    
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Generate the initial report through the OpenAI Batch API (50%% cheaper, up to 24h turnaround)"
+    )
+    
     args = parser.parse_args()
     
     # Load scenario data
@@ -205,17 +229,28 @@ Examples:
         scenario_data = create_sample_scenario()
         print("No scenario specified. Using sample scenario: Smith County Corn Farming")
     
+    # Imported only now so --help and argument errors don't load the LLM SDKs
+    from src.improver import ImprovementEngine
+    from src.generator import ScriptGenerator
+    from src.evaluator import RubricEvaluator
+    
     # Initialize engine
     engine = ImprovementEngine(model=args.model, provider=args.provider)
     
     if args.max_iterations:
         engine.max_iterations = args.max_iterations
+    if args.best_of:
+        engine.best_of_n = args.best_of
+    engine.generator.strict_sequential = args.strict_sequential
+    engine.generator.use_batch = args.batch
     
     # Generate and improve report
     try:
         if args.no_improvement:
             print("Generating report without iterative improvement...")
             generator = ScriptGenerator(model=args.model, provider=args.provider)
+            generator.strict_sequential = args.strict_sequential
+            generator.use_batch = args.batch
             report = generator.generate_full_report(scenario_data)
             
             evaluator = RubricEvaluator(model=args.model, provider=args.provider)
@@ -225,7 +260,7 @@ Examples:
                 "final_report": report,
                 "final_scores": evaluation["scores"],
                 "final_weighted_total": evaluation["weighted_total"],
-                "iteration_history": [],
+                "iteration_history": engine.history,
                 "total_iterations": 0,
                 "converged": False,
                 "passed": evaluation["weighted_total"] >= engine.target_score
@@ -3,13 +3,21 @@
 Run auto iteration system with proper scenario retention
 """
 
+import functools
 import os
 import json
 import time
 import re
 from pathlib import Path
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
+from src.http_client import get_shared_openai
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed, fall back to stdlib json
 
 load_dotenv()
 
@@ -20,11 +28,24 @@ if not API_KEY:
 
 print("✓ API key loaded")
 
-client = OpenAI(api_key=API_KEY)
+client = get_shared_openai()
 
 SAVE_DIR = Path("mtfc_iterations_fixed")
 SAVE_DIR.mkdir(exist_ok=True)
 
+def write_json(path, obj):
+    """Write obj to path as indented UTF-8 JSON, through orjson when it is installed"""
+    if orjson is not None:
+        Path(path).write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        Path(path).write_text(json.dumps(obj, indent=2), encoding="utf-8")
+
+def json_line(obj):
+    """Serialize obj as one compact NDJSON line"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode() + "\n"
+    return json.dumps(obj) + "\n"
+
 RUBRIC = {
     "Project Definition": 0.15,
     "Data Identification & Assessment": 0.20,
@@ -34,6 +55,44 @@ RUBRIC = {
     "Communication & Clarity": 0.05
 }
 
+# Script steps ("#N: ...") each rubric category is graded on
+RUBRIC_SECTIONS = {
+    "Project Definition": range(1, 4),
+    "Data Identification & Assessment": range(4, 16),
+    "Mathematical Modeling": range(16, 23),
+    "Risk Analysis": range(23, 27),
+    "Recommendations": range(27, 31),
+    "Communication & Clarity": range(1, 31),
+}
+
+_SECTION_RE = re.compile(r'^#(\d+):', re.MULTILINE)
+_SCORES_TAIL_RE = re.compile(r'^\W*SCORES?\W*$', re.IGNORECASE | re.MULTILINE)
+
+def split_sections(script):
+    """Split a script into {step number: text} on its "#N:" headings; text before the first heading is step 0"""
+    # Drop the trailing scores block so it isn't spliced into the last step
+    tail = None
+    for tail in _SCORES_TAIL_RE.finditer(script):
+        pass
+    if tail:
+        script = script[:tail.start()]
+
+    starts = [(int(m.group(1)), m.start()) for m in _SECTION_RE.finditer(script)]
+    ends = [start for _, start in starts[1:]] + [len(script)]
+    sections = {0: script[:starts[0][1]] if starts else script}
+    for (step, start), end in zip(starts, ends):
+        sections[step] = script[start:end]
+    return sections
+
+def join_sections(sections):
+    """Reassemble a script from split_sections() output"""
+    return "".join(sections[step] for step in sorted(sections))
+
+def sections_for(categories, sections):
+    """Step texts the given rubric categories are graded on, in script order"""
+    steps = {step for category in categories for step in RUBRIC_SECTIONS[category]}
+    return "".join(sections[step] for step in sorted(steps) if step in sections)
+
 SYSTEM_PROMPT = """
 You are an expert MTFC actuarial evaluator. Your job is to:
 1. Evaluate the provided script against the rubric
@@ -63,6 +122,12 @@ Communication & Clarity: [0-100]
 WEIGHTED TOTAL: [0-100]
 """
 
+@retry(
+    stop=stop_after_attempt(6),
+    wait=wait_random_exponential(min=2, max=60),
+    retry=retry_if_exception_type((RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)),
+    reraise=True,
+)
 def chat(prompt, model="gpt-4-turbo"):
     try:
         completion = client.chat.completions.create(
@@ -79,56 +144,62 @@ def chat(prompt, model="gpt-4-turbo"):
         print(f"❌ API Error: {e}")
         raise
 
+_SCORE_SECTION_RE = re.compile(
+    r'(?:SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|$)',
+    re.IGNORECASE | re.DOTALL
+)
+_OUT_OF_100_RE = re.compile(r"(\d+(?:\.\d+)?)\s*/\s*100", re.IGNORECASE)
+
+# Every spelling of each rubric key, mapped back to the key
+SCORE_LABELS = {
+    key_var.lower(): key
+    for key in RUBRIC
+    for key_var in (key, key.replace(" & ", " and "))
+}
+# One alternation over all labels, so a single scan finds every "label: N"
+SCORE_RE = re.compile(
+    r"(?P<label>" + "|".join(re.escape(label) for label in sorted(SCORE_LABELS, key=len, reverse=True)) + r")"
+    r"\s*[:=\-]?\s*(?P<val>\d+(?:\.\d+)?)",
+    re.IGNORECASE
+)
+TOTAL_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)', r'OVERALL.*?(\d+(?:\.\d+)?)')
+]
+
+@functools.lru_cache(maxsize=64)
 def extract_scores(response):
     scores = {}
     total = 0
     
-    score_section = re.search(
-        r'(?:SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|$)', 
-        response, 
-        re.IGNORECASE | re.DOTALL
-    )
-    
+    score_section = _SCORE_SECTION_RE.search(response)
     score_text = score_section.group(1) if score_section else response
     
-    for key in RUBRIC.keys():
-        for key_var in [key, key.lower(), key.replace(" & ", " and ")]:
-            patterns = [
-                rf"{re.escape(key_var)}\s*:?\s*(\d+(?:\.\d+)?)",
-                rf"(\d+(?:\.\d+)?)\s*/\s*100",
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, score_text, re.IGNORECASE)
-                if match:
-                    try:
-                        val = float(match.group(1))
-                        if 0 <= val <= 100:
-                            scores[key] = val
-                            break
-                    except:
-                        pass
-            if key in scores:
-                break
+    for match in SCORE_RE.finditer(score_text):
+        key = SCORE_LABELS[match.group("label").lower()]
+        val = float(match.group("val"))
+        if key not in scores and 0 <= val <= 100:
+            scores[key] = val
     
-    for pattern in [r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)', r'OVERALL.*?(\d+(?:\.\d+)?)']:
-        match = re.search(pattern, response, re.IGNORECASE)
+    # Unlabelled keys fall back to the first "N/100" in the scores
+    fallback = _OUT_OF_100_RE.search(score_text)
+    if fallback and 0 <= float(fallback.group(1)) <= 100:
+        for key in RUBRIC:
+            scores.setdefault(key, float(fallback.group(1)))
+    
+    for pattern in TOTAL_PATTERNS:
+        match = pattern.search(response)
         if match:
-            try:
-                total = float(match.group(1))
-                if 0 <= total <= 100:
-                    break
-            except:
-                pass
+            total = float(match.group(1))
+            if 0 <= total <= 100:
+                break
     
     if not total:
         total = sum(scores.get(k, 0) * RUBRIC[k] for k in RUBRIC.keys())
     
-    for key in RUBRIC.keys():
-        if key not in scores:
-            scores[key] = 0
-    
-    return scores, total
+    # Matches arrive in text order; report them in rubric order, as a tuple
+    # of pairs so the cached result can't be mutated by a caller
+    return tuple((key, scores.get(key, 0)) for key in RUBRIC), total
 
 def main():
     print("="*60)
@@ -147,7 +218,8 @@ def main():
     target = 96
     max_iter = 15
     all_iterations = []
-    
+    sections = split_sections(current_script)
+
     # First evaluation
     prompt = f"""Evaluate this MTFC script about Farmer Jones' corn farming operation:
 
@@ -168,26 +240,36 @@ Task:
 
 Provide the IMPROVED script followed by scores."""
     
+    # One record per line; appended, and flushed at each newline, so earlier
+    # runs and the finished iterations of a killed run are kept
+    ndjson_path = SAVE_DIR / "iterations.ndjson"
+    ndjson_f = open(ndjson_path, "a", encoding="utf-8", buffering=1)
+    
     while overall < target and iteration <= max_iter:
         print(f"🌀 Iteration {iteration}...")
         
         try:
             response = chat(prompt)
-            scores, overall = extract_scores(response)
+            score_items, overall = extract_scores(response)
+            scores = dict(score_items)
+            
+            # Splice the revised steps over the current ones; the text before
+            # the first step is the model's evaluation, not part of the script
+            revised = split_sections(response)
+            revised.pop(0)
+            sections |= revised
             
             result = {
                 "iteration": iteration,
                 "script": response,
                 "scores": scores,
                 "overall_score": overall,
+                "revised_sections": {str(step): text for step, text in revised.items()},
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             }
             
             all_iterations.append(result)
-            
-            file_path = SAVE_DIR / f"iteration_{iteration}.json"
-            with open(file_path, "w") as f:
-                json.dump(result, f, indent=2)
+            ndjson_f.write(json_line(result))
             
             print(f"\n{'='*60}")
             print(f"Iteration {iteration} - Score: {overall:.2f}/100")
@@ -199,9 +281,7 @@ Provide the IMPROVED script followed by scores."""
             if overall >= target:
                 print(f"\n✅ TARGET REACHED ({overall:.2f} >= {target})!")
                 
-                # Extract just the script part (remove evaluation)
-                script_match = re.search(r'(?:IMPROVED.*?SCRIPT|MTFC.*?Response)(.*?)(?:SCORES?:|$)', response, re.IGNORECASE | re.DOTALL)
-                final_script = script_match.group(1).strip() if script_match else response
+                final_script = join_sections(sections).strip()
                 
                 # Save clean final script
                 final_path = SAVE_DIR / "final_script.txt"
@@ -215,15 +295,17 @@ Provide the IMPROVED script followed by scores."""
             low = {k: v for k, v in scores.items() if v < 90}
             
             if low:
+                current = "\n".join(f'- {k}: {v:.2f}' for k, v in scores.items())
+                weak = "\n".join(f'- {k}: {v:.2f} - needs more detail/numbers' for k, v in low.items())
                 feedback = f"""Improve the Farmer Jones corn farming script further.
 
 Current scores:
-{chr(10).join(f'- {k}: {v:.2f}' for k, v in scores.items())}
+{current}
 
 Weighted: {overall:.2f}/100
 
 Low-scoring areas:
-{chr(10).join(f'- {k}: {v:.2f} - needs more detail/numbers' for k, v in low.items())}
+{weak}
 
 Task: Enhance the SAME Farmer Jones corn farming script:
 1. Add more specific calculations and numbers
@@ -232,7 +314,11 @@ Task: Enhance the SAME Farmer Jones corn farming script:
 4. Add quantitative examples
 5. Improve formulas and analysis
 
-Provide the improved script with scores."""
+Steps graded in the low-scoring areas (the rest of the script stays as it is):
+
+{sections_for(low, sections)}
+
+Return each revised step under its same "#N:" heading, then scores for the whole script with these steps in place."""
             else:
                 feedback = f"""Final refinement of Farmer Jones script to reach {target}+.
 
@@ -244,16 +330,21 @@ Make final enhancements:
 - More detailed analysis
 - Professional presentation
 
-Provide refined script with scores."""
+Steps graded in the areas still below {target} (the rest of the script stays as it is):
+
+{sections_for([k for k, v in scores.items() if v < target] or RUBRIC, sections)}
+
+Return each refined step under its same "#N:" heading, then scores for the whole script with these steps in place."""
             
             prompt = feedback
             iteration += 1
-            time.sleep(2)
             
         except Exception as e:
             print(f"❌ Error: {e}")
             break
     
+    ndjson_f.close()
+    
     # Summary
     summary = {
         "final_score": overall,
@@ -264,8 +355,7 @@ Provide refined script with scores."""
     }
     
     summary_path = SAVE_DIR / "summary.json"
-    with open(summary_path, "w") as f:
-        json.dump(summary, f, indent=2)
+    write_json(summary_path, summary)
     
     # FINISHED file
     finished = Path("FINISHED.txt")
@@ -281,12 +371,14 @@ Time: {time.strftime('%Y-%m-%d %H:%M:%S')}
 
 Files:
 - Final script: {SAVE_DIR}/final_script.txt
-- All iterations: {SAVE_DIR}/
+- All iterations: {ndjson_path}
 - Summary: {summary_path}
 
 Category Scores:
-{chr(10).join(f'  {k}: {v:.2f}/100' for k, v in scores.items())}
-
+""")
+        for k, v in scores.items():
+            f.write(f"  {k}: {v:.2f}/100\n")
+        f.write(f"""
 INSTRUCTIONS:
 Review the final script in: {SAVE_DIR}/final_script.txt
 This is your improved Farmer Jones corn farming analysis ready for MTFC submission.
@@ -3,13 +3,21 @@
 Run auto iteration system starting with a user-provided initial script
 """
 
+import functools
 import os
 import json
 import time
 import re
 from pathlib import Path
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
+from src.http_client import get_shared_openai
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed, fall back to stdlib json
 
 # Load environment variables
 load_dotenv()
@@ -23,12 +31,19 @@ if not API_KEY:
 
 print("✓ API key loaded successfully")
 
-client = OpenAI(api_key=API_KEY)
+client = get_shared_openai()
 
 # FILE STORAGE SETUP
 SAVE_DIR = Path("mtfc_iterations")
 SAVE_DIR.mkdir(exist_ok=True)
 
+def write_json(path, obj):
+    """Write obj to path as indented UTF-8 JSON, through orjson when it is installed"""
+    if orjson is not None:
+        Path(path).write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        Path(path).write_text(json.dumps(obj, indent=2), encoding="utf-8")
+
 # RUBRIC DEFINITION
 RUBRIC = {
     "Project Definition": 0.15,
@@ -75,6 +90,12 @@ Communication & Clarity: [0-100]
 WEIGHTED TOTAL: [0-100]
 """
 
+@retry(
+    stop=stop_after_attempt(6),
+    wait=wait_random_exponential(min=2, max=60),
+    retry=retry_if_exception_type((RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)),
+    reraise=True,
+)
 def chat(prompt, model="gpt-4-turbo"):
     """Helper for API call"""
     try:
@@ -92,80 +113,76 @@ def chat(prompt, model="gpt-4-turbo"):
         print(f"❌ Error in API call: {e}")
         raise
 
+_SCORES_SECTION_RE = re.compile(
+    r'(?:SCORES?|RUBRIC SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|OVERALL|TOTAL|$)',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Every spelling of each rubric key, mapped back to the key
+SCORE_LABELS = {
+    key_var.lower(): key
+    for key in RUBRIC
+    for key_var in (key, key.replace(" & ", " and "), key.replace(" & ", " "))
+}
+_LABEL_ALTERNATION = "|".join(re.escape(label) for label in sorted(SCORE_LABELS, key=len, reverse=True))
+# One alternation over all labels, so a single scan finds every "label: N"
+# (or "label - N", "label = N"); "N label" is only tried for keys still missing
+SCORE_RE = re.compile(
+    rf"(?P<label>{_LABEL_ALTERNATION})\s*[:=\-]?\s*(?P<val>\d+(?:\.\d+)?)",
+    re.IGNORECASE
+)
+SCORE_BEFORE_LABEL_RE = re.compile(
+    rf"(?P<val>\d+(?:\.\d+)?)\s*:?\s*(?P<label>{_LABEL_ALTERNATION})",
+    re.IGNORECASE
+)
+TOTAL_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)',
+        r'OVERALL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'TOTAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'FINAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'WEIGHTED\s*:?\s*(\d+(?:\.\d+)?)',
+    )
+]
+
+@functools.lru_cache(maxsize=64)
 def extract_scores(response):
     """Pull numeric rubric scores from model output"""
     scores = {}
     total = 0
     
-    scores_section_match = re.search(
-        r'(?:SCORES?|RUBRIC SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|OVERALL|TOTAL|$)', 
-        response, 
-        re.IGNORECASE | re.DOTALL
-    )
+    scores_section_match = _SCORES_SECTION_RE.search(response)
     
     if scores_section_match:
         score_text = scores_section_match.group(1)
     else:
         score_text = response
     
-    for key in RUBRIC.keys():
-        key_variations = [
-            key,
-            key.lower(),
-            key.replace(" & ", " and "),
-            key.replace(" & ", " "),
-        ]
-        
-        for key_var in key_variations:
-            patterns = [
-                rf"{re.escape(key_var)}\s*:?\s*(\d+(?:\.\d+)?)",
-                rf"{re.escape(key_var)}\s*-\s*(\d+(?:\.\d+)?)",
-                rf"{re.escape(key_var)}\s*=\s*(\d+(?:\.\d+)?)",
-                rf"(\d+(?:\.\d+)?)\s*:?\s*{re.escape(key_var)}",
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, score_text, re.IGNORECASE)
-                if match:
-                    try:
-                        val = float(match.group(1))
-                        if 0 <= val <= 100:
-                            scores[key] = val
-                            break
-                    except (ValueError, IndexError):
-                        continue
-            
-            if key in scores:
-                break
-    
-    total_patterns = [
-        r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)',
-        r'OVERALL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'TOTAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'FINAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'WEIGHTED\s*:?\s*(\d+(?:\.\d+)?)',
-    ]
+    for pattern in (SCORE_RE, SCORE_BEFORE_LABEL_RE):
+        for match in pattern.finditer(score_text):
+            key = SCORE_LABELS[match.group("label").lower()]
+            val = float(match.group("val"))
+            if key not in scores and 0 <= val <= 100:
+                scores[key] = val
+        if len(scores) == len(RUBRIC):
+            break
     
-    for pattern in total_patterns:
-        total_match = re.search(pattern, response, re.IGNORECASE)
+    for pattern in TOTAL_PATTERNS:
+        total_match = pattern.search(response)
         if total_match:
-            try:
-                total = float(total_match.group(1))
-                if 0 <= total <= 100:
-                    break
-            except (ValueError, IndexError):
-                continue
+            total = float(total_match.group(1))
+            if 0 <= total <= 100:
+                break
     
     if not total or len(scores) < len(RUBRIC):
         calculated_total = sum(scores.get(k, 0) * RUBRIC[k] for k in RUBRIC.keys())
         if calculated_total > 0:
             total = calculated_total
     
-    for key in RUBRIC.keys():
-        if key not in scores:
-            scores[key] = 0
-    
-    return scores, total
+    # Matches arrive in text order; report them in rubric order, as a tuple
+    # of pairs so the cached result can't be mutated by a caller
+    return tuple((key, scores.get(key, 0)) for key in RUBRIC), total
 
 def main():
     print("="*60)
@@ -220,7 +237,8 @@ WEIGHTED TOTAL: [score]"""
         
         try:
             response = chat(prompt)
-            scores, overall = extract_scores(response)
+            score_items, overall = extract_scores(response)
+            scores = dict(score_items)
             
             result = {
                 "iteration": iteration,
@@ -234,8 +252,7 @@ WEIGHTED TOTAL: [score]"""
             
             # Save file
             file_path = SAVE_DIR / f"iteration_{iteration}.json"
-            with open(file_path, "w") as f:
-                json.dump(result, f, indent=2)
+            write_json(file_path, result)
             
             # Display progress
             print(f"\n{'='*60}")
@@ -253,15 +270,17 @@ WEIGHTED TOTAL: [score]"""
             # Prepare next iteration
             low_scores = {k: v for k, v in scores.items() if v < 90}
             if low_scores:
+                current = "\n".join(f'- {k}: {v:.2f}' for k, v in scores.items())
+                weak = "\n".join(f'- {k}: {v:.2f}' for k, v in low_scores.items())
                 feedback = f"""Revise the script to improve low-scoring areas.
 
 Current scores:
-{chr(10).join(f'- {k}: {v:.2f}' for k, v in scores.items())}
+{current}
 
 Weighted Total: {overall:.2f}/100
 
 Areas needing improvement (scores < 90):
-{chr(10).join(f'- {k}: {v:.2f}' for k, v in low_scores.items())}
+{weak}
 
 Produce an improved version that:
 1. Addresses all weaknesses
@@ -284,7 +303,6 @@ Provide the refined script with scores at the end."""
             
             prompt = feedback
             iteration += 1
-            time.sleep(2)
             
         except Exception as e:
             print(f"❌ Error in iteration {iteration}: {e}")
@@ -304,8 +322,7 @@ Provide the refined script with scores at the end."""
     }
     
     summary_path = SAVE_DIR / "summary.json"
-    with open(summary_path, "w") as f:
-        json.dump(summary, f, indent=2)
+    write_json(summary_path, summary)
     
     print(f"\nSummary saved to: {summary_path}")
     
@@ -324,8 +341,9 @@ All iteration files saved in: {SAVE_DIR}/
 Summary file: {summary_path}
 
 Category Scores:
-{chr(10).join(f'  {k}: {v:.2f}/100' for k, v in scores.items())}
 """)
+        for k, v in scores.items():
+            f.write(f"  {k}: {v:.2f}/100\n")
     
     print(f"\n✓ FINISHED file created: {finished_path}")
     print("\n" + "="*60)
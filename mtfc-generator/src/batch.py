@@ -0,0 +1,82 @@
+"""OpenAI Batch API helpers for bulk, latency-insensitive MTFC runs"""
+
+import json
+import time
+from typing import List, Optional
+from openai import OpenAI
+from .http_client import get_shared_openai
+
+
+def batch_generate(prompts: List[str], model: str = "gpt-4-turbo",
+                   system_prompt: Optional[str] = None, temperature: float = 0.7,
+                   max_tokens: int = 4000, poll_interval: int = 30,
+                   client: Optional[OpenAI] = None) -> List[str]:
+    """
+    Generate completions for many prompts through the OpenAI Batch API.
+
+    Batch jobs are billed at half price but complete within a 24h window,
+    so this suits overnight generation or certification sweeps.
+
+    Args:
+        prompts: User prompts to complete
+        model: Model name to use
+        system_prompt: Optional system prompt sent with every request
+        temperature: Sampling temperature
+        max_tokens: Maximum tokens per completion
+        poll_interval: Seconds between batch status checks
+        client: OpenAI client to use (default: the shared client)
+
+    Returns:
+        Completions in the same order as prompts ("" for failed requests)
+    """
+    client = client or get_shared_openai()
+
+    lines = []
+    for i, prompt in enumerate(prompts):
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        lines.append(json.dumps({
+            "custom_id": f"iter-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+        }))
+
+    input_file = client.files.create(
+        file=("batch_input.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id} ({len(prompts)} requests)")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        print(f"  Batch {batch.id}: {batch.status}")
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status: {batch.status}")
+
+    results = {}
+    output = client.files.content(batch.output_file_id).text
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") == 200:
+            body = response["body"]
+            results[record["custom_id"]] = body["choices"][0]["message"]["content"]
+
+    return [results.get(f"iter-{i}", "") for i in range(len(prompts))]
@@ -1,11 +1,96 @@
 """Rubric evaluator module for MTFC reports"""
 
+import asyncio
+import functools
 import json
+import math
 import re
 from typing import Dict, Any, Optional
-from openai import OpenAI
-from anthropic import Anthropic
-from .utils import load_config, get_api_key
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
+from .http_client import drop_rejected_service_tier, get_shared_anthropic, get_shared_openai, service_tier
+from .llm_cache import cached_llm_call
+from .retry import llm_retry
+from .utils import load_config, get_api_key, extract_json
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None  # tiktoken not installed, token counts are estimated from length
+
+# Field-by-field fallback for replies that aren't valid JSON
+_SCORE_RE = re.compile(r'"score":\s*(\d+)')
+_JUSTIFICATION_RE = re.compile(r'"justification":\s*"([^"]+)"')
+_IMPROVEMENTS_RE = re.compile(r'"improvements":\s*"([^"]+)"')
+
+# Cap on evaluation requests in flight at once, to stay under provider rate limits
+MAX_CONCURRENT_REQUESTS = 10
+
+# Reply cap for one category's score, justification and improvements; a rubric
+# weight given as {"weight": ..., "max_tokens": ...} overrides it
+CATEGORY_MAX_TOKENS = 500
+
+# Used when prompts.json has no evaluation.combined_prompt
+COMBINED_PROMPT = """Evaluate the following MTFC actuarial report against every rubric category below.
+
+Categories:
+{categories}
+
+Report:
+{report_text}
+
+Return a single JSON object keyed by category name, where each value is
+{{"score": 0-100, "justification": "...", "improvements": "..."}}."""
+
+# Models that accept response_format={"type": "json_schema"}; older ones
+# (e.g. gpt-4, gpt-4-turbo) get the JSON format from the prompt alone
+STRUCTURED_OUTPUT_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+# Reply schema for one category; the combined evaluation nests one per category
+CATEGORY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer"},
+        "justification": {"type": "string"},
+        "improvements": {"type": "string"}
+    },
+    "required": ["score", "justification", "improvements"],
+    "additionalProperties": False
+}
+
+# Per-category calls lead with the category's excerpt of the report (see
+# _category_context). Categories get different excerpts, so the prompt cache
+# only serves repeat calls for the same category and report, not one category
+# from another's request. That trade is deliberate: an excerpt is roughly a
+# fifth of the report, so five trimmed calls send about one report's worth of
+# tokens, where a shared full-report prefix sends five (four of them cached,
+# which OpenAI bills at half price)
+REPORT_CONTEXT = "MTFC report under evaluation:\n\n{report_text}"
+# Stands in for {report_text} in the category prompts, which follow the report
+REPORT_REFERENCE = "(the report above)"
+
+# Report steps ("## N. ...") each category is graded on, used when the rubric
+# config has no category_sections; other categories see the whole report
+CATEGORY_SECTIONS = {
+    "project_definition": [1],
+    "data_identification": [2],
+    "mathematical_modeling": [3],
+    "risk_analysis": [4],
+    "recommendations": [5]
+}
+# Outline of the full report sent ahead of a category's excerpt
+OUTLINE_MAX_CHARS = 500
+
+_STEP_HEADING_RE = re.compile(r'^##\s+(\d+)\.', re.MULTILINE)
+_HEADING_LINE_RE = re.compile(r'^#+ .*$', re.MULTILINE)
+
+
+@functools.lru_cache(maxsize=8)
+def split_report(report_text: str) -> Dict[int, str]:
+    """Split a report into {step number: section text} on its "## N." headings (cached per report)."""
+    starts = [(int(m.group(1)), m.start()) for m in _STEP_HEADING_RE.finditer(report_text)]
+    ends = [start for _, start in starts[1:]] + [len(report_text)]
+    return {step: report_text[start:end] for (step, start), end in zip(starts, ends)}
 
 
 class RubricEvaluator:
@@ -21,67 +106,169 @@ class RubricEvaluator:
         """
         self.model = model
         self.provider = provider
+        self.temperature = 0.3  # Lower temperature for more consistent evaluation
         self.rubric_config = load_config("rubric")
         self.prompts = load_config("prompts")
-        self.weights = self.rubric_config["weights"]
+        # Weights are plain numbers or {"weight": w, "max_tokens": n}
+        self.category_sections = self.rubric_config.get("category_sections", CATEGORY_SECTIONS)
+        self.weights = {}
+        self.max_tokens = {}
+        for category, weight in self.rubric_config["weights"].items():
+            if isinstance(weight, dict):
+                self.max_tokens[category] = weight.get("max_tokens", CATEGORY_MAX_TOKENS)
+                weight = weight["weight"]
+            else:
+                self.max_tokens[category] = CATEGORY_MAX_TOKENS
+            self.weights[category] = weight
+        
+        # One tokenizer per evaluator, shared by every prompt size check
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
         
         # Initialize API client
-        api_key = get_api_key()
+        self.api_key = get_api_key()
         if provider == "openai":
-            self.client = OpenAI(api_key=api_key)
+            self.client = get_shared_openai()
         elif provider == "anthropic":
-            self.client = Anthropic(api_key=api_key)
+            self.client = get_shared_anthropic(self.api_key)
         else:
             raise ValueError(f"Unsupported provider: {provider}")
     
-    def _call_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        """Make an LLM API call."""
+    def count_tokens(self, text: str) -> int:
+        """Token count of text (about 4 characters per token without tiktoken)."""
+        if self.encoding is None:
+            return len(text) // 4
+        return len(self.encoding.encode(text))
+    
+    def _request(self, prompt: str, system_prompt: Optional[str] = None,
+                 max_tokens: int = 1000, context: Optional[str] = None,
+                 schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Build the provider-specific keyword arguments for one evaluation call.
+        
+        Args:
+            prompt: Question for this call
+            system_prompt: Optional system prompt
+            max_tokens: Maximum tokens in the reply
+            context: Report text (or excerpt) the prompt is about; it is placed
+                ahead of the prompt (and marked cacheable for Anthropic)
+            schema: JSON schema the reply must follow, enforced through
+                structured outputs (OpenAI) or a forced tool call (Anthropic)
+        
+        Returns:
+            Keyword arguments for chat.completions.create / messages.create
+        """
         if self.provider == "openai":
             messages = []
             if system_prompt:
                 messages.append({"role": "system", "content": system_prompt})
+            if context is not None:
+                prompt = f"{REPORT_CONTEXT.format(report_text=context)}\n\n{prompt}"
             messages.append({"role": "user", "content": prompt})
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.3,  # Lower temperature for more consistent evaluation
-                max_tokens=1000
-            )
-            return response.choices[0].message.content.strip()
+            request = {
+                "model": self.model,
+                "messages": messages,
+                "temperature": self.temperature,
+                "max_tokens": max_tokens
+            }
+            if schema is not None and self.model.startswith(STRUCTURED_OUTPUT_MODELS):
+                request["response_format"] = {
+                    "type": "json_schema",
+                    "json_schema": {"name": "rubric_scores", "strict": True, "schema": schema}
+                }
+            tier = service_tier()
+            if tier:
+                request["service_tier"] = tier
+            return request
+        system = system_prompt or ""
+        if context is not None:
+            system = [
+                {"type": "text", "text": system, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": REPORT_CONTEXT.format(report_text=context),
+                 "cache_control": {"type": "ephemeral"}}
+            ]
+        request = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "system": system,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if schema is not None:
+            request["tools"] = [{
+                "name": "record_scores",
+                "description": "Record the rubric evaluation",
+                "input_schema": schema
+            }]
+            request["tool_choice"] = {"type": "tool", "name": "record_scores"}
+        return request
+    
+    def _response_text(self, response) -> str:
+        """Extract the reply text from a provider response, reporting prompt-cache hits."""
+        usage = getattr(response, "usage", None)
+        if self.provider == "openai":
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", 0)
+        else:
+            cached_tokens = getattr(usage, "cache_read_input_tokens", 0)
+        if cached_tokens:
+            print(f"    ({cached_tokens} prompt tokens from the provider cache)")
         
-        elif self.provider == "anthropic":
-            system = system_prompt or ""
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=1000,
-                system=system,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.content[0].text.strip()
+        if self.provider == "openai":
+            return response.choices[0].message.content.strip()
+        # A forced tool call carries the evaluation as its already-parsed input
+        for block in response.content:
+            if block.type == "tool_use":
+                return json.dumps(block.input)
+        return response.content[0].text.strip()
+    
+    @cached_llm_call
+    @llm_retry
+    def _call_llm(self, prompt: str, system_prompt: Optional[str] = None,
+                  max_tokens: int = 1000, context: Optional[str] = None,
+                  schema: Optional[Dict[str, Any]] = None) -> str:
+        """Make an LLM API call."""
+        request = self._request(prompt, system_prompt, max_tokens, context, schema)
+        if self.provider == "openai":
+            try:
+                response = self.client.chat.completions.create(**request)
+            except Exception as e:
+                if not drop_rejected_service_tier(request, e):
+                    raise
+                response = self.client.chat.completions.create(**request)
+        else:
+            response = self.client.messages.create(**request)
+        return self._response_text(response)
+    
+    @llm_retry
+    async def _acall_llm(self, client, prompt: str, system_prompt: Optional[str] = None,
+                         max_tokens: int = 1000, context: Optional[str] = None,
+                         schema: Optional[Dict[str, Any]] = None) -> str:
+        """Make an LLM API call on an async client."""
+        request = self._request(prompt, system_prompt, max_tokens, context, schema)
+        if self.provider == "openai":
+            try:
+                response = await client.chat.completions.create(**request)
+            except Exception as e:
+                if not drop_rejected_service_tier(request, e):
+                    raise
+                response = await client.chat.completions.create(**request)
+        else:
+            response = await client.messages.create(**request)
+        return self._response_text(response)
     
     def _extract_json_from_response(self, response: str) -> Dict[str, Any]:
         """Extract JSON from LLM response, handling markdown code blocks."""
-        # Try to find JSON in code blocks
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            # Try to find JSON object directly
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-            else:
-                # Fallback: try to parse the whole response
-                json_str = response
-        
         try:
-            return json.loads(json_str)
+            return extract_json(response)
         except json.JSONDecodeError:
             # If JSON parsing fails, try to extract score manually
-            score_match = re.search(r'"score":\s*(\d+)', response)
-            justification_match = re.search(r'"justification":\s*"([^"]+)"', response)
-            improvements_match = re.search(r'"improvements":\s*"([^"]+)"', response)
+            score_match = _SCORE_RE.search(response)
+            justification_match = _JUSTIFICATION_RE.search(response)
+            improvements_match = _IMPROVEMENTS_RE.search(response)
             
             return {
                 "score": int(score_match.group(1)) if score_match else 0,
@@ -100,14 +287,68 @@ class RubricEvaluator:
         Returns:
             Dictionary with score, justification, and improvements
         """
+        prompt, system_prompt = self._category_prompt(category)
+        context = self._category_context(category, report_text)
+        return self._category_result(
+            self._call_llm(prompt, system_prompt, self.max_tokens[category], context=context,
+                           schema=CATEGORY_SCHEMA)
+        )
+    
+    async def aevaluate_category(self, client, category: str, report_text: str) -> Dict[str, Any]:
+        """
+        Evaluate a specific rubric category on an async client.
+        
+        Args:
+            client: AsyncOpenAI or AsyncAnthropic client to send the request on
+            category: Category name (e.g., "project_definition")
+            report_text: Full report text to evaluate
+        
+        Returns:
+            Dictionary with score, justification, and improvements
+        """
+        prompt, system_prompt = self._category_prompt(category)
+        context = self._category_context(category, report_text)
+        print(f"  Evaluating {category}...")
+        return self._category_result(
+            await self._acall_llm(client, prompt, system_prompt, self.max_tokens[category], context=context,
+                                  schema=CATEGORY_SCHEMA)
+        )
+    
+    def _category_context(self, category: str, report_text: str) -> str:
+        """
+        Cut the report down to the steps a category is graded on.
+        
+        The result differs per category, so it is not a prompt-cache prefix
+        shared across categories (see REPORT_CONTEXT).
+        
+        Args:
+            category: Category name
+            report_text: Full report text
+        
+        Returns:
+            An outline of the report's headings followed by the category's
+            steps, or the full report when the category has no mapped steps
+            present in it
+        """
+        sections = split_report(report_text)
+        steps = [step for step in self.category_sections.get(category, []) if step in sections]
+        if not steps:
+            return report_text
+        outline = "\n".join(_HEADING_LINE_RE.findall(report_text))[:OUTLINE_MAX_CHARS]
+        excerpt = "".join(sections[step] for step in steps)
+        return f"Report outline:\n{outline}\n\nSections graded for this category:\n\n{excerpt}"
+    
+    def _category_prompt(self, category: str):
+        """Return the (question, system prompt) pair for one category; the report is sent ahead of it."""
         if category not in self.prompts["evaluation"]:
             raise ValueError(f"Unknown category: {category}")
         
         category_prompt_config = self.prompts["evaluation"][category]
-        prompt = category_prompt_config["prompt"].format(report_text=report_text)
-        system_prompt = self.prompts["evaluation"]["system_prompt"]
-        
-        response = self._call_llm(prompt, system_prompt)
+        prompt = category_prompt_config["prompt"].format(report_text=REPORT_REFERENCE)
+        return prompt, self.prompts["evaluation"]["system_prompt"]
+    
+    def _category_result(self, response: str) -> Dict[str, Any]:
+        """Parse one category's reply, clamping the score to 0-100."""
         result = self._extract_json_from_response(response)
         
         # Ensure score is within valid range
@@ -116,10 +357,28 @@ class RubricEvaluator:
         
         return result
     
-    def evaluate_report(self, report_text: str) -> Dict[str, Any]:
+    def evaluate_report(self, report_text: str, batched: bool = True) -> Dict[str, Any]:
         """
         Evaluate a complete report using all rubric categories.
         
+        Args:
+            report_text: Full report text to evaluate
+            batched: Score every category in one call (False sends one call per category)
+        
+        Returns:
+            Dictionary with scores for each category, weighted total, and feedback
+        """
+        if batched:
+            return self.evaluate_report_batched(report_text)
+        return asyncio.run(self.aevaluate_report(report_text))
+    
+    def evaluate_report_batched(self, report_text: str) -> Dict[str, Any]:
+        """
+        Evaluate a complete report with a single call that scores every category.
+        
+        The report is uploaded once instead of once per category. Categories
+        missing from the reply are re-scored individually.
+        
         Args:
             report_text: Full report text to evaluate
         
@@ -127,13 +386,114 @@ class RubricEvaluator:
             Dictionary with scores for each category, weighted total, and feedback
         """
         categories = list(self.weights.keys())
-        scores = {}
-        feedback = {}
+        template = self.prompts["evaluation"].get("combined_prompt", COMBINED_PROMPT)
+        prompt = template.format(
+            categories="\n".join(f"- {category}" for category in categories),
+            report_text=report_text
+        )
         
-        print("Evaluating report...")
+        print(f"Evaluating report ({self.count_tokens(report_text):,} tokens)...")
+        schema = {
+            "type": "object",
+            "properties": {category: CATEGORY_SCHEMA for category in categories},
+            "required": categories,
+            "additionalProperties": False
+        }
+        response = self._call_llm(prompt, self.prompts["evaluation"]["system_prompt"], max_tokens=2500,
+                                  schema=schema)
+        return self.evaluation_from_scores(self._extract_json_from_response(response), report_text)
+    
+    @staticmethod
+    def _numeric_score(entry: Any) -> Optional[float]:
+        """The entry's "score" as a finite float, or None if absent or not a number."""
+        if not isinstance(entry, dict):
+            return None
+        try:
+            score = float(entry.get("score"))
+        except (TypeError, ValueError):
+            return None
+        return score if math.isfinite(score) else None
+    
+    def evaluation_from_scores(self, scores: Dict[str, Any], report_text: str) -> Dict[str, Any]:
+        """
+        Build an evaluation from category scores the model already returned.
+        
+        Categories missing from scores, or whose score isn't a number, are
+        re-scored individually.
+        
+        Args:
+            scores: Category name -> {"score", "justification", "improvements"}
+            report_text: Report the scores are for
+        
+        Returns:
+            Dictionary with scores for each category, weighted total, and feedback
+        """
+        categories = list(self.weights.keys())
+        missing = [category for category in categories if self._numeric_score(scores.get(category)) is None]
+        rescored = {}
+        if missing:
+            # Independent of each other, so re-scored concurrently
+            print(f"  Re-evaluating {', '.join(missing)}...")
+            rescored = dict(zip(missing, asyncio.run(self.aevaluate_categories(missing, report_text))))
+        
+        results = []
         for category in categories:
-            print(f"  Evaluating {category}...")
-            result = self.evaluate_category(category, report_text)
+            if category in rescored:
+                result = rescored[category]
+            else:
+                result = scores[category]
+                result["score"] = max(0, min(100, self._numeric_score(result)))
+            results.append(result)
+        
+        return self._report_result(categories, results)
+    
+    async def aevaluate_report(self, report_text: str) -> Dict[str, Any]:
+        """
+        Evaluate a complete report, scoring every rubric category concurrently.
+        
+        The categories are graded independently, so their requests overlap
+        instead of waiting on each other.
+        
+        Args:
+            report_text: Full report text to evaluate
+        
+        Returns:
+            Dictionary with scores for each category, weighted total, and feedback
+        """
+        categories = list(self.weights.keys())
+        
+        print(f"Evaluating report ({self.count_tokens(report_text):,} tokens)...")
+        results = await self.aevaluate_categories(categories, report_text)
+        
+        return self._report_result(categories, results)
+    
+    async def aevaluate_categories(self, categories: list, report_text: str) -> list:
+        """
+        Score several categories concurrently.
+        
+        Args:
+            categories: Category names
+            report_text: Full report text to evaluate
+        
+        Returns:
+            One result dictionary per category, in the order given
+        """
+        # A fresh client per call keeps its connection pool on this event loop
+        client_class = AsyncOpenAI if self.provider == "openai" else AsyncAnthropic
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        
+        async def evaluate(client, category):
+            async with semaphore:
+                return await self.aevaluate_category(client, category, report_text)
+        
+        async with client_class(api_key=self.api_key) as client:
+            return await asyncio.gather(*(evaluate(client, category) for category in categories))
+    
+    def _report_result(self, categories: list, results: list) -> Dict[str, Any]:
+        """Combine per-category results into scores, weighted total, and feedback."""
+        scores = {}
+        feedback = {}
+        for category, result in zip(categories, results):
             scores[category] = result["score"]
             feedback[category] = {
                 "score": result["score"],
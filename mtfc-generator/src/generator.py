@@ -1,13 +1,49 @@
 """Script generator module for MTFC reports"""
 
+import asyncio
 import json
 import os
-from typing import Dict, Any, Optional
-from openai import OpenAI
-from anthropic import Anthropic
-from .utils import load_config, get_api_key
+from typing import Dict, Any, List, Optional, Tuple
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
+from .batch import batch_generate
+from .http_client import drop_rejected_service_tier, get_shared_anthropic, get_shared_openai, service_tier
+from .llm_cache import cached_llm_call
+from .retry import llm_retry
+from .utils import load_config, get_api_key, extract_json
 from .templates import ReportTemplate
 
+# Steps each report step waits for. A step only reads the step before it for
+# context and falls back to the scenario data when that step is absent, so
+# steps 3 and 4 work from the scenario alone and start alongside step 1
+STEP_DEPENDENCIES = {1: [], 2: [1], 3: [], 4: [], 5: [4]}
+# Every step sees its predecessor's output, as in a strictly serial run
+SEQUENTIAL_DEPENDENCIES = {1: [], 2: [1], 3: [2], 4: [3], 5: [4]}
+
+# Appended to prompts.improvement.prompt so the rewrite comes back already
+# scored, saving a separate evaluation call per improvement
+IMPROVEMENT_OUTPUT_FORMAT = """
+
+Return a single JSON object:
+{{"improved_report": "the full improved report in markdown",
+  "scores": {{category: {{"score": 0-100, "justification": "...", "improvements": "..."}}}},
+  "changed_sections": ["headings of the sections you rewrote"]}}
+scoring the improved report in each of these categories:
+{categories}"""
+
+# Output budgets: a step is one section, while an improvement reply carries
+# the whole rewritten report plus its scores
+STEP_MAX_TOKENS = 2000
+IMPROVEMENT_MAX_TOKENS = 4096
+
+STEP_NAMES = {
+    1: "Project Definition",
+    2: "Data Identification & Assessment",
+    3: "Mathematical Modeling",
+    4: "Risk Analysis",
+    5: "Recommendations"
+}
+
 
 class ScriptGenerator:
     """Generates MTFC actuarial analysis reports using LLM."""
@@ -22,43 +58,119 @@ class ScriptGenerator:
         """
         self.model = model
         self.provider = provider
+        self.temperature = 0.7
+        # Use SEQUENTIAL_DEPENDENCIES in generate_full_report (for checking
+        # that the parallel schedule doesn't change the report)
+        self.strict_sequential = False
+        # Send generate_full_report's step prompts through the OpenAI Batch API
+        self.use_batch = False
         self.template = ReportTemplate()
         self.prompts = load_config("prompts")
         
         # Initialize API client
-        api_key = get_api_key()
+        self.api_key = get_api_key()
         if provider == "openai":
-            self.client = OpenAI(api_key=api_key)
+            self.client = get_shared_openai()
         elif provider == "anthropic":
-            self.client = Anthropic(api_key=api_key)
+            self.client = get_shared_anthropic(self.api_key)
         else:
             raise ValueError(f"Unsupported provider: {provider}")
     
-    def _call_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        """Make an LLM API call."""
+    def _request(self, prompt: str, system_prompt: Optional[str] = None,
+                 max_tokens: int = STEP_MAX_TOKENS) -> Dict[str, Any]:
+        """Build the provider-specific keyword arguments for one generation call."""
         if self.provider == "openai":
             messages = []
             if system_prompt:
                 messages.append({"role": "system", "content": system_prompt})
             messages.append({"role": "user", "content": prompt})
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000
-            )
+            request = {
+                "model": self.model,
+                "messages": messages,
+                "temperature": self.temperature,
+                "max_tokens": max_tokens
+            }
+            tier = service_tier()
+            if tier:
+                request["service_tier"] = tier
+            return request
+        # Every step and improvement shares the generation system prompt, so
+        # mark it cacheable (Anthropic ignores this below its minimum prefix size)
+        system = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}] if system_prompt else ""
+        return {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "system": system,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+    
+    def _response_text(self, response) -> str:
+        """Extract the reply text from a provider response."""
+        if self.provider == "openai":
             return response.choices[0].message.content.strip()
-        
-        elif self.provider == "anthropic":
-            system = system_prompt or ""
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=2000,
-                system=system,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.content[0].text.strip()
+        return response.content[0].text.strip()
+    
+    def _truncated(self, response) -> bool:
+        """Whether the reply stopped at max_tokens rather than finishing."""
+        if self.provider == "openai":
+            return response.choices[0].finish_reason == "length"
+        return response.stop_reason == "max_tokens"
+    
+    def _create(self, request: Dict[str, Any]):
+        """Send one request, retrying once without a service tier the API rejected."""
+        if self.provider == "openai":
+            try:
+                return self.client.chat.completions.create(**request)
+            except Exception as e:
+                if not drop_rejected_service_tier(request, e):
+                    raise
+                return self.client.chat.completions.create(**request)
+        return self.client.messages.create(**request)
+    
+    async def _acreate(self, client, request: Dict[str, Any]):
+        """Send one request on an async client, as _create does."""
+        if self.provider == "openai":
+            try:
+                return await client.chat.completions.create(**request)
+            except Exception as e:
+                if not drop_rejected_service_tier(request, e):
+                    raise
+                return await client.chat.completions.create(**request)
+        return await client.messages.create(**request)
+    
+    @cached_llm_call(semantic=True)
+    @llm_retry
+    def _call_llm(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """Make an LLM API call."""
+        return self._response_text(self._create(self._request(prompt, system_prompt)))
+    
+    @llm_retry
+    async def _acall_llm(self, client, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """Make an LLM API call on an async client."""
+        return self._response_text(await self._acreate(client, self._request(prompt, system_prompt)))
+    
+    def _improvement_text(self, response) -> Optional[str]:
+        """Reply text of an improvement call, or None if it was cut off at max_tokens."""
+        if self._truncated(response):
+            print(f"  ⚠️ Improvement reply hit the {IMPROVEMENT_MAX_TOKENS}-token limit; discarding it")
+            return None
+        return self._response_text(response)
+    
+    # Exact-match only: a semantic hit would hand back another report's
+    # rewrite and scores
+    @cached_llm_call
+    @llm_retry
+    def _call_improvement_llm(self, prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+        """Make an improvement call; None if the reply was cut off."""
+        request = self._request(prompt, system_prompt, IMPROVEMENT_MAX_TOKENS)
+        return self._improvement_text(self._create(request))
+    
+    @llm_retry
+    async def _acall_improvement_llm(self, client, prompt: str,
+                                     system_prompt: Optional[str] = None) -> Optional[str]:
+        """Make an improvement call on an async client; None if the reply was cut off."""
+        request = self._request(prompt, system_prompt, IMPROVEMENT_MAX_TOKENS)
+        return self._improvement_text(await self._acreate(client, request))
     
     def generate_step(self, step: int, scenario_data: Dict[str, Any], 
                      previous_steps: Optional[Dict[int, str]] = None) -> str:
@@ -73,6 +185,29 @@ class ScriptGenerator:
         Returns:
             Generated step content as string
         """
+        prompt, system_prompt = self._step_prompt(step, scenario_data, previous_steps)
+        return self._format_step(step, self._call_llm(prompt, system_prompt))
+    
+    async def agenerate_step(self, client, step: int, scenario_data: Dict[str, Any],
+                             previous_steps: Optional[Dict[int, str]] = None) -> str:
+        """
+        Generate a single step of the actuarial report on an async client.
+        
+        Args:
+            client: AsyncOpenAI or AsyncAnthropic client to send the request on
+            step: Step number (1-5)
+            scenario_data: Dictionary containing scenario information
+            previous_steps: Dictionary of previously generated steps (for context)
+        
+        Returns:
+            Generated step content as string
+        """
+        prompt, system_prompt = self._step_prompt(step, scenario_data, previous_steps)
+        return self._format_step(step, await self._acall_llm(client, prompt, system_prompt))
+    
+    def _step_prompt(self, step: int, scenario_data: Dict[str, Any],
+                     previous_steps: Optional[Dict[int, str]] = None):
+        """Return the (prompt, system prompt) pair for one step."""
         # Prepare context for the prompt
         context = {
             "scenario_description": scenario_data.get("description", ""),
@@ -96,56 +231,161 @@ class ScriptGenerator:
         
         # Get the prompt for this step
         prompt = self.template.get_step_prompt(step, context)
-        system_prompt = self.prompts["generation"]["system_prompt"]
+        return prompt, self.prompts["generation"]["system_prompt"]
+    
+    def _format_step(self, step: int, content: str) -> str:
+        """Format generated content as a numbered section."""
+        return f"## {step}. {STEP_NAMES[step]}\n\n{content}\n"
+    
+    def generate_full_report(self, scenario_data: Dict[str, Any]) -> str:
+        """
+        Generate a complete actuarial report following the 5-step process.
         
-        # Generate the step
-        content = self._call_llm(prompt, system_prompt)
+        Args:
+            scenario_data: Dictionary containing scenario information
         
-        # Format as a numbered section
-        step_names = {
-            1: "Project Definition",
-            2: "Data Identification & Assessment",
-            3: "Mathematical Modeling",
-            4: "Risk Analysis",
-            5: "Recommendations"
-        }
+        Returns:
+            Complete report as markdown string
+        """
+        dependencies = SEQUENTIAL_DEPENDENCIES if self.strict_sequential else STEP_DEPENDENCIES
+        if self.use_batch:
+            return self.generate_full_report_batched(scenario_data, dependencies)
+        return asyncio.run(self.agenerate_full_report(scenario_data, dependencies))
+    
+    def generate_full_report_batched(self, scenario_data: Dict[str, Any],
+                                     dependencies: Dict[int, list] = STEP_DEPENDENCIES) -> str:
+        """
+        Generate a complete report through the OpenAI Batch API.
+        
+        Every step whose dependencies are already written goes into the same
+        batch job, so the default schedule takes two jobs (steps 1, 3 and 4,
+        then 2 and 5). Half the price of generate_full_report, but each job can
+        take up to 24h.
+        
+        Args:
+            scenario_data: Dictionary containing scenario information
+            dependencies: Step number -> step numbers whose output it needs
         
-        return f"## {step}. {step_names[step]}\n\n{content}\n"
+        Returns:
+            Complete report as markdown string
+        """
+        if self.provider != "openai":
+            raise ValueError("The Batch API is only available with the openai provider")
+        
+        steps = {}
+        while len(steps) < len(dependencies):
+            ready = [
+                step_num for step_num in sorted(dependencies)
+                if step_num not in steps and all(dep in steps for dep in dependencies[step_num])
+            ]
+            requests = [
+                self._step_prompt(step_num, scenario_data, {dep: steps[dep] for dep in dependencies[step_num]})
+                for step_num in ready
+            ]
+            print(f"Generating Steps {', '.join(map(str, ready))} in one batch...")
+            responses = batch_generate(
+                [prompt for prompt, _ in requests],
+                model=self.model,
+                system_prompt=self.prompts["generation"]["system_prompt"],
+                temperature=self.temperature,
+                max_tokens=STEP_MAX_TOKENS,
+                client=self.client
+            )
+            for step_num, content in zip(ready, responses):
+                steps[step_num] = self._format_step(step_num, content)
+        
+        # Format the complete report
+        report = self.template.format_full_report(steps, scenario_data.get("name", "Unknown Scenario"))
+        
+        return report
     
-    def generate_full_report(self, scenario_data: Dict[str, Any]) -> str:
+    async def agenerate_full_report(self, scenario_data: Dict[str, Any],
+                                    dependencies: Dict[int, list] = STEP_DEPENDENCIES) -> str:
         """
-        Generate a complete actuarial report following the 5-step process.
+        Generate a complete report, starting each step as soon as the steps it depends on finish.
         
         Args:
             scenario_data: Dictionary containing scenario information
+            dependencies: Step number -> step numbers whose output it needs
         
         Returns:
             Complete report as markdown string
         """
         steps = {}
+        tasks = {}
         
-        # Generate each step sequentially
-        for step_num in range(1, 6):
+        async def run(client, step_num):
+            await asyncio.gather(*(tasks[dep] for dep in dependencies[step_num]))
             print(f"Generating Step {step_num}...")
-            steps[step_num] = self.generate_step(step_num, scenario_data, steps)
+            previous_steps = {dep: steps[dep] for dep in dependencies[step_num]}
+            steps[step_num] = await self.agenerate_step(client, step_num, scenario_data, previous_steps)
+        
+        # A fresh client per report keeps its connection pool on this event loop
+        client_class = AsyncOpenAI if self.provider == "openai" else AsyncAnthropic
+        async with client_class(api_key=self.api_key) as client:
+            # Dependencies always have lower step numbers, so their tasks exist first
+            for step_num in sorted(dependencies):
+                tasks[step_num] = asyncio.create_task(run(client, step_num))
+            await asyncio.gather(*tasks.values())
         
         # Format the complete report
         report = self.template.format_full_report(steps, scenario_data.get("name", "Unknown Scenario"))
         
         return report
     
-    def improve_report(self, current_report: str, feedback: Dict[str, Any]) -> str:
+    def improve_report(self, current_report: str, feedback: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """
         Improve an existing report based on evaluation feedback.
         
+        The same call scores the improved report, so it needs no separate
+        evaluation.
+        
         Args:
             current_report: Current report text
             feedback: Dictionary containing scores and improvement suggestions
         
         Returns:
-            Improved report as markdown string
+            Improved report as markdown string, and its scores keyed by
+            category; if the reply was cut off or wasn't valid JSON, the
+            current report unchanged, with empty scores
+        """
+        prompt = self._improvement_prompt(current_report, feedback)
+        system_prompt = self.prompts["generation"]["system_prompt"]
+        return self._parse_improvement(current_report, self._call_improvement_llm(prompt, system_prompt))
+    
+    def improve_report_candidates(self, current_report: str, feedback: Dict[str, Any],
+                                  n: int) -> List[Tuple[str, Dict[str, Any]]]:
         """
-        improvement_prompt = self.prompts["improvement"]["prompt"]
+        Sample several improvements of a report concurrently.
+        
+        Args:
+            current_report: Current report text
+            feedback: Dictionary containing scores and improvement suggestions
+            n: Number of candidates
+        
+        Returns:
+            n (improved report, scores) pairs, as from improve_report
+        """
+        return asyncio.run(self.aimprove_report_candidates(current_report, feedback, n))
+    
+    async def aimprove_report_candidates(self, current_report: str, feedback: Dict[str, Any],
+                                         n: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Async form of improve_report_candidates."""
+        prompt = self._improvement_prompt(current_report, feedback)
+        system_prompt = self.prompts["generation"]["system_prompt"]
+        
+        # Sampled at self.temperature and not served from the cache, so each
+        # candidate is a different rewrite
+        client_class = AsyncOpenAI if self.provider == "openai" else AsyncAnthropic
+        async with client_class(api_key=self.api_key) as client:
+            responses = await asyncio.gather(*(
+                self._acall_improvement_llm(client, prompt, system_prompt) for _ in range(n)
+            ))
+        return [self._parse_improvement(current_report, response) for response in responses]
+    
+    def _improvement_prompt(self, current_report: str, feedback: Dict[str, Any]) -> str:
+        """Return the improvement prompt for a report and its feedback."""
+        improvement_prompt = self.prompts["improvement"]["prompt"] + IMPROVEMENT_OUTPUT_FORMAT
         
         # Format scores and feedback
         scores_text = "\n".join([
@@ -153,13 +393,30 @@ class ScriptGenerator:
             for cat, info in feedback.items()
         ])
         
-        prompt = improvement_prompt.format(
+        return improvement_prompt.format(
             scores_and_feedback=scores_text,
-            current_report=current_report
+            current_report=current_report,
+            categories="\n".join(f"- {category}" for category in feedback)
         )
+    
+    def _parse_improvement(self, current_report: str,
+                           response: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """Split an improvement reply into the improved report and its scores.
         
-        system_prompt = self.prompts["generation"]["system_prompt"]
-        improved_report = self._call_llm(prompt, system_prompt)
-        
-        return improved_report
-
+        A missing or unparseable reply keeps current_report, with empty scores
+        so the caller re-evaluates it.
+        """
+        if response is None:
+            return current_report, {}
+        try:
+            result = extract_json(response)
+        except json.JSONDecodeError:
+            print("  ⚠️ Improvement reply wasn't valid JSON; keeping the current report")
+            return current_report, {}
+        if not isinstance(result, dict) or not isinstance(result.get("improved_report"), str):
+            print("  ⚠️ Improvement reply had no improved_report; keeping the current report")
+            return current_report, {}
+        if result.get("changed_sections"):
+            print(f"  Rewrote: {', '.join(map(str, result['changed_sections']))}")
+        scores = result.get("scores")
+        return result["improved_report"], scores if isinstance(scores, dict) else {}
@@ -0,0 +1,91 @@
+"""Shared OpenAI client with one tuned connection pool"""
+
+import functools
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+import openai
+from anthropic import Anthropic
+from openai import OpenAI
+
+from .utils import get_api_key
+
+# Set when the API turned down OPENAI_SERVICE_TIER, so later calls stop sending it
+_service_tier_rejected = False
+
+
+@functools.lru_cache(maxsize=1)
+def get_shared_openai() -> OpenAI:
+    """
+    Return the process-wide OpenAI client.
+    
+    Every module that talks to OpenAI synchronously shares this client, so
+    they reuse one pool of keep-alive HTTP/2 connections instead of each
+    opening their own.
+    
+    Returns:
+        OpenAI client backed by a shared httpx.Client
+    """
+    http_client = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(120.0, connect=10.0),
+    )
+    return OpenAI(api_key=get_api_key(), http_client=http_client)
+
+
+@functools.lru_cache(maxsize=None)
+def get_shared_anthropic(api_key: str) -> Anthropic:
+    """
+    Return the process-wide Anthropic client for an API key.
+    
+    The Anthropic counterpart of get_shared_openai(), so every generator and
+    evaluator built for the same key shares one connection pool.
+    
+    Args:
+        api_key: Anthropic API key
+    
+    Returns:
+        Anthropic client backed by a shared httpx.Client
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(120.0, connect=10.0),
+    )
+    return Anthropic(api_key=api_key, http_client=http_client)
+
+
+def service_tier() -> Optional[str]:
+    """
+    Return the OpenAI service tier requested through OPENAI_SERVICE_TIER.
+    
+    "priority" trades a higher per-token price for lower latency on the
+    models that support it.
+    
+    Returns:
+        Tier name, or None to use the project's default tier
+    """
+    if _service_tier_rejected:
+        return None
+    return os.getenv("OPENAI_SERVICE_TIER") or None
+
+
+def drop_rejected_service_tier(request: Dict[str, Any], error: Exception) -> bool:
+    """
+    Remove the service tier from a request the API rejected because of it.
+    
+    Args:
+        request: Keyword arguments of the failed chat.completions.create call
+        error: Exception the call raised
+    
+    Returns:
+        True if the request should be retried without the tier
+    """
+    global _service_tier_rejected
+    if not (isinstance(error, openai.BadRequestError) and "service_tier" in request
+            and "service_tier" in str(error)):
+        return False
+    print(f"  ⚠️ service_tier={request.pop('service_tier')!r} rejected, using the default tier: {error}")
+    _service_tier_rejected = True
+    return True
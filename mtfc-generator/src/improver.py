@@ -1,11 +1,41 @@
 """Iterative improvement engine for MTFC reports"""
 
 import json
-from typing import Dict, Any, List
+import os
+from pathlib import Path
+from typing import Dict, Any
 from .generator import ScriptGenerator
 from .evaluator import RubricEvaluator
 from .utils import load_config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed, fall back to stdlib json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # zstandard not installed, history is saved as plain JSON
+
+# Improvements sampled concurrently per iteration; the best-scoring one is kept
+BEST_OF_N = int(os.getenv("BEST_OF_N", "1"))
+# When set, fewer candidates are sampled if BEST_OF_N of them would exceed
+# this many tokens in one iteration
+TOKENS_PER_MINUTE = int(os.getenv("MTFC_TOKENS_PER_MINUTE", "0"))
+
+
+def empty_history() -> Dict[str, Any]:
+    """
+    Return an empty iteration history.
+    
+    The history is stored column-wise: one list per field, and per category
+    for scores and feedback, with entry i of every list describing the
+    i-th iteration. Category names are then stored once rather than once per
+    iteration.
+    """
+    return {"iterations": [], "weighted_totals": [], "scores": {}, "feedback": {}}
+
 
 class ImprovementEngine:
     """Iteratively improves MTFC reports until all criteria meet the threshold."""
@@ -23,8 +53,9 @@ class ImprovementEngine:
         self.rubric_config = load_config("rubric")
         self.target_score = self.rubric_config["target_score"]
         self.max_iterations = self.rubric_config["max_iterations"]
+        self.best_of_n = BEST_OF_N
         
-        self.iteration_history: List[Dict[str, Any]] = []
+        self.history = empty_history()
     
     def improve_until_threshold(self, initial_report: str, 
                                scenario_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -43,23 +74,23 @@ class ImprovementEngine:
         
         print(f"Starting iterative improvement (target: {self.target_score}, max iterations: {self.max_iterations})...")
         
+        # Only the initial report needs its own evaluation call; each
+        # improvement comes back already scored
+        evaluation = self.evaluator.evaluate_report(current_report)
+        
         while iteration < self.max_iterations:
             iteration += 1
             print(f"\n{'='*60}")
             print(f"Iteration {iteration}")
             print(f"{'='*60}")
             
-            # Evaluate current report
-            evaluation = self.evaluator.evaluate_report(current_report)
-            
             # Store iteration history
-            iteration_data = {
-                "iteration": iteration,
-                "scores": evaluation["scores"].copy(),
-                "weighted_total": evaluation["weighted_total"],
-                "feedback": evaluation["feedback"].copy()
-            }
-            self.iteration_history.append(iteration_data)
+            self.history["iterations"].append(iteration)
+            self.history["weighted_totals"].append(evaluation["weighted_total"])
+            for category, score in evaluation["scores"].items():
+                self.history["scores"].setdefault(category, []).append(score)
+            for category, feedback in evaluation["feedback"].items():
+                self.history["feedback"].setdefault(category, []).append(feedback)
             
             # Print current scores
             print(f"\nCurrent Scores:")
@@ -80,25 +111,51 @@ class ImprovementEngine:
             print(f"\nCategories below threshold: {', '.join(categories_below)}")
             
             # Improve the report
-            print("\nImproving report...")
-            current_report = self.generator.improve_report(
-                current_report, 
-                evaluation["feedback"]
-            )
+            n = self._candidate_count(current_report)
+            if n > 1:
+                print(f"\nImproving report ({n} candidates)...")
+                candidates = self.generator.improve_report_candidates(
+                    current_report,
+                    evaluation["feedback"],
+                    n
+                )
+                evaluations = [
+                    self.evaluator.evaluation_from_scores(scores, report)
+                    for report, scores in candidates
+                ]
+                best = max(range(n), key=lambda i: evaluations[i]["weighted_total"])
+                totals = ", ".join(f"{e['weighted_total']:.2f}" for e in evaluations)
+                print(f"  Kept candidate {best + 1} (weighted totals: {totals})")
+                current_report, evaluation = candidates[best][0], evaluations[best]
+            else:
+                print("\nImproving report...")
+                current_report, scores = self.generator.improve_report(
+                    current_report, 
+                    evaluation["feedback"]
+                )
+                evaluation = self.evaluator.evaluation_from_scores(scores, current_report)
         
-        # Final evaluation
-        final_evaluation = self.evaluator.evaluate_report(current_report)
+        final_evaluation = evaluation
         
         return {
             "final_report": current_report,
             "final_scores": final_evaluation["scores"],
             "final_weighted_total": final_evaluation["weighted_total"],
-            "iteration_history": self.iteration_history,
+            "iteration_history": self.history,
             "total_iterations": iteration,
             "converged": iteration < self.max_iterations,
             "passed": final_evaluation["weighted_total"] >= self.target_score
         }
     
+    def _candidate_count(self, report: str) -> int:
+        """Number of improvement candidates to sample for report, within TOKENS_PER_MINUTE."""
+        n = max(1, self.best_of_n)
+        if TOKENS_PER_MINUTE and n > 1:
+            # Each candidate sends the report and gets a rewrite of about the same length back
+            per_candidate = 2 * self.evaluator.count_tokens(report)
+            n = max(1, min(n, TOKENS_PER_MINUTE // max(per_candidate, 1)))
+        return n
+    
     def generate_and_improve(self, scenario_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Generate an initial report and iteratively improve it.
@@ -119,25 +176,65 @@ class ImprovementEngine:
     
     def get_improvement_summary(self) -> str:
         """Get a summary of the improvement process."""
-        if not self.iteration_history:
+        weighted_totals = self.history["weighted_totals"]
+        if not weighted_totals:
             return "No iterations completed."
         
         summary_parts = [
-            f"Total Iterations: {len(self.iteration_history)}",
-            f"Final Weighted Score: {self.iteration_history[-1]['weighted_total']:.2f}/100",
+            f"Total Iterations: {len(weighted_totals)}",
+            f"Final Weighted Score: {weighted_totals[-1]:.2f}/100",
             "\nIteration History:"
         ]
         
-        for i, iteration in enumerate(self.iteration_history, 1):
-            summary_parts.append(f"\nIteration {i}:")
-            summary_parts.append(f"  Weighted Total: {iteration['weighted_total']:.2f}/100")
-            for category, score in iteration["scores"].items():
-                summary_parts.append(f"  {category}: {score}/100")
+        for i, weighted_total in enumerate(weighted_totals):
+            summary_parts.append(f"\nIteration {i + 1}:")
+            summary_parts.append(f"  Weighted Total: {weighted_total:.2f}/100")
+            for category, scores in self.history["scores"].items():
+                summary_parts.append(f"  {category}: {scores[i]}/100")
         
         return "\n".join(summary_parts)
     
-    def save_iteration_history(self, filepath: str):
-        """Save iteration history to a JSON file."""
-        with open(filepath, "w") as f:
-            json.dump(self.iteration_history, f, indent=2)
+    def save_iteration_history(self, filepath: str) -> str:
+        """
+        Save iteration history to a JSON file.
+        
+        When zstandard is installed the JSON is zstd-compressed and ".zst" is
+        appended to the file name.
+        
+        Args:
+            filepath: Path of the JSON file
+        
+        Returns:
+            Path of the file written
+        """
+        if zstandard is not None:
+            data = orjson.dumps(self.history) if orjson is not None else json.dumps(self.history).encode("utf-8")
+            path = Path(f"{filepath}.zst")
+            path.write_bytes(zstandard.ZstdCompressor(level=6).compress(data))
+        elif orjson is not None:
+            path = Path(filepath)
+            path.write_bytes(orjson.dumps(self.history, option=orjson.OPT_INDENT_2))
+        else:
+            path = Path(filepath)
+            with open(path, "w") as f:
+                json.dump(self.history, f, indent=2)
+        return str(path)
+    
+    def load_iteration_history(self, filepath: str) -> Dict[str, Any]:
+        """
+        Load a history written by save_iteration_history.
+        
+        Args:
+            filepath: Path of the JSON or .zst file
+        
+        Returns:
+            The loaded history, which also replaces this engine's history
+        """
+        data = Path(filepath).read_bytes()
+        if filepath.endswith(".zst"):
+            if zstandard is None:
+                raise ImportError("zstandard is required to read compressed iteration history")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        self.history = orjson.loads(data) if orjson is not None else json.loads(data)
+        return self.history
 
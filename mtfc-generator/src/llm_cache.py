@@ -0,0 +1,252 @@
+"""Disk cache for LLM responses, exact-match with an optional semantic fallback"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .http_client import get_shared_openai
+from .semantic_cache import make_semantic_cache
+
+CACHE_DIR = Path("~/.mtfc/llm_cache").expanduser()
+CACHE_TTL = 14 * 24 * 3600  # seconds
+# Above this temperature a response is one sample of many, so MTFC_NOCACHE=1
+# sends such requests to the API every time
+NOCACHE_TEMPERATURE = 0.5
+
+# With MTFC_SEMANTIC_CACHE=1 an exact-cache miss is looked up again by the
+# prompt's embedding, so a near-identical prompt (e.g. a paper with one
+# section reworded) reuses the earlier response
+SEMANTIC_THRESHOLD = 0.97
+EMBEDDING_MODEL = "text-embedding-3-small"
+# text-embedding-3-small takes at most 8191 tokens; longer prompts are
+# embedded from their first EMBED_MAX_CHARS characters
+EMBED_MAX_CHARS = 24000
+# Concurrent async lookups arriving within this window (seconds) share one
+# embeddings request of up to EMBED_BATCH_SIZE prompts
+EMBED_BATCH_WINDOW = 0.02
+EMBED_BATCH_SIZE = 32
+_semantic_caches = {}
+_batcher = None
+
+
+def cache_key(*parts) -> str:
+    """Hash the JSON-serialized request parts into a cache key."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_enabled(temperature: float) -> bool:
+    """Whether responses at this temperature are served from and stored in the cache."""
+    return not (temperature > NOCACHE_TEMPERATURE and os.getenv("MTFC_NOCACHE") == "1")
+
+
+def lookup(key: str) -> Optional[str]:
+    """Return the cached response for key, or None if missing or older than CACHE_TTL."""
+    path = CACHE_DIR / f"{key}.txt"
+    try:
+        if time.time() - path.stat().st_mtime > CACHE_TTL:
+            return None
+        return path.read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def store(key: str, response: str) -> None:
+    """Save a response under key, atomically so a crash can't leave a truncated entry."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = CACHE_DIR / f"{key}.txt"
+    # Per-writer temp name, so concurrent stores of one key don't share a file
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(response, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def semantic_enabled() -> bool:
+    """Whether exact-cache misses fall back to the semantic cache (MTFC_SEMANTIC_CACHE=1)."""
+    return os.getenv("MTFC_SEMANTIC_CACHE") == "1"
+
+
+def _semantic_cache(namespace_parts: tuple):
+    """Semantic cache shared only by requests that match on everything but the prompt text."""
+    namespace = cache_key(*namespace_parts)[:16]
+    if namespace not in _semantic_caches:
+        _semantic_caches[namespace] = make_semantic_cache(
+            CACHE_DIR / f"semantic_{namespace}.pkl",
+            threshold=SEMANTIC_THRESHOLD
+        )
+    return _semantic_caches[namespace]
+
+
+class EmbeddingBatcher:
+    """
+    Coalesce concurrent embedding requests on one event loop into batched API calls.
+
+    Each embed() call joins the pending batch, which is sent as a single
+    embeddings request once EMBED_BATCH_WINDOW has passed since its first
+    text or it reaches EMBED_BATCH_SIZE texts.
+    """
+
+    def __init__(self, window: float = EMBED_BATCH_WINDOW, max_batch: int = EMBED_BATCH_SIZE):
+        self.loop = asyncio.get_running_loop()
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []  # (text, future)
+        self._timer = None
+        self._tasks = set()  # keeps in-flight batch requests from being garbage collected
+
+    async def embed(self, text: str) -> list:
+        """Return the embedding of text, raising if its batch's request failed."""
+        future = self.loop.create_future()
+        self._pending.append((text[:EMBED_MAX_CHARS], future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        task = self.loop.create_task(self._request(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _request(self, batch):
+        try:
+            result = await asyncio.to_thread(
+                get_shared_openai().embeddings.create,
+                model=EMBEDDING_MODEL,
+                input=[text for text, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for item in result.data:
+            future = batch[item.index][1]
+            if not future.done():
+                future.set_result(item.embedding)
+
+
+def _embedding_batcher() -> EmbeddingBatcher:
+    """The batcher for the running event loop, replacing one left from an earlier loop."""
+    global _batcher
+    if _batcher is None or _batcher.loop is not asyncio.get_running_loop():
+        _batcher = EmbeddingBatcher()
+    return _batcher
+
+
+def _semantic_match(namespace_parts: tuple, embedding: list) -> Optional[str]:
+    """Return the unexpired response stored under the nearest embedding, if any."""
+    entry = _semantic_cache(namespace_parts).lookup(embedding)
+    # Entries are (stored at, response); expire them like exact-cache files
+    if not isinstance(entry, tuple) or time.time() - entry[0] > CACHE_TTL:
+        return None
+    print("  (semantic cache hit)")
+    return entry[1]
+
+
+def semantic_lookup(namespace_parts: tuple, text: str) -> Tuple[Optional[list], Optional[str]]:
+    """
+    Look up a response by the embedding of its prompt text.
+
+    Args:
+        namespace_parts: The rest of the request (provider, model, temperature,
+            system prompt, ...), which must match exactly
+        text: Prompt text to embed
+
+    Returns:
+        (embedding, cached response or None); the embedding is None when the
+        embedding call failed, so the response can't be stored either
+    """
+    try:
+        result = get_shared_openai().embeddings.create(model=EMBEDDING_MODEL, input=text[:EMBED_MAX_CHARS])
+    except Exception as e:
+        print(f"  ⚠️ Embedding failed, skipping semantic cache: {e}")
+        return None, None
+    embedding = result.data[0].embedding
+    return embedding, _semantic_match(namespace_parts, embedding)
+
+
+async def asemantic_lookup(namespace_parts: tuple, text: str) -> Tuple[Optional[list], Optional[str]]:
+    """
+    semantic_lookup() for coroutines, batching the embedding with concurrent lookups.
+
+    Args:
+        namespace_parts: The rest of the request, which must match exactly
+        text: Prompt text to embed
+
+    Returns:
+        (embedding, cached response or None), as from semantic_lookup()
+    """
+    try:
+        embedding = await _embedding_batcher().embed(text)
+    except Exception as e:
+        print(f"  ⚠️ Embedding failed, skipping semantic cache: {e}")
+        return None, None
+    return embedding, _semantic_match(namespace_parts, embedding)
+
+
+def semantic_store(namespace_parts: tuple, key: str, embedding: list, response: str) -> None:
+    """Save a response under the embedding semantic_lookup() computed for it."""
+    _semantic_cache(namespace_parts).add(key, embedding, (time.time(), response))
+
+
+def cached_llm_call(method=None, *, semantic: bool = False):
+    """
+    Serve repeated calls of an LLM method from the disk cache.
+
+    The key covers the instance's provider, model and temperature plus every
+    argument of the call (defaults included), so any change to the request
+    misses the cache.
+
+    Args:
+        method: Method of an object with provider, model and temperature attributes
+        semantic: On an exact miss, also try the semantic cache (when
+            semantic_enabled()), matching on the method's prompt argument
+
+    Returns:
+        Wrapped method, or a decorator when given only keyword arguments
+    """
+    if method is None:
+        return functools.partial(cached_llm_call, semantic=semantic)
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not cache_enabled(self.temperature):
+            return method(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        request = {name: value for name, value in bound.arguments.items() if name != "self"}
+        key = cache_key(self.provider, self.model, self.temperature, request)
+
+        response = lookup(key)
+        if response is not None:
+            return response
+
+        embedding = None
+        if semantic and semantic_enabled():
+            rest = {name: value for name, value in request.items() if name != "prompt"}
+            namespace_parts = (self.provider, self.model, self.temperature, rest)
+            embedding, response = semantic_lookup(namespace_parts, request["prompt"])
+            if response is not None:
+                return response
+
+        response = method(self, *args, **kwargs)
+        if response is not None:
+            store(key, response)
+            if embedding is not None:
+                semantic_store(namespace_parts, key, embedding, response)
+        return response
+
+    return wrapper
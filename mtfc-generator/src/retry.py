@@ -0,0 +1,27 @@
+"""Retry policy for transient LLM API errors"""
+
+import anthropic
+import openai
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+# Rate limits, timeouts, dropped connections and 5xx responses
+TRANSIENT_ERRORS = (
+    openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError,
+    anthropic.RateLimitError, anthropic.APITimeoutError, anthropic.APIConnectionError, anthropic.InternalServerError,
+)
+
+
+def _log_retry(retry_state):
+    error = retry_state.outcome.exception()
+    print(f"    {type(error).__name__}, retrying (attempt {retry_state.attempt_number + 1})...")
+
+
+# Exponential backoff with full jitter, so calls that fail together (e.g. the
+# concurrent category evaluations hitting a rate limit) don't retry in lockstep
+llm_retry = retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(multiplier=1, max=60),
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    before_sleep=_log_retry,
+    reraise=True,
+)
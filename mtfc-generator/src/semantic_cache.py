@@ -0,0 +1,204 @@
+"""Semantic response caches matched by embedding cosine similarity"""
+
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None  # faiss-cpu not installed, semantic cache uses NumPy only
+
+CACHE_SIMILARITY_THRESHOLD = 0.87
+CACHE_MAX_SIZE = 200
+# Above this many entries a FAISS index beats the NumPy linear scan
+FAISS_MIN_SIZE = 1000
+
+
+class SemanticCache:
+    """LRU cache of (embedding, response) pairs matched by cosine similarity
+
+    Embeddings live in one preallocated float32 matrix with precomputed L2
+    norms, so a lookup is a single matrix-vector product plus an argmax.
+    """
+
+    def __init__(self, path: Union[str, Path], threshold: float = CACHE_SIMILARITY_THRESHOLD,
+                 maxsize: int = CACHE_MAX_SIZE):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._matrix = None  # (capacity, dim) float32, rows [0, size) in use
+        self._norms = None
+        self._keys = []  # row -> key
+        self._responses = []  # row -> response
+        self._rows = OrderedDict()  # key -> row, least recently used first
+        if self.path.exists():
+            try:
+                with open(self.path, "rb") as f:
+                    state = pickle.load(f)
+                self._matrix = state["matrix"]
+                self._norms = state["norms"]
+                self._keys = state["keys"]
+                self._responses = state["responses"]
+                self._rows = state["rows"]
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+                self._matrix = self._norms = None
+                self._keys, self._responses, self._rows = [], [], OrderedDict()
+
+    def lookup(self, embedding: Sequence[float]) -> Optional[object]:
+        """Return the cached response most similar to embedding, or None"""
+        size = len(self._keys)
+        if not size:
+            return None
+        q = np.asarray(embedding, dtype=np.float32)
+        sims = self._matrix[:size] @ q / (self._norms[:size] * np.linalg.norm(q))
+        best = int(sims.argmax())
+        if sims[best] < self.threshold:
+            return None
+        self._rows.move_to_end(self._keys[best])
+        return self._responses[best]
+
+    def _allocate_row(self, dim):
+        """Return a free row, growing the matrix with headroom or evicting the LRU entry"""
+        size = len(self._keys)
+        if size >= self.maxsize:
+            _, row = self._rows.popitem(last=False)
+            return row
+        if self._matrix is None:
+            self._matrix = np.empty((min(16, self.maxsize), dim), dtype=np.float32)
+            self._norms = np.empty(len(self._matrix), dtype=np.float32)
+        elif size == len(self._matrix):
+            capacity = min(2 * len(self._matrix), self.maxsize)
+            matrix = np.empty((capacity, dim), dtype=np.float32)
+            matrix[:size] = self._matrix
+            norms = np.empty(capacity, dtype=np.float32)
+            norms[:size] = self._norms
+            self._matrix, self._norms = matrix, norms
+        self._keys.append(None)
+        self._responses.append(None)
+        return size
+
+    def add(self, key: str, embedding: Sequence[float], response: object) -> None:
+        """Store a new pair, evicting the least recently used entry when full"""
+        vec = np.asarray(embedding, dtype=np.float32)
+        row = self._rows.pop(key, None)
+        if row is None:
+            row = self._allocate_row(len(vec))
+        self._matrix[row] = vec
+        self._norms[row] = np.linalg.norm(vec)
+        self._keys[row] = key
+        self._responses[row] = response
+        self._rows[key] = row
+        self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "wb") as f:
+            pickle.dump({
+                "matrix": self._matrix,
+                "norms": self._norms,
+                "keys": self._keys,
+                "responses": self._responses,
+                "rows": self._rows,
+            }, f)
+
+
+class FaissSemanticCache(SemanticCache):
+    """SemanticCache backed by a FAISS inner-product index for large caches
+
+    Embeddings are L2-normalized on insert so inner product equals cosine
+    similarity; the index is persisted next to the pickle as a .faiss file.
+    """
+
+    def __init__(self, path: Union[str, Path], threshold: float = CACHE_SIMILARITY_THRESHOLD,
+                 maxsize: int = CACHE_MAX_SIZE):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".faiss")
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._index = None
+        self._keys, self._responses, self._rows = [], [], OrderedDict()
+        if self.path.exists() and self.index_path.exists():
+            try:
+                with open(self.path, "rb") as f:
+                    state = pickle.load(f)
+                self._keys = state["keys"]
+                self._responses = state["responses"]
+                self._rows = state["rows"]
+                self._index = faiss.read_index(str(self.index_path))
+            except (OSError, RuntimeError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+                self._index = None
+                self._keys, self._responses, self._rows = [], [], OrderedDict()
+
+    @staticmethod
+    def _normalized(embedding):
+        vec = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vec)
+        return vec
+
+    def lookup(self, embedding: Sequence[float]) -> Optional[object]:
+        """Return the cached response most similar to embedding, or None"""
+        if self._index is None or not self._rows:
+            return None
+        sims, rows = self._index.search(self._normalized(embedding), 1)
+        best = int(rows[0, 0])
+        if best < 0 or sims[0, 0] < self.threshold:
+            return None
+        self._rows.move_to_end(self._keys[best])
+        return self._responses[best]
+
+    def _allocate_row(self, dim):
+        """Return a free row id, evicting the LRU entry when full"""
+        if len(self._keys) >= self.maxsize:
+            _, row = self._rows.popitem(last=False)
+            self._index.remove_ids(np.array([row], dtype=np.int64))
+            return row
+        self._keys.append(None)
+        self._responses.append(None)
+        return len(self._keys) - 1
+
+    def add(self, key: str, embedding: Sequence[float], response: object) -> None:
+        """Store a new pair, evicting the least recently used entry when full"""
+        vec = self._normalized(embedding)
+        if self._index is None:
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vec.shape[1]))
+        row = self._rows.pop(key, None)
+        if row is None:
+            row = self._allocate_row(vec.shape[1])
+        else:
+            self._index.remove_ids(np.array([row], dtype=np.int64))
+        self._index.add_with_ids(vec, np.array([row], dtype=np.int64))
+        self._keys[row] = key
+        self._responses[row] = response
+        self._rows[key] = row
+        self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(self._index, str(self.index_path))
+        with open(self.path, "wb") as f:
+            pickle.dump({"keys": self._keys, "responses": self._responses, "rows": self._rows}, f)
+
+
+def make_semantic_cache(path: Union[str, Path], maxsize: int = CACHE_MAX_SIZE,
+                        threshold: float = CACHE_SIMILARITY_THRESHOLD) -> SemanticCache:
+    """
+    Create a semantic cache, using the FAISS-backed one for large caches.
+
+    Args:
+        path: Pickle file the cache persists to
+        maxsize: Maximum number of entries before LRU eviction
+        threshold: Minimum cosine similarity for a lookup to count as a hit
+
+    Returns:
+        FaissSemanticCache when faiss is installed and maxsize exceeds
+        FAISS_MIN_SIZE, otherwise the NumPy-backed SemanticCache
+    """
+    if faiss is not None and maxsize > FAISS_MIN_SIZE:
+        return FaissSemanticCache(path, threshold=threshold, maxsize=maxsize)
+    return SemanticCache(path, threshold=threshold, maxsize=maxsize)
+
+
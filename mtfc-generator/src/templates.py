@@ -1,43 +1,42 @@
 """Template system for MTFC report generation"""
 
+from collections import defaultdict
 from typing import Dict, Any
 from .utils import load_config
 
 
+# Config key of each report step's prompt under "generation"
+STEP_KEYS = {
+    1: "step_1_project_definition",
+    2: "step_2_data_identification",
+    3: "step_3_mathematical_modeling",
+    4: "step_4_risk_analysis",
+    5: "step_5_recommendations"
+}
+
+
 class ReportTemplate:
     """Template manager for MTFC reports."""
     
     def __init__(self):
         self.prompts = load_config("prompts")
         self.generation_prompts = self.prompts["generation"]
+        # The templates never change at runtime, so look them up once
+        self._step_templates = {
+            step: self.generation_prompts[key]["prompt"]
+            for step, key in STEP_KEYS.items()
+            if key in self.generation_prompts
+        }
     
     def get_step_prompt(self, step: int, context: Dict[str, Any]) -> str:
         """Get the prompt for a specific step."""
-        step_keys = {
-            1: "step_1_project_definition",
-            2: "step_2_data_identification",
-            3: "step_3_mathematical_modeling",
-            4: "step_4_risk_analysis",
-            5: "step_5_recommendations"
-        }
-        
-        if step not in step_keys:
+        if step not in STEP_KEYS:
             raise ValueError(f"Invalid step number: {step}. Must be 1-5.")
         
-        step_key = step_keys[step]
-        prompt_template = self.generation_prompts[step_key]["prompt"]
-        
-        # Extract format keys from the template and ensure all are provided
-        import string
-        formatter = string.Formatter()
-        format_keys = [field_name for _, field_name, _, _ in formatter.parse(prompt_template) if field_name]
-        
-        # Build safe context with defaults for missing keys
-        safe_context = {}
-        for key in format_keys:
-            safe_context[key] = context.get(key, "")
+        prompt_template = self._step_templates[step]
         
-        return prompt_template.format(**safe_context)
+        # Placeholders missing from context format as ""
+        return prompt_template.format_map(defaultdict(str, context))
     
     def format_full_report(self, steps: Dict[int, str], scenario_name: str) -> str:
         """Format the complete report from individual steps."""
@@ -1,9 +1,12 @@
 """Utility functions for MTFC Generator"""
 
+import functools
 import json
 import os
-from typing import Dict, Any
+import re
+from typing import Dict, Any, List, Optional, Union
 from pathlib import Path
+from pydantic import BaseModel, ConfigDict, Field
 
 # Try to load .env file if python-dotenv is available
 try:
@@ -12,12 +15,94 @@ try:
 except ImportError:
     pass  # python-dotenv not installed, skip
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed, fall back to stdlib json
+
+_FENCED_JSON_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_BARE_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+class CategoryWeight(BaseModel):
+    """A rubric weight with its own evaluation reply cap."""
+    model_config = ConfigDict(extra="forbid")
+    
+    weight: float = Field(ge=0)
+    max_tokens: Optional[int] = Field(default=None, gt=0)
+
+
+class RubricConfig(BaseModel):
+    """Schema for config/rubric.json."""
+    model_config = ConfigDict(extra="allow")
+    
+    weights: Dict[str, Union[float, CategoryWeight]]
+    target_score: float = Field(ge=0, le=100)
+    max_iterations: int = Field(gt=0)
+    category_sections: Optional[Dict[str, List[int]]] = None
+
 
+class PromptTemplate(BaseModel):
+    """A prompt entry holding a format-string template."""
+    model_config = ConfigDict(extra="allow")
+    
+    prompt: str
+
+
+class PromptsConfig(BaseModel):
+    """Schema for config/prompts.json (system prompts are plain strings)."""
+    model_config = ConfigDict(extra="allow")
+    
+    generation: Dict[str, Union[str, PromptTemplate]]
+    evaluation: Dict[str, Union[str, PromptTemplate]]
+    improvement: PromptTemplate
+
+
+CONFIG_SCHEMAS = {
+    "rubric": RubricConfig,
+    "prompts": PromptsConfig
+}
+
+
+@functools.lru_cache(maxsize=None)
 def load_config(config_name: str) -> Dict[str, Any]:
-    """Load a configuration file from the config directory."""
+    """
+    Load a configuration file from the config directory.
+    
+    Each file is read and validated once per process; later calls return the
+    same dict, so callers must not modify it.
+    """
     config_path = Path(__file__).parent.parent / "config" / f"{config_name}.json"
     with open(config_path, "r") as f:
-        return json.load(f)
+        config = json.load(f)
+    if config_name in CONFIG_SCHEMAS:
+        # Raises pydantic.ValidationError naming the bad key
+        CONFIG_SCHEMAS[config_name].model_validate(config)
+    return config
+
+
+def extract_json(response: str) -> Any:
+    """
+    Parse the JSON object in an LLM response, handling markdown code blocks.
+    
+    Raises:
+        json.JSONDecodeError: If the response holds no valid JSON
+    """
+    # Try to find JSON in code blocks
+    json_match = _FENCED_JSON_RE.search(response)
+    if json_match:
+        json_str = json_match.group(1)
+    else:
+        # Try to find JSON object directly
+        json_match = _BARE_JSON_RE.search(response)
+        if json_match:
+            json_str = json_match.group(0)
+        else:
+            # Fallback: try to parse the whole response
+            json_str = response
+    
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return orjson.loads(json_str) if orjson is not None else json.loads(json_str)
 
 
 def get_api_key() -> str:
@@ -13,17 +13,54 @@ RUBRIC = {
     "Communication & Clarity": 0.05
 }
 
+_SCORES_SECTION_RE = re.compile(
+    r'(?:SCORES?|RUBRIC SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|OVERALL|TOTAL|$)',
+    re.IGNORECASE | re.DOTALL
+)
+
+def _key_variations(key):
+    """Spellings a category is matched under (matching ignores case)"""
+    return [
+        key,  # Full key
+        key.replace(" & ", " and "),  # "and" instead of "&"
+        key.replace(" & ", " "),  # Without "&"
+    ]
+
+# Per category: "Category: 85" / "Category - 85" / "Category = 85", then the
+# reversed "85: Category"
+_CATEGORY_RES = {
+    key: (
+        re.compile(
+            rf"(?:{'|'.join(map(re.escape, _key_variations(key)))})\s*[:=\-]?\s*(\d+(?:\.\d+)?)",
+            re.IGNORECASE
+        ),
+        re.compile(
+            rf"(\d+(?:\.\d+)?)\s*:?\s*(?:{'|'.join(map(re.escape, _key_variations(key)))})",
+            re.IGNORECASE
+        ),
+    )
+    for key in RUBRIC
+}
+
+# Weighted total formats, in order of preference
+_TOTAL_RES = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)',
+        r'OVERALL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'TOTAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'FINAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
+        r'WEIGHTED\s*:?\s*(\d+(?:\.\d+)?)',
+    )
+]
+
 def extract_scores(response):
     """Pull numeric rubric scores from model output"""
     scores = {}
     total = 0
     
     # Try to find scores section - look for "SCORES" or "SCORE" header
-    scores_section_match = re.search(
-        r'(?:SCORES?|RUBRIC SCORES?|EVALUATION)\s*:?\s*\n(.*?)(?:WEIGHTED TOTAL|OVERALL|TOTAL|$)', 
-        response, 
-        re.IGNORECASE | re.DOTALL
-    )
+    scores_section_match = _SCORES_SECTION_RE.search(response)
     
     if scores_section_match:
         score_text = scores_section_match.group(1)
@@ -32,50 +69,20 @@ def extract_scores(response):
         score_text = response
     
     # Extract scores for each rubric category
-    for key in RUBRIC.keys():
-        # Create flexible patterns - handle various formats
-        key_variations = [
-            key,  # Full key
-            key.lower(),  # Lowercase
-            key.replace(" & ", " and "),  # "and" instead of "&"
-            key.replace(" & ", " "),  # Without "&"
-        ]
-        
-        # Try different patterns for each variation
-        for key_var in key_variations:
-            patterns = [
-                rf"{re.escape(key_var)}\s*:?\s*(\d+(?:\.\d+)?)",  # "Category: 85"
-                rf"{re.escape(key_var)}\s*-\s*(\d+(?:\.\d+)?)",  # "Category - 85"
-                rf"{re.escape(key_var)}\s*=\s*(\d+(?:\.\d+)?)",  # "Category = 85"
-                rf"(\d+(?:\.\d+)?)\s*:?\s*{re.escape(key_var)}",  # "85: Category"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, score_text, re.IGNORECASE)
-                if match:
-                    try:
-                        val = float(match.group(1))
-                        # Only accept reasonable scores
-                        if 0 <= val <= 100:
-                            scores[key] = val
-                            break
-                    except (ValueError, IndexError):
-                        continue
-            
+    for key, patterns in _CATEGORY_RES.items():
+        for pattern in patterns:
+            for match in pattern.finditer(score_text):
+                val = float(match.group(1))
+                # Only accept reasonable scores
+                if 0 <= val <= 100:
+                    scores[key] = val
+                    break
             if key in scores:
                 break
     
     # Extract weighted total - look for various formats
-    total_patterns = [
-        r'WEIGHTED TOTAL\s*:?\s*(\d+(?:\.\d+)?)',
-        r'OVERALL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'TOTAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'FINAL SCORE\s*:?\s*(\d+(?:\.\d+)?)',
-        r'WEIGHTED\s*:?\s*(\d+(?:\.\d+)?)',
-    ]
-    
-    for pattern in total_patterns:
-        total_match = re.search(pattern, response, re.IGNORECASE)
+    for pattern in _TOTAL_RES:
+        total_match = pattern.search(response)
         if total_match:
             try:
                 total = float(total_match.group(1))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Test that run_iteration_fixed grades each rubric category on its own part of the script"""
+
+import os
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+# run_iteration_fixed exits at import without a key; no API call is made here
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from run_iteration_fixed import RUBRIC, RUBRIC_SECTIONS
+
+_PART_RE = re.compile(r'^Part \d+: (.+?)\s*$')
+_STEP_RE = re.compile(r'^#(\d+):')
+
+def script_parts(script):
+    """Map each "Part N: <name>" heading of a script to the step numbers under it"""
+    parts = {}
+    current = None
+    for line in script.splitlines():
+        part = _PART_RE.match(line)
+        if part:
+            current = parts.setdefault(part.group(1), [])
+            continue
+        step = _STEP_RE.match(line)
+        if step and current is not None:
+            current.append(int(step.group(1)))
+    return parts
+
+def test_rubric_sections_match_script():
+    """Each category's step range spans exactly the steps of the part it is named after"""
+    print("Testing RUBRIC_SECTIONS against initial_script.txt...")
+    print("="*60)
+    
+    script = (Path(__file__).parent / "initial_script.txt").read_text(encoding="utf-8")
+    parts = script_parts(script)
+    
+    assert set(RUBRIC_SECTIONS) == set(RUBRIC), "Every rubric category needs a step range"
+    for category, steps in parts.items():
+        expected = RUBRIC_SECTIONS[category]
+        print(f"  {category}: script #{min(steps)}-#{max(steps)}, "
+              f"graded #{expected.start}-#{expected.stop - 1}")
+        assert set(steps) <= set(expected), f"{category}: steps {steps} outside {expected}"
+        assert (expected.start, expected.stop - 1) == (min(steps), max(steps)), \
+            f"{category}: {expected} doesn't span #{min(steps)}-#{max(steps)}"
+    
+    # Communication & Clarity is graded on the whole script
+    all_steps = [step for steps in parts.values() for step in steps]
+    assert set(all_steps) <= set(RUBRIC_SECTIONS["Communication & Clarity"])
+    print("  ✓ PASSED")
+
+if __name__ == "__main__":
+    test_rubric_sections_match_script()
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 """Test script for MTFC Generator System"""
 
+import asyncio
+import io
 import os
 import sys
+import threading
 from pathlib import Path
 
 # Add parent directory to path
@@ -13,6 +16,30 @@ from src.generator import ScriptGenerator
 from src.evaluator import RubricEvaluator
 
 
+class _PerThreadStdout:
+    """sys.stdout stand-in that sends each registered thread's output to its own buffer"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+    
+    def write(self, text):
+        return self.buffers.get(threading.get_ident(), self.stream).write(text)
+    
+    def flush(self):
+        self.stream.flush()
+
+
+def _run_buffered(test, stdout):
+    """Run a test on this thread with its output captured; returns (passed, output)"""
+    buffer = io.StringIO()
+    stdout.buffers[threading.get_ident()] = buffer
+    try:
+        return test(), buffer.getvalue()
+    finally:
+        del stdout.buffers[threading.get_ident()]
+
+
 def test_generator():
     """Test the script generator."""
     print("="*60)
@@ -107,6 +134,40 @@ def test_improvement_engine():
         return False
 
 
+async def run_tests(tests):
+    """
+    Run blocking tests concurrently, each on its own thread.
+    
+    The tests spend their time waiting on the API, so running them together
+    takes as long as the slowest one. Each test's output is held back and
+    printed whole once all have finished, so the logs don't interleave.
+    
+    Returns:
+        (name, passed) pairs in the order given
+    """
+    stdout = _PerThreadStdout(sys.stdout)
+    sys.stdout = stdout
+    try:
+        outcomes = await asyncio.gather(
+            *(asyncio.to_thread(_run_buffered, test, stdout) for _, test in tests),
+            return_exceptions=True
+        )
+    finally:
+        sys.stdout = stdout.stream
+    
+    results = []
+    for i, ((name, _), outcome) in enumerate(zip(tests, outcomes), 1):
+        print(f"\n{i}. Testing {name}...")
+        if isinstance(outcome, BaseException):
+            print(f"Error: {outcome}")
+            results.append((name, False))
+        else:
+            passed, output = outcome
+            print(output, end="")
+            results.append((name, passed))
+    return results
+
+
 def main():
     """Run all tests."""
     print("MTFC Generator System Test Suite")
@@ -118,17 +179,12 @@ def main():
         print("ERROR: No API key found. Set OPENAI_API_KEY or ANTHROPIC_API_KEY")
         sys.exit(1)
     
-    results = []
-    
     # Test individual components
-    print("\n1. Testing Generator...")
-    results.append(("Generator", test_generator()))
-    
-    print("\n2. Testing Evaluator...")
-    results.append(("Evaluator", test_evaluator()))
-    
-    print("\n3. Testing Improvement Engine (1 iteration)...")
-    results.append(("Improvement Engine", test_improvement_engine()))
+    results = asyncio.run(run_tests([
+        ("Generator", test_generator),
+        ("Evaluator", test_evaluator),
+        ("Improvement Engine", test_improvement_engine),
+    ]))
     
     # Summary
     print("\n" + "="*60)
@@ -4,13 +4,31 @@ MTFC Ultra Builder - Full 30-Item Paper Generator
 Target: ≥98/100 with complete quantification and zero placeholders
 """
 
+import argparse
 import os
 import json
+import logging
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 from dotenv import load_dotenv
+from src import llm_cache
+from src.batch import batch_generate
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # orjson not installed, fall back to stdlib json
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None  # pyahocorasick not installed, fall back to one substring search per section
+
+log = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -24,6 +42,44 @@ client = OpenAI(api_key=API_KEY)
 SAVE_DIR = Path("mtfc_ultra")
 SAVE_DIR.mkdir(exist_ok=True)
 
+# Writes to SAVE_DIR run here so the next API call doesn't wait on the disk;
+# shut down (flushing pending writes) when the script exits
+_io_pool = ThreadPoolExecutor(max_workers=2)
+
+def _write(path, content):
+    # Papers carry smart quotes and symbols the platform default encoding may not
+    Path(path).write_text(content, encoding="utf-8", newline="")
+
+def dumps(obj, indent=False):
+    """Serialize obj to JSON text, with orjson when installed; compact unless indent"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+def save(path, content):
+    """Write text to path on the I/O pool"""
+    _io_pool.submit(_write, path, content)
+
+def save_json(path, obj):
+    """Serialize obj now (it may change after this returns) and write it on the I/O pool"""
+    save(path, dumps(obj, indent=True))
+
+# One line per iteration, {"iteration": n, "result": reply JSON (paper text
+# included)}, appended to across runs instead of two new files per iteration
+ITERATIONS_LOG = SAVE_DIR / "iterations.jsonl"
+
+# Where a run that died mid-loop (e.g. the API still failing after chat's
+# retries) leaves its place, for the next run to pick up
+CHECKPOINT_FILE = SAVE_DIR / "checkpoint.json"
+
+def save_checkpoint(state):
+    """Write the checkpoint atomically, right away rather than on the I/O pool"""
+    tmp_path = CHECKPOINT_FILE.with_suffix(".tmp")
+    _write(tmp_path, dumps(state))
+    os.replace(tmp_path, CHECKPOINT_FILE)
+
 SYSTEM_PROMPT = """You are an autonomous MTFC writer-evaluator. Your job is to generate a complete final project paper that matches the 30-item structure (Parts 1-5, #1-#30), is highly quantitative, and achieves ≥98/100.
 
 MANDATORY STRUCTURE (use EXACTLY these headers and numbering):
@@ -100,7 +156,18 @@ SCORING RUBRIC (Total 100 pts):
 
 TARGET: ≥98/100
 
-SCENARIO: Farmer Jones, Iowa corn farmer, 500 acres, analyzing yield/price/cost risks with irrigation, storage, and insurance options. Use realistic Iowa corn data (yields 180-200 bu/acre, prices $4-6/bu, costs $600-700/acre).
+SCENARIO: Farmer Jones, Iowa corn farmer, 500 acres, analyzing yield/price/cost risks with irrigation, storage, and insurance options.
+
+SCENARIO SPECIFICS:
+- Farmer Jones, Iowa
+- 500 acres corn (field crop)
+- Historical yield: 180-200 bu/acre (drought risk reduces to 120-140)
+- Corn prices: $4.20-$5.80/bu (seasonal variation)
+- Planting costs: seed $140/acre, fertilizer $180/acre, chemicals $85/acre, labor $60/acre, machinery $95/acre, land rent $180/acre = ~$740/acre total
+- Mitigation options:
+  1. Center-pivot irrigation: $250,000 capex, covers 125 acres, +15% yield uplift, -50% yield variance
+  2. Grain storage bin: $180,000 for 50,000 bu capacity, $0.05/bu/month storage cost, 0.5% shrink/month
+  3. Crop insurance: 80% RP coverage, $32/acre premium, 98% loss cost ratio
 
 OUTPUT FORMAT (JSON):
 {
@@ -130,75 +197,326 @@ Set status to "DONE" only when total ≥98.
 
 CRITICAL: Generate complete, publishable text with ALL numbers filled in. No "see table", "as shown", or "detailed analysis" without the actual content."""
 
-def chat(prompt, model="gpt-4-turbo", max_tokens=4096):
-    """Call OpenAI API"""
+# Points available per scorecard category, as in SYSTEM_PROMPT's rubric
+_MAX_SCORES = {
+    "Project Definition": 15,
+    "Data Identification & Assessment": 20,
+    "Mathematical Modeling": 25,
+    "Risk Analysis": 20,
+    "Recommendations": 15,
+    "Communication & Clarity": 5
+}
+
+# Every request starts with the same system message, which OpenAI serves from
+# its prompt cache once the prefix passes 1024 tokens; warn when a follow-up
+# request gets less than this share of it from the cache
+MIN_CACHE_HIT_RATE = 0.8
+# About 4 characters per token
+SYSTEM_PROMPT_TOKENS = len(SYSTEM_PROMPT) // 4
+
+# Streamed text is handed to the raw-file writer in pieces of about this size
+STREAM_WRITE_CHARS = 4096
+
+def _read_stream(stream, stream_path=None, progress=True):
+    """Collect a streamed completion, writing it to stream_path as it arrives
+    
+    The file is written on a background thread, a piece of about
+    STREAM_WRITE_CHARS at a time, so disk writes don't hold up reading the
+    stream. Returns (text, finish_reason, usage); usage comes in the final
+    chunk. Without progress, the running character count isn't printed.
+    """
+    pieces = []
+    received = 0
+    pending = []
+    pending_chars = 0
+    finish_reason = usage = None
+    out = open(stream_path, "w", encoding="utf-8", newline="") if stream_path else None
+    # One worker, unlike _io_pool, so the pieces land in order
+    writer = ThreadPoolExecutor(max_workers=1) if out else None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content or ""
+            if delta:
+                pieces.append(delta)
+                received += len(delta)
+                if progress:
+                    print(f"\r  ...{received:,} chars received", end="", flush=True)
+                if out:
+                    pending.append(delta)
+                    pending_chars += len(delta)
+                    if pending_chars >= STREAM_WRITE_CHARS:
+                        writer.submit(out.write, "".join(pending))
+                        pending, pending_chars = [], 0
+    finally:
+        if out:
+            if pending:
+                writer.submit(out.write, "".join(pending))
+            writer.shutdown(wait=True)
+            out.close()
+        if received and progress:
+            print()
+    return "".join(pieces), finish_reason, usage
+
+@retry(
+    stop=stop_after_attempt(6),
+    wait=wait_random_exponential(min=2, max=60),
+    retry=retry_if_exception_type((RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)),
+    reraise=True,
+)
+def chat(prompt, model="gpt-4-turbo", max_tokens=4096, expect_cached=False, use_cache=True, temperature=0.7,
+         use_batch=False, stream_path=None, progress=True, validate=None):
+    """Call OpenAI API, serving repeated requests from the shared disk cache
+    
+    Dynamic content belongs in prompt only, so the system message stays a
+    byte-identical, cacheable prefix. With expect_cached, warns when the
+    provider cache served less than MIN_CACHE_HIT_RATE of the system prompt.
+    
+    The reply is streamed, and written to stream_path (if given) as it
+    arrives. With use_batch the request goes through the Batch API instead:
+    half the price, but the call blocks until the batch completes (up to 24h).
+    With validate, only replies it accepts are cached or served from the cache,
+    so a rerun asks again instead of replaying a reply the caller rejected.
+    """
+    use_cache = use_cache and llm_cache.cache_enabled(temperature)
+    key = llm_cache.cache_key("openai", model, temperature, SYSTEM_PROMPT, prompt, max_tokens)
+    cached = llm_cache.lookup(key) if use_cache else None
+    if cached is not None and (validate is None or validate(cached)):
+        print("  (cached response)")
+        if stream_path:
+            Path(stream_path).write_text(cached, encoding="utf-8")
+        return cached
     try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=max_tokens,
-        )
-        return completion.choices[0].message.content
+        if use_batch:
+            response = batch_generate(
+                [prompt],
+                model=model,
+                system_prompt=SYSTEM_PROMPT,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                client=client,
+            )[0] or None
+            finished = response is not None
+            if stream_path and finished:
+                Path(stream_path).write_text(response, encoding="utf-8")
+        else:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            response, finish_reason, usage = _read_stream(stream, stream_path, progress)
+            response = response or None
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", 0) or 0
+            print(f"  ({cached_tokens} prompt tokens from the provider cache)")
+            if expect_cached and cached_tokens < MIN_CACHE_HIT_RATE * SYSTEM_PROMPT_TOKENS:
+                print(f"  ⚠️ Prompt cache hit rate low: {cached_tokens} of ~{SYSTEM_PROMPT_TOKENS} system prompt tokens cached")
+            # A reply cut off at max_tokens holds broken JSON; don't replay it on the next run
+            finished = finish_reason == "stop"
     except Exception as e:
         print(f"❌ API Error: {e}")
         raise
+    if use_cache and response is not None and finished and (validate is None or validate(response)):
+        llm_cache.store(key, response)
+    return response
+
+# Each iteration samples one candidate per temperature, in parallel, and
+# continues from the best-scoring one; --candidates k uses the first k
+CANDIDATE_TEMPERATURES = (0.7, 0.5, 0.9)
+
+def chat_candidates(prompt, temperatures, stream_paths, **kwargs):
+    """Call chat() once per temperature, concurrently
+    
+    Returns the replies of the calls that succeeded, in temperature order;
+    raises the first call's error only if every call failed.
+    """
+    with ThreadPoolExecutor(max_workers=len(temperatures)) as pool:
+        futures = [
+            pool.submit(chat, prompt, temperature=temperature, stream_path=path,
+                        progress=len(temperatures) == 1, **kwargs)
+            for temperature, path in zip(temperatures, stream_paths)
+        ]
+    responses, errors = [], []
+    for future in futures:
+        try:
+            responses.append(future.result())
+        except Exception as e:
+            errors.append(e)
+    if not responses:
+        raise errors[0]
+    return responses
+
+def _find_json_object(text, start=0):
+    """Return the first complete {...} object in text at or after start, or None
+    
+    A single pass tracking brace depth, skipping braces inside strings.
+    """
+    begin = text.find("{", start)
+    if begin == -1:
+        return None
+    depth = 0
+    in_string = escaped = False
+    for i in range(begin, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[begin:i + 1]
+    return None
+
+def _loads(json_str):
+    """Parse JSON with orjson when installed, retrying leniently on failure
+    
+    Long paper_full_text values sometimes carry raw newlines, which only
+    json.loads(strict=False) accepts.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(json_str, strict=False)
+
+def _parse_json(response):
+    """The reply's JSON object, or None if it has none; raises json.JSONDecodeError if malformed"""
+    # Prefer the object in a ```json block, if there is one
+    fence = response.find("```json")
+    json_str = _find_json_object(response, fence if fence != -1 else 0)
+    if json_str is None:
+        return None
+    return _loads(json_str)
+
+def parses(response):
+    """Whether extract_json would get an object out of response, without its logging"""
+    try:
+        return _parse_json(response) is not None
+    except json.JSONDecodeError:
+        return False
 
 def extract_json(response):
     """Extract JSON from response"""
-    # Try to find JSON in code blocks
-    json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(1)
-    else:
-        # Try to find JSON object directly
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-        else:
-            return None
-    
     try:
-        return json.loads(json_str)
+        return _parse_json(response)
     except json.JSONDecodeError as e:
         print(f"⚠️ JSON parse error: {e}")
         # Try to save the raw response
-        with open(SAVE_DIR / "last_response_error.txt", "w") as f:
-            f.write(response)
+        save(SAVE_DIR / "last_response_error.txt", response)
         return None
 
+_WORD_RE = re.compile(r"\S+")
+
 def count_words(text):
-    """Count words in text"""
-    return len(text.split())
+    """Count words in text without building a list of them"""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+# Headers validate_paper requires, in paper order
+REQUIRED_SECTIONS = (
+    "Part 1: Project Definition",
+    "#1:", "#2:", "#3:",
+    "Part 2: Data Identification & Assessment",
+    "#4:", "#5", "#9:", "#10", "#12:", "#13:", "#14:", "#15:",
+    "Part 3: Mathematical Modeling",
+    "#16:", "#17:", "#18:", "#19:", "#20:", "#21:", "#22:",
+    "Part 4: Risk Analysis",
+    "#23:", "#24:", "#25:", "#26:",
+    "Part 5: Recommendations",
+    "#27:", "#28:", "#29:", "#30:",
+    "Notation Block",
+    "Figures and Tables"
+)
+
+def _build_automaton(tokens):
+    """Build an Aho-Corasick automaton matching every token"""
+    automaton = ahocorasick.Automaton()
+    for token in tokens:
+        automaton.add_word(token, token)
+    automaton.make_automaton()
+    return automaton
+
+_AUTOMATON = _build_automaton(REQUIRED_SECTIONS) if ahocorasick else None
 
 def validate_paper(paper_text):
-    """Validate paper has all required sections"""
-    required = [
-        "Part 1: Project Definition",
-        "#1:", "#2:", "#3:",
-        "Part 2: Data Identification & Assessment",
-        "#4:", "#5", "#9:", "#10", "#12:", "#13:", "#14:", "#15:",
-        "Part 3: Mathematical Modeling",
-        "#16:", "#17:", "#18:", "#19:", "#20:", "#21:", "#22:",
-        "Part 4: Risk Analysis",
-        "#23:", "#24:", "#25:", "#26:",
-        "Part 5: Recommendations",
-        "#27:", "#28:", "#29:", "#30:",
-        "Notation Block",
-        "Figures and Tables"
-    ]
-    
-    missing = []
-    for req in required:
-        if req not in paper_text:
-            missing.append(req)
-    
-    return missing
+    """Validate paper has all required sections, in a single pass over the text"""
+    if _AUTOMATON is None:
+        return [req for req in REQUIRED_SECTIONS if req not in paper_text]
+    found = {section for _, section in _AUTOMATON.iter(paper_text)}
+    return [req for req in REQUIRED_SECTIONS if req not in found]
+
+# Follow-up prompt: the fixed instructions come first so consecutive
+# iterations share as long a prefix as possible, the iteration's state last
+CONTINUE_PROMPT = """Continue improving the Farmer Jones MTFC paper.
 
-def main():
+REQUIREMENTS:
+1. Apply ALL fixes
+2. Ensure ALL 30 items are present and quantified
+3. Add more specific calculations and numbers
+4. Verify internal consistency (revenue = quantity × price, etc.)
+5. Include notation block with ALL symbols
+6. List figures/tables with REAL values (not TBD)
+7. Achieve ≥{target_score}/100
+
+Generate improved JSON with complete paper text.
+
+CURRENT STATUS:
+- Iteration: {iteration}
+- Score: {total_score}/100 (need ≥{target_score})
+- Word count: {word_count:,}
+- Missing sections: {missing}
+
+PREVIOUS DEDUCTIONS:
+{deductions}
+
+FIX PLAN:
+Edits: {edits}
+Numbers to add: {numbers}
+Novelty changes: {novelty}"""
+
+# Character budget for each fix-plan list echoed back in CONTINUE_PROMPT
+FIX_PLAN_MAX_CHARS = 800
+
+def _trim(items, max_chars=FIX_PLAN_MAX_CHARS):
+    """Compact JSON for a fix-plan list: repeats removed, trailing entries dropped to fit max_chars
+    
+    The model lists fixes most important first, so the tail goes first. The
+    first entry is always kept, its text cut short if it alone is too long.
+    """
+    unique = list({json.dumps(item, sort_keys=True): item for item in items}.values())
+    text = dumps(unique)
+    while len(text) > max_chars and len(unique) > 1:
+        unique.pop()
+        text = dumps(unique)
+    if len(text) > max_chars:
+        first = unique[0] if isinstance(unique[0], str) else dumps(unique[0])
+        cut = len(first)
+        while len(text) > max_chars and cut > 0:
+            # Escaping can lengthen the text, so shrink in proportion until it fits
+            cut = min(cut - 1, cut * max_chars // len(text))
+            text = dumps([first[:cut] + "…"])
+    return text
+
+def main(use_cache=True, use_batch=False, resume=True, candidates=len(CANDIDATE_TEMPERATURES)):
     print("="*80)
     print("MTFC ULTRA BUILDER - Complete 30-Item Paper Generator")
     print("="*80)
@@ -208,22 +526,17 @@ def main():
     
     iteration = 1
     max_iterations = 8
+    temperatures = CANDIDATE_TEMPERATURES[:candidates]
+    if len(temperatures) == 1:
+        raw_paths = [SAVE_DIR / "last_response_raw.txt"]
+    else:
+        raw_paths = [SAVE_DIR / f"last_response_raw_t{t}.txt" for t in temperatures]
     target_score = 98
     
     # Initial prompt
+    # The scenario specifics live in SYSTEM_PROMPT, part of the cached prefix
     prompt = """Generate Iteration 1: A complete, publication-ready MTFC paper for Farmer Jones.
 
-SCENARIO SPECIFICS:
-- Farmer Jones, Iowa
-- 500 acres corn (field crop)
-- Historical yield: 180-200 bu/acre (drought risk reduces to 120-140)
-- Corn prices: $4.20-$5.80/bu (seasonal variation)
-- Planting costs: seed $140/acre, fertilizer $180/acre, chemicals $85/acre, labor $60/acre, machinery $95/acre, land rent $180/acre = ~$740/acre total
-- Mitigation options:
-  1. Center-pivot irrigation: $250,000 capex, covers 125 acres, +15% yield uplift, -50% yield variance
-  2. Grain storage bin: $180,000 for 50,000 bu capacity, $0.05/bu/month storage cost, 0.5% shrink/month
-  3. Crop insurance: 80% RP coverage, $32/acre premium, 98% loss cost ratio
-
 REQUIREMENTS:
 1. Follow the 30-item outline EXACTLY
 2. Fill in ALL calculations with specific numbers
@@ -238,7 +551,16 @@ REQUIREMENTS:
 
 Generate the complete JSON response with full paper text."""
     
-    all_iterations = []
+    # Each iteration's result is already in ITERATIONS_LOG, so the checkpoint
+    # only needs where to pick up
+    if resume and CHECKPOINT_FILE.exists():
+        checkpoint = json.loads(CHECKPOINT_FILE.read_text(encoding="utf-8"))
+        iteration = checkpoint["iteration"]
+        prompt = checkpoint["prompt"]
+        print(f"↻ Resuming from {CHECKPOINT_FILE} at iteration {iteration}")
+    failed = False
+    # Line-buffered, so each iteration's record is on disk once written
+    iterations_log = open(ITERATIONS_LOG, "a", encoding="utf-8", buffering=1)
     
     while iteration <= max_iterations:
         print(f"\n{'='*80}")
@@ -246,35 +568,46 @@ Generate the complete JSON response with full paper text."""
         print(f"{'='*80}")
         
         try:
-            print("📡 Calling API (this may take 30-60 seconds for comprehensive output)...")
-            response = chat(prompt, max_tokens=4096)
+            if use_batch:
+                print("📡 Submitting to the Batch API (may take up to 24h)...")
+            else:
+                print("📡 Calling API (this may take 30-60 seconds for comprehensive output)...")
+            if len(temperatures) > 1:
+                print(f"   {len(temperatures)} candidates at temperatures {', '.join(map(str, temperatures))}")
+            responses = chat_candidates(prompt, temperatures, raw_paths, max_tokens=4096,
+                                        expect_cached=iteration > 1, use_cache=use_cache, use_batch=use_batch,
+                                        validate=parses)
+            responses = [response for response in responses if response is not None]
+            if not responses:
+                print("❌ Empty response")
+                failed = True
+                break
             
-            print(f"✓ Received response ({len(response)} chars)")
+            for response in responses:
+                print(f"✓ Received response ({len(response)} chars)")
             
-            result = extract_json(response)
+            results = [result for result in map(extract_json, responses) if result]
             
-            if not result:
+            if not results:
                 print("❌ Failed to parse JSON")
-                print("Saving raw response to debug...")
-                with open(SAVE_DIR / f"iteration_{iteration}_raw.txt", "w") as f:
-                    f.write(response)
+                print(f"Raw response saved for debugging: {', '.join(map(str, raw_paths))}")
+                failed = True
                 break
             
+            # Continue from the candidate that scored itself highest
+            result = max(results, key=lambda r: r.get("scorecard", {}).get("total", 0))
+            if len(results) > 1:
+                totals = [r.get("scorecard", {}).get("total", 0) for r in results]
+                print(f"✓ Best of {len(results)} candidates (totals: {', '.join(map(str, totals))})")
+            
             # Extract key data
             scorecard = result.get("scorecard", {})
             total_score = scorecard.get("total", 0)
             status = result.get("status", "CONTINUE")
             paper_text = result.get("paper_full_text", "")
             
-            # Save iteration
-            iteration_file = SAVE_DIR / f"iteration_{iteration}.json"
-            with open(iteration_file, "w") as f:
-                json.dump(result, f, indent=2)
-            
-            # Save paper text separately
-            paper_file = SAVE_DIR / f"paper_iteration_{iteration}.txt"
-            with open(paper_file, "w") as f:
-                f.write(paper_text)
+            # Log iteration
+            iterations_log.write(dumps({"iteration": iteration, "result": result}) + "\n")
             
             # Validate structure
             missing = validate_paper(paper_text)
@@ -290,19 +623,13 @@ Generate the complete JSON response with full paper text."""
             
             print(f"\n📋 CATEGORY SCORES:")
             for cat, score in scorecard.items():
-                if cat not in ["Excellence_Boosters_Used", "total"]:
-                    max_scores = {
-                        "Project Definition": 15,
-                        "Data Identification & Assessment": 20,
-                        "Mathematical Modeling": 25,
-                        "Risk Analysis": 20,
-                        "Recommendations": 15,
-                        "Communication & Clarity": 5
-                    }
-                    max_val = max_scores.get(cat, score)
-                    pct = (score/max_val*100) if max_val > 0 else 0
-                    icon = "✓" if pct >= 95 else "⚠" if pct >= 85 else "✗"
-                    print(f"  {icon} {cat}: {score}/{max_val} ({pct:.0f}%)")
+                # Also skips "Excellence_Boosters_Used" and "total"
+                if cat not in _MAX_SCORES:
+                    continue
+                max_val = _MAX_SCORES[cat]
+                pct = score/max_val*100
+                icon = "✓" if pct >= 95 else "⚠" if pct >= 85 else "✗"
+                print(f"  {icon} {cat}: {score}/{max_val} ({pct:.0f}%)")
             
             boosters = scorecard.get("Excellence_Boosters_Used", [])
             print(f"\n🌟 Excellence Boosters ({len(boosters)}): {', '.join(boosters)}")
@@ -318,8 +645,7 @@ Generate the complete JSON response with full paper text."""
                 
                 # Save final outputs
                 final_paper = SAVE_DIR / "FINAL_PAPER.txt"
-                with open(final_paper, "w") as f:
-                    f.write(paper_text)
+                save(final_paper, paper_text)
                 
                 print(f"✓ Final paper saved: {final_paper}")
                 print(f"✓ Word count: {word_count:,}")
@@ -339,43 +665,32 @@ Generate the complete JSON response with full paper text."""
             for i, edit in enumerate(edits[:3], 1):
                 print(f"  {i}. {edit}")
             
-            prompt = f"""Continue improving the Farmer Jones MTFC paper.
-
-CURRENT STATUS:
-- Iteration: {iteration}
-- Score: {total_score}/100 (need ≥{target_score})
-- Word count: {word_count:,}
-- Missing sections: {len(missing)}
-
-PREVIOUS DEDUCTIONS:
-{json.dumps(deductions[:5], indent=2)}
-
-FIX PLAN:
-Edits: {json.dumps(fix_plan.get('edits_now', [])[:5], indent=2)}
-Numbers to add: {json.dumps(fix_plan.get('numbers_to_add', [])[:5], indent=2)}
-Novelty changes: {json.dumps(fix_plan.get('novelty_changes', [])[:3], indent=2)}
-
-REQUIREMENTS:
-1. Apply ALL fixes
-2. Ensure ALL 30 items are present and quantified
-3. Add more specific calculations and numbers
-4. Verify internal consistency (revenue = quantity × price, etc.)
-5. Include notation block with ALL symbols
-6. List figures/tables with REAL values (not TBD)
-7. Achieve ≥{target_score}/100
-
-Generate improved JSON with complete paper text."""
+            prompt = CONTINUE_PROMPT.format(
+                target_score=target_score,
+                iteration=iteration,
+                total_score=total_score,
+                word_count=word_count,
+                missing=len(missing),
+                deductions=_trim(deductions[:5]),
+                edits=_trim(fix_plan.get('edits_now', [])[:5]),
+                numbers=_trim(fix_plan.get('numbers_to_add', [])[:5]),
+                novelty=_trim(fix_plan.get('novelty_changes', [])[:3])
+            )
             
             iteration += 1
-            all_iterations.append(result)
-            time.sleep(2)
             
-        except Exception as e:
-            print(f"❌ Error in iteration {iteration}: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("❌ Error in iteration %d", iteration)
+            failed = True
             break
     
+    iterations_log.close()
+    if failed:
+        save_checkpoint({"iteration": iteration, "prompt": prompt})
+        print(f"💾 Checkpoint saved: {CHECKPOINT_FILE} (rerun to resume)")
+    else:
+        CHECKPOINT_FILE.unlink(missing_ok=True)
+    
     # Final summary
     print(f"\n{'='*80}")
     print("ULTRA BUILDER COMPLETE")
@@ -390,8 +705,7 @@ Generate improved JSON with complete paper text."""
     }
     
     summary_file = SAVE_DIR / "ultra_summary.json"
-    with open(summary_file, "w") as f:
-        json.dump(summary, f, indent=2)
+    save_json(summary_file, summary)
     
     # Create FINISHED marker
     with open("FINISHED_ULTRA.txt", "w") as f:
@@ -406,8 +720,7 @@ Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')}
 
 Output Files:
 - Final paper: {SAVE_DIR}/FINAL_PAPER.txt
-- All iterations: {SAVE_DIR}/iteration_*.json
-- Paper text files: {SAVE_DIR}/paper_iteration_*.txt
+- All iterations (with paper text): {ITERATIONS_LOG}
 - Summary: {summary_file}
 
 This is a complete 30-item MTFC paper with:
@@ -423,12 +736,40 @@ This is a complete 30-item MTFC paper with:
     print(f"✓ All outputs: {SAVE_DIR}/")
 
 if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s")
+    parser = argparse.ArgumentParser(description="MTFC Ultra Builder")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Call the API for every iteration instead of replaying cached responses"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Send each iteration through the OpenAI Batch API (50%% cheaper, up to 24h turnaround)"
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        choices=range(1, len(CANDIDATE_TEMPERATURES) + 1),
+        default=len(CANDIDATE_TEMPERATURES),
+        help="Candidates sampled in parallel per iteration, keeping the best-scoring one "
+             f"(default: {len(CANDIDATE_TEMPERATURES)}; 1 makes a single call at temperature 0.7)"
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Start from iteration 1 instead of resuming from checkpoint.json"
+    )
+    args = parser.parse_args()
+    
     try:
-        main()
+        main(use_cache=not args.no_cache, use_batch=args.batch, resume=not args.fresh,
+             candidates=args.candidates)
     except KeyboardInterrupt:
         print("\n\n⚠️ Interrupted by user")
-    except Exception as e:
-        print(f"\n\n❌ Fatal error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("\n\n❌ Fatal error")
+    finally:
+        _io_pool.shutdown(wait=True)
 